@@ -0,0 +1,361 @@
+"""
+Benchmarks for the diffing, planning and viewer update hot paths.
+
+Each corpus is a series of file versions, from the demos or generated. For every
+transition we separately time the difflib comparison, process_deltas, the planner's
+look-ahead passes and the whole plan (ops/sec, with no pauses), then the latency of
+CodeViewer.differ_edit per update when Qt is available. Startup is timed separately, as
+the wall time from launching a fresh interpreter to the first CLI output and to the
+first window being shown.
+
+    python benchmarks/bench.py --save baseline.json
+    python benchmarks/bench.py --compare baseline.json
+
+Each metric is the median over the repeated runs. Comparing exits with status 1 if any
+metric is worse than the baseline by more than its tolerance, and for timings by more
+than MIN_DIFFERENCE too, as a millisecond or so either way is noise.
+"""
+import argparse
+import difflib
+import glob
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'diffcast'))
+
+from planner import DiffPlanner, apply  # noqa: E402
+
+TOLERANCE = 0.25
+# Tail latencies vary more from run to run.
+TOLERANCES = {'differ_edit_p95': 0.5}
+# Seconds a timing must be worse by, whatever the ratio.
+MIN_DIFFERENCE = 0.002
+
+SHOW_WINDOW = """
+import sys
+sys.path.insert(0, 'diffcast')
+import app
+qapp = app.create_app([])
+window = app.MainWindow()
+window.show()
+qapp.processEvents()
+print('shown', flush=True)
+"""
+
+
+def read(path):
+    with open(path, 'r') as f:
+        return f.readlines()
+
+
+def demos(pattern):
+    return [read(path) for path in sorted(glob.glob(os.path.join(ROOT, 'demos', pattern)))]
+
+
+def function(rng, name):
+    lines = ['def %s(value, count=%d):\n' % (name, rng.randint(0, 99))]
+    for n in range(rng.randint(3, 12)):
+        lines.append('    value = value * %d + count  # step %d\n' % (rng.randint(1, 9), n))
+    lines.append('    return value\n')
+    lines.append('\n')
+    return lines
+
+
+def large_module(rng, n_lines=10000):
+    """ A 10k line module, then a version with scattered edits, inserts and deletes. """
+    source = []
+    while len(source) < n_lines:
+        source += function(rng, 'function_%d' % len(source))
+
+    target = []
+    for line in source:
+        r = rng.random()
+        if r < 0.005:
+            continue
+        if r < 0.01:
+            line = line.replace('value', 'result', 1)
+        target.append(line)
+        if r > 0.998:
+            target += function(rng, 'added_%d' % len(target))
+    return [source, target]
+
+
+def long_lines(rng, n_lines=200, width=2000):
+    """ Very long lines, with edits in the middle of some of them. """
+    words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', '1234', '"text"', '+', ',']
+    source = []
+    for _ in range(n_lines):
+        line = ''
+        while len(line) < width:
+            line += rng.choice(words) + ' '
+        source.append('x = [%s]\n' % line)
+
+    target = list(source)
+    for n in rng.sample(range(n_lines), n_lines // 10):
+        line = target[n]
+        middle = len(line) // 2
+        target[n] = line[:middle] + 'inserted, ' + line[middle + 20 :]
+    return [source, target]
+
+
+def reindent(rng, n_lines=300):
+    """ A block of code wrapped into a class, so every line is indented. """
+    source = []
+    while len(source) < n_lines:
+        source += function(rng, 'method_%d' % len(source))
+    target = ['class Wrapped:\n'] + [('    ' + line) if line.strip() else line for line in source]
+    return [source, target, source]
+
+
+def mass_rename(rng, n_lines=250):
+    """ An identifier renamed throughout a module. """
+    source = []
+    while len(source) < n_lines:
+        source += function(rng, 'function_%d' % len(source))
+    target = [line.replace('value', 'amount') for line in source]
+    return [source, target]
+
+
+def corpora():
+    rng = random.Random(1)
+    return {
+        'demos': demos('demo*.py'),
+        'windows': demos('windows_*.py'),
+        'large_module': large_module(rng),
+        'long_lines': long_lines(rng),
+        'reindent': reindent(rng),
+        'mass_rename': mass_rename(rng),
+    }
+
+
+class LookaheadTimer:
+    """ Accumulate the time spent in the planner's look-ahead passes. """
+
+    def __init__(self, planner):
+        self.elapsed = 0
+        for name in ('insert_trailing_blank', 'indent_block'):
+            setattr(planner, name, self.wrap(getattr(planner, name)))
+
+    def wrap(self, method):
+        def timed(*args):
+            start = time.perf_counter()
+            result = yield from method(*args)
+            self.elapsed += time.perf_counter() - start
+            return result
+
+        return timed
+
+
+def bench_planning(versions):
+    metrics = {'difflib': 0, 'process_deltas': 0, 'lookahead': 0, 'plan': 0, 'ops': 0}
+
+    for current, target in zip(versions, versions[1:]):
+        planner = DiffPlanner([])
+
+        start = time.perf_counter()
+        delta = list(difflib.Differ().compare(current, target))
+        metrics['difflib'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        planner.process_deltas(delta)
+        metrics['process_deltas'] += time.perf_counter() - start
+
+        timer = LookaheadTimer(planner)
+        planner.current = list(current)
+        start = time.perf_counter()
+        ops = list(planner.transition(target))
+        metrics['plan'] += time.perf_counter() - start
+        metrics['lookahead'] += timer.elapsed
+        metrics['ops'] += len(ops)
+
+    metrics['ops_per_sec'] = metrics['ops'] / metrics['plan'] if metrics['plan'] else 0
+    return metrics
+
+
+def bench_viewer(viewer, app, versions, max_updates):
+    """ Per update latency of CodeViewer.differ_edit, over evenly spaced updates. """
+    planner = DiffPlanner([])
+    planner.current = list(versions[0])
+    ops = []
+    for target in versions[1:]:
+        ops += planner.transition(target)
+
+    every = max(len(ops) // max_updates, 1)
+    lines = list(versions[0])
+    timings = []
+    for n, op in enumerate(ops):
+        apply(lines, op)
+        if n % every:
+            continue
+
+        line, col = op.caret
+        start = time.perf_counter()
+        viewer.differ_edit(line, col, lines)
+        app.processEvents()
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    return {
+        'differ_edit_mean': sum(timings) / len(timings),
+        'differ_edit_p95': timings[int(len(timings) * 0.95)],
+    }
+
+
+def make_viewer():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt6.QtWidgets import QApplication
+    except ImportError:
+        return None, None
+
+    from viewer import CodeViewer
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    viewer = CodeViewer()
+    viewer.set_display_mode('fhd')
+    app.processEvents()
+    viewer.update_lines_on_screen()
+    return viewer, app
+
+
+def time_to_output(args, env=None):
+    """ Seconds from starting a process to the first line of its output. """
+    start = time.perf_counter()
+    process = subprocess.Popen(args, cwd=ROOT, env=env, stdout=subprocess.PIPE)
+    process.stdout.readline()
+    elapsed = time.perf_counter() - start
+    process.stdout.close()
+    process.wait()
+    return elapsed
+
+
+def bench_startup(with_viewer):
+    cli = [sys.executable, 'diffcast/cli.py', '--ndjson', '-', 'demos/demo1.py', 'demos/demo2.py']
+    metrics = {'cli_first_output': time_to_output(cli)}
+
+    if with_viewer:
+        env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+        metrics['app_first_window'] = time_to_output([sys.executable, '-c', SHOW_WINDOW], env)
+    return metrics
+
+
+def run(names, repeat, with_viewer, max_updates):
+    results = {}
+    all_corpora = corpora()
+    viewer, app = make_viewer() if with_viewer else (None, None)
+
+    for name in names:
+        runs = {}
+        for _ in range(repeat):
+            if name == 'startup':
+                metrics = bench_startup(viewer is not None)
+            else:
+                versions = all_corpora[name]
+                metrics = bench_planning(versions)
+                if viewer is not None:
+                    metrics.update(bench_viewer(viewer, app, versions, max_updates))
+
+            for key, value in metrics.items():
+                runs.setdefault(key, []).append(value)
+
+        results[name] = {key: statistics.median(values) for key, values in runs.items()}
+        print(format_row(name, results[name]), flush=True)
+
+    return results
+
+
+def higher_is_better(metric):
+    return metric.endswith('_per_sec')
+
+
+def format_row(name, metrics):
+    parts = []
+    for key, value in metrics.items():
+        if key == 'ops':
+            parts.append('%s=%d' % (key, value))
+        elif higher_is_better(key):
+            parts.append('%s=%.0f' % (key, value))
+        else:
+            parts.append('%s=%.2fms' % (key, value * 1000))
+    return '%-14s %s' % (name, ' '.join(parts))
+
+
+def compare(results, baseline, tolerance):
+    """ Print the change in each metric, returning the list of regressions. """
+    regressions = []
+    for name, metrics in results.items():
+        for key, value in metrics.items():
+            base = baseline.get(name, {}).get(key)
+            if key == 'ops' or not base or not value:
+                continue
+
+            ratio = base / value if higher_is_better(key) else value / base
+            if higher_is_better(key):
+                # A rate of ops, so compared as the time taken for them.
+                difference = metrics.get('ops', 0) * (1 / value - 1 / base)
+            else:
+                difference = value - base
+            worse = ratio > 1 + TOLERANCES.get(key, tolerance) and difference > MIN_DIFFERENCE
+            flag = ''
+            if worse:
+                flag = '  REGRESSION'
+                regressions.append((name, key))
+            print('%-14s %-18s %+7.1f%%%s' % (name, key, (ratio - 1) * 100, flag))
+    return regressions
+
+
+def main():
+    names = list(corpora()) + ['startup']
+
+    parser = argparse.ArgumentParser(description='Benchmark diffing, planning and viewer updates.')
+    parser.add_argument(
+        '--corpus', action='append', choices=names, help='Corpus to run, or startup.'
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=5, help='Runs per corpus, the median is kept.'
+    )
+    parser.add_argument('--save', help='Save the results as a JSON baseline.')
+    parser.add_argument('--compare', help='Compare the results against a JSON baseline.')
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=TOLERANCE,
+        help='Fraction a metric may be worse than the baseline by, unless set per metric.',
+    )
+    parser.add_argument('--no-viewer', action='store_true', help='Skip the Qt viewer benchmark.')
+    parser.add_argument(
+        '--viewer-updates', type=int, default=200, help='Viewer updates timed per corpus.'
+    )
+
+    args = parser.parse_args()
+
+    results = run(args.corpus or names, args.repeat, not args.no_viewer, args.viewer_updates)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(
+                {
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'results': results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
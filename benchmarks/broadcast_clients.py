@@ -0,0 +1,141 @@
+"""
+Load check for the live-broadcast server, with hundreds of local clients.
+
+Plays the demos through a Broadcast on a free port, sped up, to clients connecting at
+the start and part way through, with some resetting their connections mid-cast. Every
+client that stays must end on the planner's final buffer, and no reset client may be
+left subscribed or written to.
+
+    python benchmarks/broadcast_clients.py --clients 300 --late 50 --resets 20
+
+Exits with status 1 if any check fails.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import socket
+import struct
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'diffcast'))
+
+from broadcast import Broadcast  # noqa: E402
+from planner import OP_STEP, Op, apply, split_lines  # noqa: E402
+from timeline import load_ops  # noqa: E402
+
+
+class Counter(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+async def follow(port, reset=False):
+    """ Follow the event stream, returning the final buffer, or None after a reset. """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    await reader.readuntil(b'\r\n\r\n')
+
+    lines = []
+    while True:
+        message = (await reader.readuntil(b'\n\n')).decode('utf-8')
+        name = 'message'
+        for field in message.splitlines():
+            key, _, value = field.partition(': ')
+            if key == 'event':
+                name = value
+            elif key == 'data':
+                data = json.loads(value)
+
+        if name == 'end':
+            break
+        if name == 'snapshot':
+            lines = split_lines(data['text'])
+            if reset:
+                # Close with an RST rather than a FIN.
+                sock = writer.get_extra_info('socket')
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                writer.transport.abort()
+                return None
+        elif data['op'] != OP_STEP:
+            apply(lines, Op(data['op'], data['line'], data['col'], data['text'], 0))
+
+    writer.close()
+    return ''.join(lines)
+
+
+async def run(ops, clients, late, resets, speed):
+    broadcast = Broadcast(ops, speed)
+    server = await asyncio.start_server(broadcast.handle, '127.0.0.1', 0, backlog=1024)
+    port = server.sockets[0].getsockname()[1]
+
+    async with server:
+        followers = [asyncio.create_task(follow(port)) for _ in range(clients)]
+        followers += [asyncio.create_task(follow(port, reset=True)) for _ in range(resets)]
+        await asyncio.sleep(0.5)
+
+        player = asyncio.create_task(broadcast.play())
+        duration = sum(op.delay for op in ops) / speed
+        await asyncio.sleep(duration / 2)
+        followers += [asyncio.create_task(follow(port)) for _ in range(late)]
+        await player
+        results = await asyncio.gather(*followers)
+
+        # Let the server notice the last clients leave.
+        for _ in range(50):
+            if not broadcast.clients:
+                break
+            await asyncio.sleep(0.1)
+    return results, len(broadcast.clients)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the broadcast server under load.')
+    parser.add_argument('--clients', type=int, default=300, help='Clients joining at the start.')
+    parser.add_argument('--late', type=int, default=50, help='Clients joining mid-cast.')
+    parser.add_argument('--resets', type=int, default=20, help='Clients resetting mid-cast.')
+    parser.add_argument('--speed', type=float, default=20, help='Playback speed multiplier.')
+    args = parser.parse_args()
+
+    ops = list(load_ops(sorted(glob.glob(os.path.join(ROOT, 'demos', 'demo*.py')))))
+    expected = []
+    for op in ops:
+        if op.kind != OP_STEP:
+            apply(expected, op)
+    expected = ''.join(expected)
+
+    warnings = Counter()
+    logging.getLogger('asyncio').addHandler(warnings)
+
+    start = time.perf_counter()
+    results, subscribed = asyncio.run(
+        run(ops, args.clients, args.late, args.resets, args.speed)
+    )
+    followed = [r for r in results if r is not None]
+    wrong = sum(r != expected for r in followed)
+
+    print(
+        '%d clients followed, %d reset, %d wrong, %d still subscribed, %d warnings in %.2fs'
+        % (
+            len(followed),
+            len(results) - len(followed),
+            wrong,
+            subscribed,
+            warnings.count,
+            time.perf_counter() - start,
+        )
+    )
+    failed = wrong or subscribed or warnings.count or len(followed) != args.clients + args.late
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
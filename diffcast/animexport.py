@@ -0,0 +1,409 @@
+"""
+Export a cast as an animated GIF or APNG, for social posts and chat.
+
+Consecutive frames are compared to find the rectangle that changed, usually a line or
+two around the caret, and only that is encoded, with the unchanged pixels inside it
+left transparent. Every frame shares one palette built from the editor colours and the
+antialiasing ramps between them, so export time and file size grow with the amount of
+text edited rather than with duration x resolution.
+
+    python animexport.py cast.gif demos/demo1.py demos/demo2.py
+"""
+import argparse
+import os
+import struct
+import zlib
+
+import numpy as np
+
+import framering
+import metrics
+from fanout import fan_out, outputs
+from frames import (DRAFT_MIN_DELAY, add_renderer_arguments, create_renderer,
+                    frames, held)
+from planner import INITIAL_SPEED
+from styles import (CARET_FOREGROUND_COLOR, CARET_LINE_BACKGROUND_COLOR,
+                    DEFAULT_COLOR, DISPLAY_SIZES, MARGIN_BACKGROUND_COLOR,
+                    MARGIN_FOREGROUND_COLOR, PAPER_COLOR, STYLE_COLORS,
+                    STYLE_PAPERS)
+from timeline import load_ops
+
+# Palette index of pixels left unchanged from the previous frame.
+TRANSPARENT = 255
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Browsers slow down frames shorter than this, so faster edits are dropped instead.
+MIN_DELAY = 0.02
+
+
+def _rgb(color):
+    color = color.lstrip('#')
+    return tuple(int(color[i : i + 2], 16) for i in (0, 2, 4))
+
+
+def palette():
+    """
+    The editor colours, and ramps blending each text colour into each background for
+    the antialiased edges of glyphs, as an (n, 3) array of at most 255 colours.
+    """
+    backgrounds = [PAPER_COLOR, CARET_LINE_BACKGROUND_COLOR, MARGIN_BACKGROUND_COLOR]
+    backgrounds += STYLE_PAPERS.values()
+    foregrounds = [DEFAULT_COLOR, MARGIN_FOREGROUND_COLOR, CARET_FOREGROUND_COLOR]
+    foregrounds += STYLE_COLORS.values()
+
+    backgrounds = list(dict.fromkeys(_rgb(c) for c in backgrounds))
+    foregrounds = list(dict.fromkeys(_rgb(c) for c in foregrounds))
+    colors = backgrounds + foregrounds
+
+    # Spread the rest of the palette evenly over the ramps.
+    steps = (TRANSPARENT - len(colors)) // (len(backgrounds) * len(foregrounds)) + 1
+    for bg in np.array(backgrounds):
+        for fg in np.array(foregrounds):
+            for n in range(1, steps):
+                colors.append(tuple(np.rint(bg + (fg - bg) * n / steps).astype(int)))
+
+    return np.array(list(dict.fromkeys(colors)), np.uint8)
+
+
+class Quantizer:
+    """ Map pixels to their nearest palette colour. """
+
+    def __init__(self, colors):
+        self.colors = colors.astype(np.int32)
+
+    def __call__(self, pixels):
+        """ Palette indices for an array of 0xffRRGGBB pixels. """
+        # Text uses few distinct colours, so only match those.
+        unique, inverse = np.unique(pixels, return_inverse=True)
+        rgb = np.stack([unique >> 16, unique >> 8, unique], axis=1).astype(np.int32) & 0xFF
+        distance = ((rgb[:, None, :] - self.colors[None, :, :]) ** 2).sum(axis=2)
+        nearest = distance.argmin(axis=1).astype(np.uint8)
+        return nearest[inverse.reshape(-1)].reshape(pixels.shape)
+
+
+def dirty_rect(previous, frame):
+    """ The (top, left, bottom, right) bounding the pixels that differ, or None. """
+    changed = previous != frame
+    rows = np.flatnonzero(changed.any(axis=1))
+    if not len(rows):
+        return None
+    top, bottom = rows[0], rows[-1] + 1
+    cols = np.flatnonzero(changed[top:bottom].any(axis=0))
+    return top, cols[0], bottom, cols[-1] + 1
+
+
+def lzw(data, code_size=8):
+    """ GIF LZW compress a bytes-like of palette indices. """
+    clear = 1 << code_size
+    end = clear + 1
+    out = bytearray()
+
+    table = {}
+    next_code = end + 1
+    size = code_size + 1
+    # Codes are packed least significant bit first.
+    buffer, bits = clear, size
+
+    prefix = data[0]
+    for k in data[1:]:
+        key = prefix << 8 | k
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        buffer |= prefix << bits
+        bits += size
+        while bits >= 8:
+            out.append(buffer & 0xFF)
+            buffer >>= 8
+            bits -= 8
+
+        if next_code < 4096:
+            table[key] = next_code
+            next_code += 1
+            # The decoder adds its entry a code later, so widen once it has caught up.
+            if next_code > 1 << size:
+                size += 1
+        else:
+            buffer |= clear << bits
+            bits += size
+            table = {}
+            next_code = end + 1
+            size = code_size + 1
+        prefix = k
+
+    for code in (prefix, end):
+        buffer |= code << bits
+        bits += size
+    while bits > 0:
+        out.append(buffer & 0xFF)
+        buffer >>= 8
+        bits -= 8
+    return bytes(out)
+
+
+class GifWriter:
+    def __init__(self, f, width, height, colors):
+        self.f = f
+        self.time = 0
+
+        table = np.zeros((256, 3), np.uint8)
+        table[: len(colors)] = colors
+
+        f.write(b'GIF89a')
+        # Global colour table of 256 entries, 8 bits per channel.
+        f.write(struct.pack('<HHBBB', width, height, 0xF7, 0, 0))
+        f.write(table.tobytes())
+        # Loop forever.
+        f.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+
+    def frame(self, indices, left, top, duration):
+        # Centisecond delays, rounded from the start so the error doesn't build up.
+        start = round(self.time * 100)
+        self.time += duration
+        delay = round(self.time * 100) - start
+
+        height, width = indices.shape
+        # Leave the previous frame in place beneath, showing through the transparent index.
+        self.f.write(struct.pack('<BBBBHBB', 0x21, 0xF9, 4, 0x05, delay, TRANSPARENT, 0))
+        self.f.write(struct.pack('<BHHHHB', 0x2C, left, top, width, height, 0))
+        self.f.write(b'\x08')
+
+        data = lzw(indices.tobytes())
+        for n in range(0, len(data), 255):
+            block = data[n : n + 255]
+            self.f.write(bytes([len(block)]) + block)
+        self.f.write(b'\x00')
+
+    def close(self):
+        self.f.write(b'\x3b')
+
+
+def png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+class ApngWriter:
+    def __init__(self, f, width, height, colors):
+        self.f = f
+        self.time = 0
+        self.sequence = 0
+        self.frames = 0
+
+        table = np.zeros((256, 3), np.uint8)
+        table[: len(colors)] = colors
+        alpha = np.full(256, 255, np.uint8)
+        alpha[TRANSPARENT] = 0
+
+        f.write(PNG_SIGNATURE)
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0))
+        # The frame count isn't known until the end, it's filled in on close.
+        self._actl = f.tell()
+        self._chunk(b'acTL', struct.pack('>II', 0, 0))
+        self._chunk(b'PLTE', table.tobytes())
+        self._chunk(b'tRNS', alpha.tobytes())
+
+    def _chunk(self, kind, data):
+        self.f.write(png_chunk(kind, data))
+
+    def frame(self, indices, left, top, duration):
+        # Millisecond delays, rounded from the start so the error doesn't build up.
+        start = round(self.time * 1000)
+        self.time += duration
+        delay, denominator = round(self.time * 1000) - start, 1000
+        if delay > 0xFFFF:
+            delay, denominator = round(delay / 10), 100
+
+        height, width = indices.shape
+        first = self.frames == 0
+        self._chunk(
+            b'fcTL',
+            struct.pack(
+                '>IIIIIHHBB',
+                self.sequence,
+                width,
+                height,
+                left,
+                top,
+                delay,
+                denominator,
+                0,  # Don't dispose.
+                0 if first else 1,  # Blend over, so transparent pixels keep the last frame.
+            ),
+        )
+        self.sequence += 1
+
+        # Each row starts with its filter type, none.
+        rows = np.zeros((height, width + 1), np.uint8)
+        rows[:, 1:] = indices
+        data = zlib.compress(rows.tobytes(), 9)
+        if first:
+            self._chunk(b'IDAT', data)
+        else:
+            self._chunk(b'fdAT', struct.pack('>I', self.sequence) + data)
+            self.sequence += 1
+        self.frames += 1
+
+    def close(self):
+        self._chunk(b'IEND', b'')
+        self.f.seek(self._actl)
+        self._chunk(b'acTL', struct.pack('>II', self.frames, 0))
+
+
+WRITERS = {
+    '.gif': GifWriter,
+    '.png': ApngWriter,
+    '.apng': ApngWriter,
+}
+
+
+class AnimationExporter:
+    def __init__(self, renderer, speed=1.0, hold=INITIAL_SPEED, stats=None, min_delay=MIN_DELAY):
+        self.renderer = renderer
+        self.speed = speed
+        self.hold = hold
+        self.min_delay = min_delay
+        self.stats = stats or metrics.Metrics('animation')
+
+        self.colors = palette()
+        self.quantize = Quantizer(self.colors)
+        self.written = 0
+        self.encoded_pixels = 0
+
+    def timed(self, ops, buffer=None, discard=None):
+        """ The (start, duration, frame) to write for ops, timing the rendering. """
+        timed = held(
+            frames(ops, self.renderer, self.speed, buffer), self.hold, self.min_delay, discard
+        )
+        while True:
+            with self.stats.timer('render'):
+                item = next(timed, None)
+            if item is None:
+                break
+            yield item
+
+    def export(self, ops, writer):
+        self.encode(self.timed(ops), writer)
+
+    def export_shared(self, ops, path, writer_class):
+        """
+        As export, but writing path from an encoder process fed frames through shared
+        memory, so rendering and encoding overlap.
+        """
+        shape = self.renderer.height, self.renderer.width
+        args = (path, writer_class, self.renderer.width, self.renderer.height)
+        with framering.EncoderProcess(shape, _encode_shared, args) as ring:
+            for start, duration, frame in self.timed(ops, ring.buffer, ring.discard):
+                ring.put(frame, (start, duration))
+            self.written, self.encoded_pixels, timers = ring.finish()
+        self.stats.add_timers(timers)
+
+    def encode(self, timed, writer):
+        """ Write timed (start, duration, frame) with writer. """
+        shown = None  # the frame as of the last one written.
+        for _, duration, frame in timed:
+            with self.stats.timer('encode'):
+                shown = self._write(writer, shown, frame, duration)
+        writer.close()
+
+    def _write(self, writer, shown, frame, duration):
+        if shown is None:
+            rect = (0, 0) + frame.shape
+        else:
+            # A frame replacing a too-quick one may match the last written, mark time.
+            rect = dirty_rect(shown, frame) or (0, 0, 1, 1)
+
+        top, left, bottom, right = rect
+        region = frame[top:bottom, left:right]
+        indices = self.quantize(region)
+        if shown is not None:
+            indices[region == shown[top:bottom, left:right]] = TRANSPARENT
+
+        writer.frame(indices, left, top, duration)
+        self.written += 1
+        self.encoded_pixels += indices.size
+        return frame
+
+
+def _encode_shared(ring, path, writer_class, width, height):
+    exporter = AnimationExporter(None)
+    with open(path, 'wb') as f:
+        writer = writer_class(f, width, height, exporter.colors)
+        # Keeping the last frame, to compare the next with.
+        timed = ((start, duration, frame) for (start, duration), frame in ring.frames(keep=1))
+        exporter.encode(timed, writer)
+    ring.done((exporter.written, exporter.encoded_pixels, exporter.stats.timers))
+
+
+def export(ops, output, display, args):
+    """ Export ops to output at display, returning the run's Metrics and a summary line. """
+    writer_class = WRITERS[os.path.splitext(output)[1].lower()]
+    stats = metrics.Metrics('anim', os.path.basename(output))
+    renderer = create_renderer(*DISPLAY_SIZES[display], args.raster, args.draft)
+    width, height = renderer.width, renderer.height
+    min_delay = DRAFT_MIN_DELAY if args.draft else MIN_DELAY
+    exporter = AnimationExporter(renderer, args.speed, stats=stats, min_delay=min_delay)
+    if args.encoder_process:
+        exporter.export_shared(ops, output, writer_class)
+    else:
+        with open(output, 'wb') as f:
+            exporter.export(ops, writer_class(f, width, height, exporter.colors))
+
+    stats.frames = renderer.rendered
+    return stats, (
+        f"Wrote {exporter.written} of {stats.frames} frames to {output}, "
+        f"{exporter.encoded_pixels / (exporter.written * width * height or 1):.1%} of the pixels"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="diffcast-anim", description='Export a series of files as an animated GIF or APNG.'
+    )
+    parser.add_argument('output_file', help='Output .gif, .png or .apng file.')
+    parser.add_argument(
+        'files',
+        metavar='N',
+        nargs='+',
+        help='The series of files to apply, or a single timeline file.',
+    )
+    parser.add_argument(
+        '--display',
+        choices=DISPLAY_SIZES,
+        nargs='+',
+        default=['hd'],
+        help='Output sizes, several are exported in one pass to output_<size>.',
+    )
+    parser.add_argument('--speed', type=float, default=1.0, help='Playback speed multiplier.')
+    add_renderer_arguments(parser)
+    framering.add_arguments(parser)
+    metrics.add_arguments(parser)
+
+    args = parser.parse_args()
+
+    if os.path.splitext(args.output_file)[1].lower() not in WRITERS:
+        parser.error('Output file must end .gif, .png or .apng')
+
+    stats = metrics.Metrics('anim', os.path.basename(args.output_file))
+    ops = stats.track(load_ops(args.files))
+    jobs = [
+        (export, (path, display, args))
+        for display, path in outputs(args.output_file, args.display)
+    ]
+    if len(jobs) == 1:
+        target, job_args = jobs[0]
+        results = [target(ops, *job_args)]
+    else:
+        results = fan_out(ops, jobs)
+
+    for run, summary in results:
+        stats.frames += run.frames
+        stats.add_timers(run.timers)
+        print(summary)
+    stats.write(args.metrics_prom, args.metrics_json)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,52 @@
-import difflib
+import argparse
 import os
 import sys
-import uuid
+import tempfile
+import threading
+import time
 
-from PyQt6.QtCore import QSettings, QSize, Qt, QThreadPool
+from PyQt6.QtCore import QObject, QSize, Qt, QThreadPool, QTimer, pyqtSignal
 from PyQt6.QtGui import QColor, QIcon, QPalette
 from PyQt6.QtWidgets import (QAbstractItemView, QApplication, QCheckBox,
-                             QComboBox, QFileDialog, QHBoxLayout, QLineEdit,
-                             QListWidget, QListWidgetItem, QMainWindow,
+                             QComboBox, QFileDialog, QHBoxLayout,
+                             QInputDialog, QLineEdit, QListView, QMainWindow,
                              QMessageBox, QProgressBar, QPushButton,
                              QVBoxLayout, QWidget)
 
+import profiler
 from diffrunner import DiffRunner
+from gitsource import GitError, revisions
+from project import ProjectPlanner, SnapshotError
+from stepmodel import (ProjectError, StepModel, load_project, new_step,
+                       save_project)
+from thumbnails import THUMBNAIL_SIZE, Thumbnails
 from viewer import DISPLAY_MODES, CodeViewer
+from watch import LiveCast, changes
+from writer import AtomicWriter
 
-try:
-    # Include in try/except block if you're also targeting Mac/Linux
-    from PyQt5.QtWinExtras import QtWin
 
-    myappid = 'mfitzp.diffcast'
-    QtWin.setCurrentProcessExplicitAppUserModelID(myappid)
-except ImportError:
-    pass
+class WatchSignals(QObject):
+    # emit each Step saved in a watched folder
+    saved = pyqtSignal(object)
 
 
-differ = difflib.Differ()
-settings = QSettings("Martin Fitzpatrick", "DiffCast")
+class WriterSignals(QObject):
+    # emit the path and error of failed output writes
+    failed = pyqtSignal(str, str)
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, fsync=False):
         super().__init__()
 
+        # Output files are written in the background, so playback never waits on disk.
+        self.writer_signals = WriterSignals()
+        self.writer_signals.failed.connect(self.write_failed)
+        self.writer = AtomicWriter(
+            fsync, on_error=lambda path, e: self.writer_signals.failed.emit(path, str(e))
+        )
+        self.writer.start()
+
         self.setWindowTitle("DiffCast")
 
         self.viewer = CodeViewer()
@@ -53,6 +68,17 @@ class MainWindow(QMainWindow):
         add_btn.pressed.connect(self.open_file_dialog)
         controls.addWidget(add_btn)
 
+        add_folder_btn = QPushButton("Add Folder")
+        add_folder_btn.pressed.connect(self.open_folder_dialog)
+        controls.addWidget(add_folder_btn)
+
+        vl.addLayout(controls)
+        controls = QHBoxLayout()
+
+        add_git_btn = QPushButton("Add Git")
+        add_git_btn.pressed.connect(self.open_git_dialog)
+        controls.addWidget(add_git_btn)
+
         add_empty_btn = QPushButton("Add Empty")
         add_empty_btn.pressed.connect(self.add_empty_file)
         controls.addWidget(add_empty_btn)
@@ -62,11 +88,36 @@ class MainWindow(QMainWindow):
         controls.addWidget(del_btn)
 
         vl.addLayout(controls)
+        controls = QHBoxLayout()
+
+        open_project_btn = QPushButton("Open Project...")
+        open_project_btn.pressed.connect(self.open_project_dialog)
+        controls.addWidget(open_project_btn)
 
-        self.difflist = QListWidget()
+        save_project_btn = QPushButton("Save Project...")
+        save_project_btn.pressed.connect(self.save_project_dialog)
+        controls.addWidget(save_project_btn)
+
+        vl.addLayout(controls)
+
+        # Step thumbnails are rendered in the background, as rows are first shown.
+        self.thumbnails = Thumbnails()
+        self.steps = StepModel(self.thumbnails)
+
+        self.difflist = QListView()
+        self.difflist.setModel(self.steps)
         self.difflist.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
-        self.difflist.currentRowChanged.connect(self.update_button_state)
-        self.difflist.itemClicked.connect(self.select)
+        self.difflist.setDefaultDropAction(Qt.DropAction.MoveAction)
+        self.difflist.setIconSize(QSize(*THUMBNAIL_SIZE))
+        # Rows are all the same height, so the view needn't ask for every one.
+        self.difflist.setUniformItemSizes(True)
+        self.difflist.selectionModel().currentRowChanged.connect(
+            lambda current: self.update_button_state(current.row())
+        )
+        self.steps.rowsInserted.connect(lambda: self.update_button_state())
+        self.steps.rowsRemoved.connect(lambda: self.update_button_state())
+        self.steps.modelReset.connect(lambda: self.update_button_state())
+        self.difflist.clicked.connect(self.select)
 
         vl.addWidget(self.difflist)
 
@@ -113,24 +164,41 @@ class MainWindow(QMainWindow):
         show_hide_filelist = QCheckBox("Show file list")
         show_hide_filelist.setCheckable(True)
         show_hide_filelist.setChecked(False)
-        show_hide_filelist.toggled.connect(self.viewer.files.setVisible)
+        show_hide_filelist.toggled.connect(self.viewer.show_files)
         vl.addWidget(show_hide_filelist)
 
+        controls = QHBoxLayout()
+        self.watch_btn = QPushButton("Watch Folder...")
+        self.watch_btn.setCheckable(True)
+        self.watch_btn.toggled.connect(self.toggle_watch)
+        controls.addWidget(self.watch_btn)
+
+        self.animate_saves = QCheckBox("Animate saves")
+        self.animate_saves.setChecked(True)
+        controls.addWidget(self.animate_saves)
+        vl.addLayout(controls)
+
+        self.watch_signals = WatchSignals()
+        self.watch_signals.saved.connect(self.add_saved_step)
+        self.watch_stop = None
+        self.pending = []  # transitions saved while another was playing
+
         container = QWidget()
         container.setLayout(vl)
         self.setCentralWidget(container)
 
         self.threadpool = QThreadPool()
         self.runner = None
+        self.running = False
 
-        self.setFixedSize(QSize(300, 400))
+        self.setFixedSize(QSize(300, 490))
 
     def update_button_state(self, row=None):
         if row is None:
-            row = self.difflist.currentRow()
+            row = self.difflist.currentIndex().row()
 
         disable_prev = row == -1 or row == 0
-        disable_next = row == -1 or row == self.difflist.count() -1
+        disable_next = row == -1 or row == self.steps.rowCount() - 1
 
         self.prev_btn.setDisabled(disable_prev)
         self.next_btn.setDisabled(disable_next)
@@ -155,91 +223,159 @@ class MainWindow(QMainWindow):
         self.target_file_label.setText("")
 
     def diff_file_changed(self, fid):
-        for idx in range(self.difflist.count()):
-            lwi = self.difflist.item(idx)
-            if lwi.data(Qt.ItemDataRole.UserRole + 1) == fid:
-                self.difflist.setCurrentItem(lwi)
+        row = self.steps.row(fid)
+        if row != -1:
+            self.difflist.setCurrentIndex(self.steps.index(row))
 
     def differ_file_complete(self, fid, source):
-        if self.target_file:
+        if profiler.PROFILE:
+            profiler.received('file_complete')
+
+        if self.target_file and not isinstance(self.runner.planner, ProjectPlanner):
+            # Only single file casts have one output file to write.
             # If file is unset, this will be skipped.
-            with open(self.target_file, 'w') as f:
-                f.write(''.join(source))
+            if profiler.PROFILE:
+                start = time.perf_counter()
+            self.writer.write(self.target_file, ''.join(source))
+            if profiler.PROFILE:
+                profiler.span('write_output', start)
+
+    def write_failed(self, path, error):
+        QMessageBox.warning(self, "Couldn't write output file", f"{path}: {error}")
 
     def delete_selected_diffs(self):
-        for lwi in self.difflist.selectedItems():
-            self.difflist.takeItem(self.difflist.row(lwi))
+        # From the bottom up, so the rows still to go don't move.
+        for index in sorted(self.difflist.selectedIndexes(), key=lambda i: -i.row()):
+            self.steps.removeRows(index.row(), 1)
 
     def start(self):
-        row = self.difflist.currentRow()
+        row = self.difflist.currentIndex().row()
         if row == -1:
             return
 
-        files = []
-        for n in range(row, self.difflist.count()):
-            lwi = self.difflist.item(n)
-            path = lwi.data(Qt.ItemDataRole.UserRole)
-            fid = lwi.data(Qt.ItemDataRole.UserRole + 1)
-            files.append((fid, path))
-
-        self.diff(files)
+        self.play(range(row, self.steps.rowCount()))
 
     def prev(self):
-        row = self.difflist.currentRow()
+        row = self.difflist.currentIndex().row()
         if row == -1 or row == 0:
             return
 
-        files = []
-        for n in range(row, row - 2, -1):
-            lwi = self.difflist.item(n)
-            path = lwi.data(Qt.ItemDataRole.UserRole)
-            fid = lwi.data(Qt.ItemDataRole.UserRole + 1)
-            files.append((fid, path))
-
-        self.diff(files)
+        self.play(range(row, row - 2, -1))
 
     def next(self):
-        row = self.difflist.currentRow()
-        if row == -1 or row == self.difflist.count() - 1:
+        row = self.difflist.currentIndex().row()
+        if row == -1 or row == self.steps.rowCount() - 1:
             return
 
-        files = []
-        for n in range(row, row + 2):
-            lwi = self.difflist.item(n)
-            path = lwi.data(Qt.ItemDataRole.UserRole)
-            fid = lwi.data(Qt.ItemDataRole.UserRole + 1)
-            files.append((fid, path))
-
-        self.diff(files)
+        self.play(range(row, row + 2))
 
-    def select(self, lwi):
+    def select(self, index):
         """ Update view when item in view clicked. """
-        path = lwi.data(Qt.ItemDataRole.UserRole)
-        fid = lwi.data(Qt.ItemDataRole.UserRole + 1)
-        files = [(fid, path)]
-
         # Diff a single, initial file. Resets view to current item.
-        self.diff(files)
+        self.play([index.row()])
+
+    def play(self, rows):
+        changed = self.steps.check(rows)
+        if changed:
+            QMessageBox.warning(
+                self,
+                "Steps changed",
+                "These files have changed since the project was saved:\n\n"
+                + "\n".join(changed),
+            )
+        self.diff(self.steps.files(rows))
 
     def diff(self, files):
+        if profiler.PROFILE:
+            profiler.counter('diff', files=len(files))
+
         if files:
+            try:
+                runner = DiffRunner(files)
+            except (GitError, SnapshotError) as e:
+                QMessageBox.warning(self, "Couldn't play these steps", str(e))
+                return
+
+            self.running = True
             self.start_btn.setDisabled(True)
             self.prev_btn.setDisabled(True)
             self.next_btn.setDisabled(True)
-            self.runner = DiffRunner(files)
+            self.runner = runner
             self.runner.signals.updated.connect(self.viewer.differ_edit)
             self.runner.signals.file_changed.connect(self.diff_file_changed)
             self.runner.signals.file_complete.connect(self.differ_file_complete)
+            self.runner.signals.file_opened.connect(self.viewer.differ_open)
             self.runner.signals.completed.connect(self.differ_complete)
+            self.runner.signals.error.connect(self.differ_error)
             self.runner.signals.progress.connect(self.progress.setValue)
 
             self.stop_btn.pressed.connect(self.runner.quit)
 
             self.threadpool.start(self.runner)
 
+    def differ_error(self, message):
+        QMessageBox.warning(self, "Couldn't play these steps", message)
+
     def differ_complete(self):
+        self.running = False
         self.start_btn.setDisabled(False)
         self.update_button_state()
+        self.play_pending()
+
+    def toggle_watch(self, checked):
+        if not checked:
+            self.watch_stop.set()
+            self.watch_btn.setText("Watch Folder...")
+            return
+
+        directory = QFileDialog.getExistingDirectory(self, "Watch folder")
+        if not directory:
+            self.watch_btn.setChecked(False)
+            return
+
+        live = LiveCast(directory, tempfile.mkdtemp(prefix='diffcast-'))
+        self.watch_stop = threading.Event()
+        watcher = threading.Thread(target=self.watch, args=(live, self.watch_stop), daemon=True)
+        watcher.start()
+        self.watch_btn.setText(f"Watching {os.path.basename(directory)}")
+
+    def watch(self, live, stop):
+        # Runs in the watcher thread, steps are queued over to the GUI thread.
+        for name in changes(live.directory, stop):
+            step = live.add(name)
+            if step is not None:
+                self.watch_signals.saved.emit(step)
+
+    def add_saved_step(self, step):
+        """ Append a save in the watched folder as a step, animating it if enabled. """
+        previous = None
+        for existing in self.steps.steps:
+            if existing.path == step.previous:
+                previous = existing
+
+        if previous is None and step.previous is not None:
+            # First save of a file which already existed, start from how it was.
+            previous = self.add_step(step.name, step.previous)
+
+        added = self.add_step(step.name, step.snapshot)
+
+        if self.animate_saves.isChecked():
+            if previous is not None:
+                start = (previous.fid, step.previous)
+            else:
+                start = (added.fid, None)  # A new file, typed out from empty.
+            self.pending.append([start, (added.fid, step.snapshot)])
+            self.play_pending()
+
+    def add_step(self, name, path):
+        step = new_step(name, path)
+        self.steps.append([step])
+        return step
+
+    def play_pending(self):
+        # Only the saved transition is planned and played, not the whole list.
+        if self.pending and not self.running:
+            self.diff(self.pending.pop(0))
 
     def open_file_dialog(self):
         paths, _ = QFileDialog.getOpenFileNames()
@@ -250,67 +386,159 @@ class MainWindow(QMainWindow):
         # FIXME: Split numeric suffix, something smarter?
         paths.sort()
 
-        for path in paths:
-            filename = os.path.basename(path)
-            lwi = QListWidgetItem(filename)
-            lwi.setData(Qt.ItemDataRole.UserRole, path)
-            fid = uuid.uuid4().hex
-            lwi.setData(Qt.ItemDataRole.UserRole +1, fid)
-            self.difflist.addItem(lwi)
+        self.steps.append([new_step(os.path.basename(path), path) for path in paths])
 
-        self.update_button_state()
+    def open_folder_dialog(self):
+        """ Add a directory snapshot, as a step of a project cast. """
+        path = QFileDialog.getExistingDirectory()
+        if not path:
+            return
+
+        self.add_step(os.path.basename(path) + '/', path)
+
+    def open_git_dialog(self):
+        """ Add a step for each commit touching a file in a git repository. """
+        path, _ = QFileDialog.getOpenFileName(self, "Select a file in a git repository")
+        if not path:
+            return
+
+        rev_range, ok = QInputDialog.getText(self, "Git history", "Commits:", text="HEAD")
+        if not ok:
+            return
+
+        try:
+            commits = revisions(os.path.dirname(path), path, rev_range or "HEAD")
+        except GitError as e:
+            QMessageBox.warning(self, "Couldn't read git history", str(e))
+            return
+
+        self.steps.append(
+            [new_step(f"{revision.rev[:7]} {subject}", revision) for revision, subject in commits]
+        )
 
     def add_empty_file(self):
-        lwi = QListWidgetItem('[Empty]')
-        lwi.setData(Qt.ItemDataRole.UserRole, None)
-        fid = uuid.uuid4().hex
-        lwi.setData(Qt.ItemDataRole.UserRole +1, fid)
-        self.difflist.addItem(lwi)
+        self.add_step('[Empty]', None)
+
+    def open_project_dialog(self):
+        filename, _ = QFileDialog.getOpenFileName(
+            self, "Open project", filter="DiffCast projects (*.dcproj)"
+        )
+        if not filename:
+            return
+
+        try:
+            steps = load_project(filename)
+        except (OSError, ProjectError) as e:
+            QMessageBox.warning(self, "Couldn't open project", str(e))
+            return
+        self.thumbnails.clear()
+        self.steps.set_steps(steps)
+
+    def save_project_dialog(self):
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Save project", filter="DiffCast projects (*.dcproj)"
+        )
+        if not filename:
+            return
+        if not os.path.splitext(filename)[1]:
+            filename += '.dcproj'
+
+        try:
+            self.steps.steps = save_project(filename, self.steps.steps)
+        except OSError as e:
+            QMessageBox.warning(self, "Couldn't save project", str(e))
 
     def closeEvent(self, e):
+        if self.watch_stop:
+            self.watch_stop.set()
+        self.thumbnails.clear()
+        self.writer.close()
         self.viewer.close()
         if self.runner:
             self.runner.quit()
         super().closeEvent(e)
 
 
-app = QApplication(sys.argv)
-app.setWindowIcon(QIcon('images\icon.ico'))
-app.setApplicationName("DiffCast")
-
-app.setStyle("Fusion")
-
-darkPalette = app.palette()
-darkPalette.setColor(QPalette.ColorRole.Window, QColor(53, 53, 53))
-darkPalette.setColor(QPalette.ColorRole.WindowText, Qt.GlobalColor.white)
-darkPalette.setColor(
-    QPalette.ColorGroup.Disabled, QPalette.ColorRole.WindowText, QColor(127, 127, 127)
-)
-darkPalette.setColor(QPalette.ColorRole.Base, QColor(42, 42, 42))
-darkPalette.setColor(QPalette.ColorRole.AlternateBase, QColor(66, 66, 66))
-darkPalette.setColor(QPalette.ColorRole.ToolTipBase, Qt.GlobalColor.white)
-darkPalette.setColor(QPalette.ColorRole.ToolTipText, Qt.GlobalColor.white)
-darkPalette.setColor(QPalette.ColorRole.Text, Qt.GlobalColor.white)
-darkPalette.setColor(QPalette.ColorGroup.Disabled, QPalette.ColorRole.Text, QColor(127, 127, 127))
-darkPalette.setColor(QPalette.ColorRole.Dark, QColor(35, 35, 35))
-darkPalette.setColor(QPalette.ColorRole.Shadow, QColor(20, 20, 20))
-darkPalette.setColor(QPalette.ColorRole.Button, QColor(53, 53, 53))
-darkPalette.setColor(QPalette.ColorRole.ButtonText, Qt.GlobalColor.white)
-darkPalette.setColor(
-    QPalette.ColorGroup.Disabled, QPalette.ColorRole.ButtonText, QColor(127, 127, 127)
-)
-darkPalette.setColor(QPalette.ColorRole.BrightText, Qt.GlobalColor.red)
-darkPalette.setColor(QPalette.ColorRole.Link, QColor(42, 130, 218))
-darkPalette.setColor(QPalette.ColorRole.Highlight, QColor(42, 130, 218))
-darkPalette.setColor(QPalette.ColorGroup.Disabled, QPalette.ColorRole.Highlight, QColor(80, 80, 80))
-darkPalette.setColor(QPalette.ColorRole.HighlightedText, Qt.GlobalColor.white)
-darkPalette.setColor(
-    QPalette.ColorGroup.Disabled, QPalette.ColorRole.HighlightedText, QColor(127, 127, 127)
-)
-app.setPalette(darkPalette)
-
-w = MainWindow()
-w.show()
-
-app.exec()
-
+def set_windows_app_id():
+    try:
+        # Include in try/except block if you're also targeting Mac/Linux
+        from PyQt5.QtWinExtras import QtWin
+
+        myappid = 'mfitzp.diffcast'
+        QtWin.setCurrentProcessExplicitAppUserModelID(myappid)
+    except ImportError:
+        pass
+
+
+def create_app(qt_args):
+    app = QApplication(sys.argv[:1] + qt_args)
+    app.setWindowIcon(QIcon('images\\icon.ico'))
+    app.setApplicationName("DiffCast")
+
+    app.setStyle("Fusion")
+
+    darkPalette = app.palette()
+    darkPalette.setColor(QPalette.ColorRole.Window, QColor(53, 53, 53))
+    darkPalette.setColor(QPalette.ColorRole.WindowText, Qt.GlobalColor.white)
+    darkPalette.setColor(
+        QPalette.ColorGroup.Disabled, QPalette.ColorRole.WindowText, QColor(127, 127, 127)
+    )
+    darkPalette.setColor(QPalette.ColorRole.Base, QColor(42, 42, 42))
+    darkPalette.setColor(QPalette.ColorRole.AlternateBase, QColor(66, 66, 66))
+    darkPalette.setColor(QPalette.ColorRole.ToolTipBase, Qt.GlobalColor.white)
+    darkPalette.setColor(QPalette.ColorRole.ToolTipText, Qt.GlobalColor.white)
+    darkPalette.setColor(QPalette.ColorRole.Text, Qt.GlobalColor.white)
+    darkPalette.setColor(
+        QPalette.ColorGroup.Disabled, QPalette.ColorRole.Text, QColor(127, 127, 127)
+    )
+    darkPalette.setColor(QPalette.ColorRole.Dark, QColor(35, 35, 35))
+    darkPalette.setColor(QPalette.ColorRole.Shadow, QColor(20, 20, 20))
+    darkPalette.setColor(QPalette.ColorRole.Button, QColor(53, 53, 53))
+    darkPalette.setColor(QPalette.ColorRole.ButtonText, Qt.GlobalColor.white)
+    darkPalette.setColor(
+        QPalette.ColorGroup.Disabled, QPalette.ColorRole.ButtonText, QColor(127, 127, 127)
+    )
+    darkPalette.setColor(QPalette.ColorRole.BrightText, Qt.GlobalColor.red)
+    darkPalette.setColor(QPalette.ColorRole.Link, QColor(42, 130, 218))
+    darkPalette.setColor(QPalette.ColorRole.Highlight, QColor(42, 130, 218))
+    darkPalette.setColor(
+        QPalette.ColorGroup.Disabled, QPalette.ColorRole.Highlight, QColor(80, 80, 80)
+    )
+    darkPalette.setColor(QPalette.ColorRole.HighlightedText, Qt.GlobalColor.white)
+    darkPalette.setColor(
+        QPalette.ColorGroup.Disabled, QPalette.ColorRole.HighlightedText, QColor(127, 127, 127)
+    )
+    app.setPalette(darkPalette)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="diffcast")
+    parser.add_argument(
+        '--profile', metavar='TRACE', help='Record a Chrome trace of the hot paths to TRACE.'
+    )
+    parser.add_argument(
+        '--fsync', action='store_true', help='Flush output files to disk before replacing them.'
+    )
+    args, qt_args = parser.parse_known_args()
+
+    if args.profile:
+        profiler.enable(args.profile)
+
+    if sys.platform == 'win32':
+        set_windows_app_id()
+
+    app = create_app(qt_args)
+
+    w = MainWindow(fsync=args.fsync)
+    w.show()
+
+    if profiler.PROFILE:
+        # From importing the profiler, early in startup, to the event loop running.
+        QTimer.singleShot(0, lambda: profiler.span('startup', profiler._start))
+
+    app.exec()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+Local live-broadcast server, playing a cast once to any number of browsers.
+
+Viewers open the page served at / which follows the Server-Sent Events stream at
+/events. Each edit is encoded once and the same bytes are queued to every client, so
+adding viewers only costs a buffer append each. Late joiners are sent a snapshot of the
+buffer first, then the live edits from there on.
+"""
+import argparse
+import asyncio
+import json
+
+from events import encode, event
+from planner import OP_STEP, apply
+from styles import (CARET_LINE_BACKGROUND_COLOR, DEFAULT_COLOR, FONT_FAMILY,
+                    MARGIN_BACKGROUND_COLOR, MARGIN_FOREGROUND_COLOR,
+                    PAPER_COLOR)
+from timeline import load_ops
+
+# Clients with more than this queued are too slow to keep up, and are dropped.
+MAX_CLIENT_BUFFER = 4 * 1024 * 1024
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>DiffCast</title>
+<style>
+body { margin: 0; background: %(paper)s; color: %(color)s; }
+pre { margin: 0; font: 18pt %(font)s, monospace; }
+.row { display: flex; }
+.n { width: 5ch; padding-right: 8px; text-align: right; flex: none;
+     background: %(margin)s; color: %(margin_color)s; }
+.caret { background: %(caret)s; }
+</style></head>
+<body><pre id="code"></pre>
+<script>
+var lines = [], caret = 0;
+var code = document.getElementById('code');
+
+function split(text) {
+    var parts = text.split('\\n').map(function (l) { return l + '\\n'; });
+    parts[parts.length - 1] = parts[parts.length - 1].slice(0, -1);
+    if (!parts[parts.length - 1]) parts.pop();
+    return parts;
+}
+
+function apply(e) {
+    var s = lines[e.line], i;
+    switch (e.op) {
+        case 'load': lines = split(e.text); caret = Math.max(lines.length - 1, 0); return;
+        case 'insert': lines[e.line] = s.slice(0, e.col) + e.text + s.slice(e.col); break;
+        case 'delete': lines[e.line] = s.slice(0, e.col) + s.slice(e.col + e.text.length); break;
+        case 'insert_line': lines.splice(e.line, 0, e.text); break;
+        case 'delete_line': lines.splice(e.line, 1); break;
+        case 'indent':
+            for (i = e.line; i < e.line + e.col; i++) lines[i] = e.text + lines[i];
+            break;
+        case 'dedent':
+            for (i = e.line; i < e.line + e.col; i++) lines[i] = lines[i].slice(e.text.length);
+            break;
+        default: return;
+    }
+    caret = e.line;
+}
+
+function render() {
+    code.textContent = '';
+    lines.forEach(function (line, n) {
+        var row = document.createElement('div'), num = document.createElement('span');
+        row.className = n == caret ? 'row caret' : 'row';
+        num.className = 'n';
+        num.textContent = n + 1;
+        row.appendChild(num);
+        row.appendChild(document.createTextNode(line.replace(/\\n$/, '')));
+        code.appendChild(row);
+    });
+    var current = code.children[caret];
+    if (current) current.scrollIntoView({block: 'center'});
+}
+
+var source = new EventSource('/events');
+source.addEventListener('snapshot', function (m) {
+    var s = JSON.parse(m.data);
+    lines = split(s.text);
+    caret = s.line;
+    render();
+});
+source.onmessage = function (m) { apply(JSON.parse(m.data)); render(); };
+source.addEventListener('end', function () { source.close(); });
+</script></body></html>
+""" % {
+    'paper': PAPER_COLOR,
+    'color': DEFAULT_COLOR,
+    'font': FONT_FAMILY,
+    'margin': MARGIN_BACKGROUND_COLOR,
+    'margin_color': MARGIN_FOREGROUND_COLOR,
+    'caret': CARET_LINE_BACKGROUND_COLOR,
+}
+
+
+def sse(data, name=None):
+    """ Encode a Server-Sent Events message. """
+    message = 'event: %s\n' % name if name else ''
+    message += 'data: %s\n\n' % data.rstrip('\n')
+    return message.encode('utf-8')
+
+
+class Broadcast:
+    def __init__(self, ops, speed=1.0):
+        self.ops = ops
+        self.speed = speed
+
+        self.lines = []
+        self.caret = (0, 0)
+        self.time = 0
+        self.fid = None
+        self.finished = False
+
+        self.clients = set()
+
+    def snapshot(self):
+        line, col = self.caret
+        data = {
+            'text': ''.join(self.lines),
+            'line': line,
+            'col': col,
+            'time': round(self.time, 6),
+            'fid': self.fid,
+        }
+        return sse(json.dumps(data, ensure_ascii=False, separators=(',', ':')), 'snapshot')
+
+    def send(self, message):
+        for writer in list(self.clients):
+            if writer.is_closing():
+                self.clients.discard(writer)
+                continue
+            if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                self.clients.discard(writer)
+                writer.close()
+                continue
+            writer.write(message)
+
+    async def play(self):
+        """ Play the ops once, in real time, sending each edit to every client. """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        for op in self.ops:
+            self.time += op.delay
+            wait = start + self.time / self.speed - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            if op.kind == OP_STEP:
+                self.fid = op.text
+            else:
+                apply(self.lines, op)
+                self.caret = op.caret
+
+            self.send(sse(encode(event(op, self.time, self.fid))))
+
+        self.finished = True
+        self.send(sse('{}', 'end'))
+        for writer in self.clients:
+            writer.close()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+
+        try:
+            method, path, *_ = request.decode('latin-1').split(' ', 2)
+        except ValueError:
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            await self.close(writer)
+            return
+        path = path.split('?')[0]
+
+        if method != 'GET':
+            writer.write(b'HTTP/1.1 405 Method Not Allowed\r\nContent-Length: 0\r\n\r\n')
+
+        elif path == '/':
+            body = PAGE.encode('utf-8')
+            writer.write(
+                b'HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n'
+                b'Content-Length: %d\r\nConnection: close\r\n\r\n%s' % (len(body), body)
+            )
+
+        elif path == '/events':
+            writer.write(
+                b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                b'Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n'
+            )
+            # Snapshot and subscribe in one go, so no edits fall between them.
+            writer.write(self.snapshot())
+            if self.finished:
+                writer.write(sse('{}', 'end'))
+            else:
+                self.clients.add(writer)
+                try:
+                    # Hold the connection open until the client goes away.
+                    while await reader.read(1024):
+                        pass
+                except ConnectionError:
+                    pass
+                finally:
+                    self.clients.discard(writer)
+
+        else:
+            writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n')
+
+        await self.close(writer)
+
+    async def close(self, writer):
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8000, delay=0):
+        """ Serve viewers, starting playback after delay seconds. Runs until cancelled. """
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        async with server:
+            await asyncio.sleep(delay)
+            await self.play()
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="diffcast-broadcast", description='Play a cast live to viewers in their browsers.'
+    )
+    parser.add_argument(
+        'files',
+        metavar='N',
+        nargs='+',
+        help='The series of files to apply, or a single timeline file.',
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on.')
+    parser.add_argument('--speed', type=float, default=1.0, help='Playback speed multiplier.')
+    parser.add_argument(
+        '--delay', type=float, default=0, help='Seconds to wait for viewers before playing.'
+    )
+
+    args = parser.parse_args()
+
+    print(f"Serving on http://{args.host}:{args.port}/")
+    broadcast = Broadcast(load_ops(args.files), args.speed)
+    try:
+        asyncio.run(broadcast.serve(args.host, args.port, args.delay))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Edit events as plain dicts, for streaming casts to other tools as newline-delimited JSON.
+"""
+import json
+import time
+
+from planner import OP_STEP
+
+
+def events(ops, realtime=False):
+    """
+    Generate an event for each op, with the op type, line, column, text, timestamp
+    (seconds from the start) and file id. Events are generated as fast as they are
+    consumed, unless realtime is set, when each waits for its pause first.
+    """
+    t = 0
+    fid = None
+    for op in ops:
+        if realtime:
+            time.sleep(op.delay)
+        t += op.delay
+
+        if op.kind == OP_STEP:
+            fid = op.text
+
+        yield event(op, t, fid)
+
+
+def event(op, t, fid):
+    return {
+        'op': op.kind,
+        'line': op.line,
+        'col': op.col,
+        'text': op.text,
+        'time': round(t, 6),
+        'fid': fid,
+    }
+
+
+def encode(event):
+    return json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def write_ndjson(f, events, flush=False):
+    for event in events:
+        f.write(encode(event))
+        if flush:
+            f.flush()
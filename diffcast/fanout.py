@@ -0,0 +1,101 @@
+"""
+Play one cast into several worker processes, to export it at several display sizes in
+one pass.
+
+The timeline is loaded and planned once here, and its ops sent in batches to every
+worker, each replaying them through its own renderer and encoder. The queues are
+bounded, so planning runs only a little ahead of the slowest worker, and with a core
+per size, exporting them all takes little longer than the largest alone.
+"""
+import multiprocessing
+import os
+import queue
+from itertools import islice
+
+# Ops per message, and messages waiting per worker.
+BATCH = 256
+QUEUED = 16
+
+
+class WorkerError(Exception):
+    pass
+
+
+def outputs(path, displays):
+    """ (display, path) for each display, tagging path with the display if there are several. """
+    displays = list(dict.fromkeys(displays))
+    if len(displays) == 1:
+        return [(displays[0], path)]
+    stem, ext = os.path.splitext(path)
+    return [(display, '%s_%s%s' % (stem, display, ext)) for display in displays]
+
+
+def _ops(batches):
+    while True:
+        batch = batches.get()
+        if batch is None:
+            return
+        yield from batch
+
+
+def _work(batches, results, index, target, args):
+    results.put((index, target(_ops(batches), *args)))
+
+
+def _put(batches, process, item):
+    while True:
+        try:
+            batches.put(item, timeout=1)
+            return
+        except queue.Full:
+            if not process.is_alive():
+                raise WorkerError('Worker exited with code %s' % process.exitcode) from None
+
+
+def fan_out(ops, jobs, batch=BATCH):
+    """
+    Play ops into a process running target(ops, *args) for each (target, args) in jobs,
+    and return their results in order.
+    """
+    results = multiprocessing.Queue()
+    workers = []
+    for index, (target, args) in enumerate(jobs):
+        batches = multiprocessing.Queue(QUEUED)
+        process = multiprocessing.Process(
+            target=_work, args=(batches, results, index, target, tuple(args))
+        )
+        process.start()
+        workers.append((batches, process))
+
+    try:
+        ops = iter(ops)
+        while True:
+            chunk = list(islice(ops, batch))
+            for batches, process in workers:
+                _put(batches, process, chunk or None)
+            if not chunk:
+                break
+
+        done = {}
+        while len(done) < len(workers):
+            try:
+                index, result = results.get(timeout=1)
+            except queue.Empty:
+                for _, process in workers:
+                    if process.exitcode:
+                        raise WorkerError(
+                            'Worker exited with code %s' % process.exitcode
+                        ) from None
+                continue
+            done[index] = result
+        for _, process in workers:
+            process.join()
+    finally:
+        for batches, process in workers:
+            # Don't wait at exit to flush batches a failed worker will never read.
+            batches.cancel_join_thread()
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+    return [done[index] for index in range(len(workers))]
@@ -0,0 +1,302 @@
+"""
+Render farm: spread the transitions of many casts over any number of workers.
+
+A farm is a directory on shared storage holding a SQLite job queue and the rendered
+segments. Each job is one transition of a cast, rendered as a standalone SVG segment.
+
+    python farm.py submit /shared/farm intro step_*.py
+    python farm.py work /shared/farm --processes 4      # on each host
+    python farm.py status /shared/farm
+
+Workers claim jobs with a lease, which they renew while rendering. A job whose lease
+runs out (the worker died or hung) is claimed again by the next idle worker. Workers
+prefer jobs from the cast they last worked on and steal from other casts once that
+runs dry, so a late-joining worker picks up whatever is left.
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+from planner import DiffPlanner
+from styles import DISPLAY_SIZES
+from svgexport import SvgExporter
+
+LEASE = 60  # seconds
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    cast_name TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    display TEXT NOT NULL,
+    speed REAL NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    output TEXT,
+    error TEXT,
+    UNIQUE (cast_name, seq)
+)
+"""
+
+# Claimable: never started, or started by a worker whose lease has run out.
+CLAIMABLE = "(state = 'pending' OR (state = 'running' AND lease_expires < :now))"
+
+
+def worker_name():
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+class Farm:
+    def __init__(self, root, lease=LEASE, max_attempts=MAX_ATTEMPTS):
+        self.root = root
+        self.lease = lease
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.join(root, 'segments'), exist_ok=True)
+
+        # Autocommit, taking the write lock explicitly around each claim.
+        self.db = sqlite3.connect(os.path.join(root, 'queue.db'), timeout=60, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def segment_path(self, cast, seq):
+        return os.path.join(self.root, 'segments', cast, '%04d.svg' % seq)
+
+    def submit(self, cast, files, display='hd', speed=1.0):
+        """ Queue a job for each transition in files, returning the number queued. """
+        files = [os.path.abspath(file) for file in files]
+        jobs = [
+            (cast, seq, source, target, display, speed)
+            for seq, (source, target) in enumerate(zip(files, files[1:]))
+        ]
+        with self.db:
+            self.db.execute('BEGIN IMMEDIATE')
+            self.db.executemany(
+                'INSERT OR REPLACE INTO jobs (cast_name, seq, source, target, display, speed)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                jobs,
+            )
+        return len(jobs)
+
+    def claim(self, worker, cast=None):
+        """ Lease the next job, preferring cast. Returns None if nothing is claimable. """
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            # Give up on jobs that keep losing their workers.
+            self.db.execute(
+                "UPDATE jobs SET state = 'failed', error = 'Lease expired'"
+                " WHERE state = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            job = self.db.execute(
+                'SELECT * FROM jobs WHERE ' + CLAIMABLE
+                + ' ORDER BY cast_name != :cast, cast_name, seq LIMIT 1',
+                {'now': now, 'cast': cast},
+            ).fetchone()
+            if job is not None:
+                self.db.execute(
+                    "UPDATE jobs SET state = 'running', worker = ?, lease_expires = ?,"
+                    ' attempts = attempts + 1 WHERE id = ?',
+                    (worker, now + self.lease, job['id']),
+                )
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return job
+
+    def renew(self, job, worker):
+        """ Extend our lease on job, returning False if it has been taken over. """
+        cursor = self.db.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND state = 'running'",
+            (time.time() + self.lease, job['id'], worker),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job, worker, output):
+        self.db.execute(
+            "UPDATE jobs SET state = 'done', output = ?, error = NULL"
+            " WHERE id = ? AND worker = ? AND state = 'running'",
+            (output, job['id'], worker),
+        )
+
+    def fail(self, job, worker, error):
+        # Back to pending for another try, unless it has used up its attempts.
+        self.db.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END,"
+            " error = ? WHERE id = ? AND worker = ? AND state = 'running'",
+            (self.max_attempts, error, job['id'], worker),
+        )
+
+    def counts(self):
+        rows = self.db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state')
+        return dict(rows.fetchall())
+
+    def unfinished(self):
+        """ Number of jobs that may still be run, including those leased by other workers. """
+        return self.db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE state IN ('pending', 'running')"
+        ).fetchone()[0]
+
+    def segments(self, cast):
+        rows = self.db.execute(
+            "SELECT seq, state, output FROM jobs WHERE cast_name = ? ORDER BY seq", (cast,)
+        )
+        return rows.fetchall()
+
+
+def render(job, path):
+    """ Render a single transition to an SVG segment at path, written atomically. """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ops = DiffPlanner([(job['source'], job['source']), (job['target'], job['target'])]).ops()
+    exporter = SvgExporter(*DISPLAY_SIZES[job['display']], speed=job['speed'])
+
+    tmp = '%s.%s.tmp' % (path, worker_name().replace(':', '-'))
+    with open(tmp, 'w') as f:
+        exporter.export(ops, f)
+    os.replace(tmp, path)
+
+
+class Heartbeat(threading.Thread):
+    """ Renew a job's lease in the background until stopped. """
+
+    def __init__(self, root, job, worker, lease):
+        super().__init__(daemon=True)
+        self.root = root
+        self.job = job
+        self.worker = worker
+        self.lease = lease
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        # SQLite connections can't be shared across threads.
+        farm = Farm(self.root, self.lease)
+        try:
+            while not self.stopped.wait(self.lease / 3):
+                if not farm.renew(self.job, self.worker):
+                    self.lost = True
+                    break
+        finally:
+            farm.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def work(root, lease=LEASE, wait=False, quiet=False):
+    """ Claim and render jobs until there are none left, or forever with wait. """
+    farm = Farm(root, lease)
+    worker = worker_name()
+    cast = None
+    rendered = 0
+
+    try:
+        while True:
+            job = farm.claim(worker, cast)
+            if job is None:
+                if wait or farm.unfinished():
+                    # Other workers' leases may yet expire, or new casts arrive.
+                    time.sleep(POLL_INTERVAL)
+                    continue
+                break
+
+            if not quiet and cast is not None and job['cast_name'] != cast:
+                print(f"{worker} stealing from {job['cast_name']}", file=sys.stderr)
+            cast = job['cast_name']
+
+            path = farm.segment_path(job['cast_name'], job['seq'])
+            heartbeat = Heartbeat(root, job, worker, lease)
+            heartbeat.start()
+            try:
+                render(job, path)
+            except Exception as e:
+                heartbeat.stop()
+                farm.fail(job, worker, '%s: %s' % (type(e).__name__, e))
+                print(f"{worker} failed {job['cast_name']}/{job['seq']}: {e}", file=sys.stderr)
+                continue
+
+            heartbeat.stop()
+            if heartbeat.lost:
+                # Another worker took the job over; its result will be recorded instead.
+                continue
+
+            farm.complete(job, worker, path)
+            rendered += 1
+            if not quiet:
+                print(f"{worker} rendered {job['cast_name']}/{job['seq']}", file=sys.stderr)
+    finally:
+        farm.close()
+
+    return rendered
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="diffcast-farm", description='Render casts across a pool of workers.'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    submit = commands.add_parser('submit', help='Queue the transitions of a cast.')
+    submit.add_argument('root', help='Shared farm directory.')
+    submit.add_argument('cast', help='Name of the cast.')
+    submit.add_argument('files', metavar='N', nargs='+', help='The series of files to apply.')
+    submit.add_argument('--display', choices=DISPLAY_SIZES, default='hd', help='Output size.')
+    submit.add_argument('--speed', type=float, default=1.0, help='Playback speed multiplier.')
+
+    worker = commands.add_parser('work', help='Run workers until the queue is empty.')
+    worker.add_argument('root', help='Shared farm directory.')
+    worker.add_argument('--processes', type=int, default=1, help='Local worker processes.')
+    worker.add_argument('--lease', type=float, default=LEASE, help='Job lease in seconds.')
+    worker.add_argument('--wait', action='store_true', help='Keep polling for new jobs.')
+    worker.add_argument('--quiet', action='store_true', help="Don't log each job.")
+
+    status = commands.add_parser('status', help='Show the state of the queue.')
+    status.add_argument('root', help='Shared farm directory.')
+    status.add_argument('cast', nargs='?', help='List the segments of a cast.')
+
+    args = parser.parse_args()
+
+    if args.command == 'submit':
+        farm = Farm(args.root)
+        print(f"Queued {farm.submit(args.cast, args.files, args.display, args.speed)} jobs")
+        farm.close()
+
+    elif args.command == 'work':
+        work_args = (args.root, args.lease, args.wait, args.quiet)
+        processes = [
+            multiprocessing.Process(target=work, args=work_args) for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+    elif args.command == 'status':
+        farm = Farm(args.root)
+        if args.cast:
+            for seq, state, output in farm.segments(args.cast):
+                print('%4d %-8s %s' % (seq, state, output or ''))
+        else:
+            for state, count in sorted(farm.counts().items()):
+                print('%-8s %d' % (state, count))
+        farm.close()
+
+
+if __name__ == '__main__':
+    main()
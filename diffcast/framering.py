@@ -0,0 +1,176 @@
+"""
+Hand rendered frames to an encoder process through shared memory.
+
+Frames live in a fixed ring of slots in one shared memory block. The renderer draws
+straight into a free slot, and only the slot and a sequence number go down a pipe to
+the encoder, which reads the pixels where they are. The encoder sends each sequence
+number back once it's done with that frame, freeing its slot, and the renderer waits
+for a free slot when all are in use, so a slow encoder holds rendering back rather than
+letting frames pile up. Rendering and encoding overlap on two cores, with nothing
+copied through pipes or allocated per frame.
+"""
+import multiprocessing
+import os
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Room for the renderer's pending and next frames, the encoder's last and current
+# ones, and a few more to absorb differences in pace.
+SLOTS = 8
+
+
+class EncoderError(Exception):
+    pass
+
+
+class FrameRing:
+    """
+    Slots for frames of shape, shared by one renderer and one encoder process.
+
+    The renderer takes slots with buffer() and sends them with put(), or hands them
+    back unsent with discard(). The encoder reads them from frames().
+    """
+
+    def __init__(self, shape, slots=SLOTS):
+        self.shape = shape
+        self.slots = slots
+        self.size = shape[0] * shape[1] * 4
+        self.shm = shared_memory.SharedMemory(create=True, size=self.size * slots)
+        self.name = self.shm.name
+        self.owner = os.getpid()
+
+        # Frames go one way, released sequence numbers and finally the result the other.
+        self._incoming, self._outgoing = multiprocessing.Pipe(duplex=False)
+        self._released, self._release = multiprocessing.Pipe(duplex=False)
+
+        self.sequence = 0
+        self._free = deque(range(slots))
+        self._sent = {}  # sequence number to slot, until released.
+        self._attach()
+
+    def _attach(self):
+        self.views = [
+            np.ndarray(self.shape, np.uint32, self.shm.buf, n * self.size)
+            for n in range(self.slots)
+        ]
+        self._slots = {id(view): n for n, view in enumerate(self.views)}
+
+    def __getstate__(self):
+        # Started processes attach to the block by name.
+        state = self.__dict__.copy()
+        for key in ('shm', 'views', '_slots'):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(self.name)
+        self._attach()
+
+    def started(self):
+        """ Close the encoder's ends of the pipes here, once it's started, to notice it exit. """
+        self._incoming.close()
+        self._release.close()
+
+    def buffer(self):
+        """ A free slot to render into, waiting for the encoder to release one if need be. """
+        while not self._free:
+            message = self._receive()
+            self._free.append(self._sent.pop(message))
+        return self.views[self._free.popleft()]
+
+    def discard(self, frame):
+        """ Hand back a slot from buffer() without sending it. """
+        self._free.append(self._slots[id(frame)])
+
+    def put(self, frame, meta):
+        """ Send a slot from buffer() to the encoder, with meta. """
+        slot = self._slots[id(frame)]
+        self._sent[self.sequence] = slot
+        self._send((self.sequence, slot, meta))
+        self.sequence += 1
+
+    def finish(self):
+        """ Tell the encoder there are no more frames, and return the result it sends back. """
+        self._send(None)
+        while True:
+            message = self._receive()
+            if not isinstance(message, int):
+                return message[0]
+
+    def _send(self, message):
+        try:
+            self._outgoing.send(message)
+        except BrokenPipeError:
+            raise EncoderError('The encoder process exited early') from None
+
+    def _receive(self):
+        try:
+            return self._released.recv()
+        except EOFError:
+            raise EncoderError('The encoder process exited early') from None
+
+    def frames(self, keep=0):
+        """
+        In the encoder, generate (meta, frame) for each frame sent, releasing each once
+        keep more have been generated, or at the end.
+        """
+        unreleased = deque()
+        while True:
+            # Release before waiting, or the renderer may be waiting too.
+            while len(unreleased) > keep:
+                self._release.send(unreleased.popleft())
+            message = self._incoming.recv()
+            if message is None:
+                break
+            sequence, slot, meta = message
+            unreleased.append(sequence)
+            yield meta, self.views[slot]
+
+    def done(self, result=None):
+        """ In the encoder, send result back to finish(). """
+        self._release.send((result,))
+
+    def close(self):
+        # Unlinked first, so the block goes even if a frame is still referenced.
+        if os.getpid() == self.owner:
+            self.shm.unlink()
+        self.views = self._slots = None
+        self.shm.close()
+
+
+class EncoderProcess:
+    """
+    Run target(ring, *args) in a process, as a context manager giving the renderer the
+    FrameRing of frames of shape to feed it.
+    """
+
+    def __init__(self, shape, target, args=(), slots=SLOTS):
+        self.ring = FrameRing(shape, slots)
+        self.process = multiprocessing.Process(target=target, args=(self.ring,) + tuple(args))
+
+    def __enter__(self):
+        self.process.start()
+        self.ring.started()
+        return self.ring
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.process.join()
+        else:
+            self.process.terminate()
+            self.process.join()
+        self.ring.close()
+        if exc_type is None and self.process.exitcode:
+            raise EncoderError('The encoder process failed, exit code %d' % self.process.exitcode)
+
+
+def add_arguments(parser):
+    """ Add the encoder process option to an argparse parser. """
+    parser.add_argument(
+        '--encoder-process',
+        action='store_true',
+        help='Encode in a second process, passing frames through shared memory.',
+    )
@@ -0,0 +1,185 @@
+"""
+Render a cast to frames for the image and video exporters.
+
+Frames are (height, width) uint32 NumPy arrays of 0xffRRGGBB pixels, so whole frames
+and regions of them compare as one value per pixel. They are grabbed from an offscreen
+Editor sized to the display, showing what the viewer shows without its window border
+or scrollbar.
+
+A frame is only rendered when an op changes something on screen, and held for as long
+as nothing does, so the cost follows the number of edits rather than the duration.
+"""
+import os
+
+import numpy as np
+
+from planner import OP_COMPLETE, OP_OPEN, OP_STEP, apply
+
+# Drafts are rendered this many times smaller, and change at most this often.
+DRAFT_SCALE = 2
+DRAFT_MIN_DELAY = 0.1
+
+
+class WidgetRenderer:
+    """ Render buffers through an Editor widget on Qt's offscreen platform. """
+
+    def __init__(self, width, height):
+        # Imported here so the exporters can be imported without Qt.
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt6.Qsci import QsciScintilla
+        from PyQt6.QtGui import QImage
+        from PyQt6.QtWidgets import QApplication, QFrame
+
+        from viewer import Editor
+
+        self.app = QApplication.instance() or QApplication([])
+        self.format = QImage.Format.Format_RGB32
+
+        self.editor = Editor()
+        self.editor.setFrameShape(QFrame.Shape.NoFrame)
+        self.editor.SendScintilla(QsciScintilla.SCI_SETVSCROLLBAR, 0)
+        # Draw the caret without focus, and never blink it off.
+        self.editor.SendScintilla(QsciScintilla.SCI_SETFOCUS, 1)
+        self.editor.SendScintilla(QsciScintilla.SCI_SETCARETPERIOD, 0)
+        self.editor.resize(width, height)
+        self.editor.show()
+        self.app.processEvents()
+
+        self.width = width
+        self.height = height
+        self.rows = self.editor.SendScintilla(QsciScintilla.SCI_LINESONSCREEN)
+        self.rendered = 0
+
+    def first_visible_line(self, line):
+        # Follow CodeViewer.update_editor_caret, Scintilla stops at the end itself.
+        return max(line - (self.rows // 2), 0)
+
+    def render(self, lines, line, col, out=None):
+        """ The frame showing lines with the caret at (line, col), drawn into out if given. """
+        self.rendered += 1
+        self.editor.setText(''.join(lines))
+        self.editor.setCursorPosition(line, col)
+        self.editor.setFirstVisibleLine(self.first_visible_line(line))
+
+        image = self.editor.viewport().grab().toImage().convertToFormat(self.format)
+        pixels = np.frombuffer(image.constBits().asstring(image.sizeInBytes()), np.uint32)
+        # Rows may be padded, and the image is reused by Qt, so copy out.
+        stride = image.bytesPerLine() // 4
+        pixels = pixels.reshape(image.height(), stride)[:, : image.width()]
+        if out is None:
+            return pixels.copy()
+        np.copyto(out, pixels)
+        return out
+
+
+def create_renderer(width, height, raster=False, draft=False):
+    """
+    A WidgetRenderer, or with raster the Qt-free RasterRenderer. A draft renderer is a
+    RasterRenderer scaled down by DRAFT_SCALE.
+    """
+    if raster or draft:
+        from raster import RasterRenderer  # Which uses our helpers.
+
+        if draft:
+            return RasterRenderer.draft(width, height, DRAFT_SCALE)
+        return RasterRenderer(width, height)
+    return WidgetRenderer(width, height)
+
+
+def add_renderer_arguments(parser):
+    """ Add the renderer options to an argparse parser. """
+    parser.add_argument(
+        '--raster',
+        action='store_true',
+        help="Render from a cached glyph atlas, without Qt's offscreen platform.",
+    )
+    parser.add_argument(
+        '--draft',
+        action='store_true',
+        help='Quick preview for review: half size, plain text, at most 10 frames a second.',
+    )
+
+
+def line_count(lines):
+    """ The lines Scintilla shows for lines, counting the empty one after a final newline. """
+    return len(lines) + (not lines or lines[-1].endswith('\n'))
+
+
+def first_visible_line(lines, line, rows):
+    # As Scintilla scrolls, centering the caret line but stopping at the end.
+    return max(min(line - (rows // 2), line_count(lines) - rows), 0)
+
+
+def view(lines, line, col, rows):
+    """ Everything on a screen of rows showing lines with the caret at (line, col). """
+    first = first_visible_line(lines, line, rows)
+    # Including the partly shown row at the bottom.
+    return first, line, col, lines[first : first + rows + 1]
+
+
+def changes(ops, rows, speed=1.0):
+    """
+    Play ops, generating (time, op index, lines, line, col) after each op that changes
+    the view of a screen of rows, then (time, None, lines, None, None) at the end.
+    """
+    lines = []
+    shown = None
+    t = 0
+    for n, op in enumerate(ops):
+        t += op.delay / speed
+        if op.kind in (OP_STEP, OP_COMPLETE, OP_OPEN):
+            continue
+
+        apply(lines, op)
+        line, col = op.caret
+        current = view(lines, line, col, rows)
+        # Edits above the screen can restyle it, e.g. opening a triple-quoted string.
+        if current == shown and op.line >= current[0]:
+            continue
+
+        shown = current
+        yield t, n, lines, line, col
+    yield t, None, lines, None, None
+
+
+def frames(ops, renderer, speed=1.0, buffer=None):
+    """
+    Play ops, generating (time, frame) after each op that changes the view, then
+    (time, None) at the end of the cast. Each frame is drawn into buffer() if given.
+    """
+    for t, n, lines, line, col in changes(ops, renderer.rows, speed):
+        if n is None:
+            yield t, None
+        else:
+            yield t, renderer.render(lines, line, col, buffer() if buffer else None)
+
+
+def held(frames, hold=0, min_delay=0, discard=None):
+    """
+    Collapse timed frames into (start, duration, frame) for each change on screen, the
+    last held for hold. Frames due to be replaced within min_delay are skipped, and
+    each frame dropped is passed to discard if given.
+    """
+    pending = None  # (start, frame) until we know how long it's shown.
+    for t, frame in frames:
+        if frame is None:
+            break
+
+        if pending is not None:
+            start, previous = pending
+            if t - start < min_delay:
+                # Too quick to show, the next frame takes its place.
+                if discard:
+                    discard(previous)
+                pending = start, frame
+                continue
+            if np.array_equal(previous, frame):
+                if discard:
+                    discard(frame)
+                continue  # Nothing visible changed, keep holding.
+            yield start, t - start, previous
+        pending = t, frame
+
+    if pending is not None:
+        start, previous = pending
+        yield start, t + hold - start, previous
@@ -0,0 +1,148 @@
+"""
+Casts straight from git history: one step per commit touching a file.
+
+Blobs are read through a single persistent `git cat-file --batch` process and handed
+to the planner in memory, so nothing is checked out and only two git processes are
+started however many commits there are.
+
+    python gitsource.py cast.dctl path/to/repo src/app.py v1.0..main
+"""
+import argparse
+import io
+import os
+import subprocess
+from collections import namedtuple
+
+from planner import DiffPlanner
+
+
+class GitError(Exception):
+    pass
+
+
+# A file as of a commit, used in place of a path in a planner's (fid, path) files.
+Revision = namedtuple('Revision', ['repo', 'rev', 'path'])
+
+
+def git(repo, *args):
+    result = subprocess.run(
+        ['git', '-C', repo] + list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if result.returncode:
+        raise GitError(result.stderr.decode(errors='replace').strip())
+    return result.stdout.decode()
+
+
+def repo_path(repo, path):
+    """ The path of a file relative to the top of the repository, with forward slashes. """
+    if os.path.isabs(path):
+        top = git(repo, 'rev-parse', '--show-toplevel').strip()
+        path = os.path.relpath(path, top)
+    return path.replace(os.sep, '/')
+
+
+def revisions(repo, path, rev_range='HEAD'):
+    """ List (Revision, subject) for each commit in rev_range touching path, oldest first. """
+    path = repo_path(repo, path)
+    log = git(repo, 'log', '--reverse', '--format=%H%x00%s', rev_range, '--', path)
+    result = []
+    for entry in log.splitlines():
+        sha, subject = entry.split('\0', 1)
+        result.append((Revision(repo, sha, path), subject))
+    return result
+
+
+class BlobReader:
+    """ Read blobs through one long-running `git cat-file --batch`. """
+
+    def __init__(self, repo):
+        self.process = subprocess.Popen(
+            ['git', '-C', repo, 'cat-file', '--batch'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def read(self, rev, path):
+        """ The contents of path at rev as bytes, or None if it doesn't exist there. """
+        self.process.stdin.write(('%s:%s\n' % (rev, path)).encode())
+        self.process.stdin.flush()
+
+        header = self.process.stdout.readline().split()
+        if not header:
+            raise GitError('git cat-file exited')
+        # The object name echoed back may contain spaces, the status never does.
+        if header[-1] == b'missing':
+            return None
+        if len(header) != 3:
+            raise GitError('%s:%s: %s' % (rev, path, header[-1].decode()))
+
+        _, kind, size = header
+        if kind != b'blob':
+            raise GitError('%s:%s is a %s' % (rev, path, kind.decode()))
+
+        data = self.process.stdout.read(int(size) + 1)  # Followed by a newline.
+        return data[:-1]
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+class GitPlanner(DiffPlanner):
+    """ Plan a list of (fid, Revision) files, reading the blobs from git. """
+
+    def __init__(self, files):
+        for _, path in files:
+            if path is not None and not isinstance(path, Revision):
+                raise GitError("Can't mix files and git revisions in one cast: %s" % path)
+        super().__init__(files)
+        self.readers = {}
+
+    def load_file_or_empty(self, revision):
+        if revision is None:
+            return []
+
+        reader = self.readers.get(revision.repo)
+        if reader is None:
+            reader = self.readers[revision.repo] = BlobReader(revision.repo)
+
+        data = reader.read(revision.rev, revision.path)
+        if data is None:
+            return []  # Deleted, or not yet created.
+        # Universal newlines, as readlines() on the checked out file would give.
+        return io.StringIO(data.decode('utf-8'), newline=None).readlines()
+
+    def ops(self):
+        try:
+            yield from super().ops()
+        finally:
+            for reader in self.readers.values():
+                reader.close()
+            self.readers.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="diffcast-git", description='Plan the history of a file in git into a timeline.'
+    )
+    parser.add_argument('output_file', help='Output timeline file.')
+    parser.add_argument('repo', help='Path to the git repository.')
+    parser.add_argument('path', help='File to follow, relative to the repository.')
+    parser.add_argument(
+        'range', nargs='?', default='HEAD', help='Commits to include, e.g. v1.0..main.'
+    )
+
+    args = parser.parse_args()
+
+    from timeline import write_timeline  # timeline imports us, via project.
+
+    files = [(rev.rev, rev) for rev, _ in revisions(args.repo, args.path, args.range)]
+    if not files:
+        parser.error(f"No commits touch {args.path} in {args.range}")
+
+    write_timeline(args.output_file, GitPlanner(files).ops())
+    print(f"Wrote {len(files)} commits to {args.output_file}")
+
+
+if __name__ == '__main__':
+    main()
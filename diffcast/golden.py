@@ -0,0 +1,227 @@
+"""
+Check casts still render as they did, against golden hashes of their frames.
+
+Recording renders each cast headlessly and stores, for every frame that changes the
+screen (or every Nth with --every), the op it follows and two hashes: an exact one of
+the pixels, and a perceptual one of which cells of a coarse grid hold text, which only
+moves a bit or two for antialiasing or hinting differences. Checking renders the casts
+again across a process pool and reports the first frame of each to differ, and the op
+that drew it, after a Qt or QScintilla upgrade or a change to the Editor styles.
+
+    python golden.py record golden.json 'demos/demo*.py' tutorials/*/ cast.dctl
+    python golden.py check golden.json
+
+Each cast is a timeline file, or a glob or directory of step files as verify.py takes
+them. A check fails on frames that look different, or with --exact on any change.
+Exits with status 1 if any cast fails.
+"""
+import argparse
+import hashlib
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from frames import add_renderer_arguments, changes, create_renderer
+from styles import DISPLAY_SIZES
+from timeline import is_timeline, load_ops
+from verify import cast_steps, describe
+
+GOLDEN_VERSION = 2
+
+# The perceptual hash has a bit for each cell of a HASH_ROWS by HASH_COLS grid over the
+# frame, set where the cell's mean difference from the background is over INK, and
+# frames whose hashes differ in at most TOLERANCE bits look the same. It looks at every
+# HASH_STEP-th pixel across and down, which still samples every glyph.
+HASH_ROWS = 18
+HASH_COLS = 32
+HASH_STEP = 2
+INK = 4
+TOLERANCE = 2
+
+_renderers = {}  # One per worker process and settings, the widget one needs a QApplication.
+
+
+def exact_hash(frame):
+    return hashlib.sha1(frame.tobytes()).hexdigest()[:16]
+
+
+def perceptual_hash(frame):
+    """ Which cells of a grid over frame hold text, or anything else off the background. """
+    pixels = frame[::HASH_STEP, ::HASH_STEP]
+    gray = ((pixels >> 16 & 0xFF) * 77 + (pixels >> 8 & 0xFF) * 150 + (pixels & 0xFF) * 29) >> 8
+    # The background is the commonest shade, in a sparse sample.
+    background = np.bincount(gray[::8, ::8].ravel()).argmax()
+    ink = np.abs(gray.astype(np.int32) - background)
+
+    rows, cols = HASH_ROWS, HASH_COLS
+    height, width = gray.shape[0] // rows, gray.shape[1] // cols
+    cells = ink[: height * rows, : width * cols].reshape(rows, height, cols, width).sum((1, 3))
+    return np.packbits(cells > INK * height * width).tobytes().hex()
+
+
+def distance(a, b):
+    """ The number of bits two perceptual hashes differ in. """
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def cast_ops(spec):
+    if is_timeline(spec):
+        return load_ops([spec])
+    steps = cast_steps(spec)
+    if not steps:
+        raise ValueError('%s: no steps found' % spec)
+    return load_ops(steps)
+
+
+def hashes(ops, renderer, every=1):
+    """
+    Play ops as frames() does, generating (op index, time, exact, perceptual) for every
+    every-th frame that changes the screen. Frames in between are never rendered.
+    """
+    count = 0
+    for t, n, lines, line, col in changes(ops, renderer.rows):
+        if n is None:
+            return
+        if count % every == 0:
+            frame = renderer.render(lines, line, col)
+            yield n, round(t, 3), exact_hash(frame), perceptual_hash(frame)
+        count += 1
+
+
+def record(job):
+    """ The hashed frames of one cast, from a (spec, settings) job. """
+    spec, settings = job
+    key = (settings['display'], settings['raster'], settings['draft'])
+    if key not in _renderers:
+        width, height = DISPLAY_SIZES[settings['display']]
+        _renderers[key] = create_renderer(width, height, settings['raster'], settings['draft'])
+    return list(hashes(cast_ops(spec), _renderers[key], settings['every']))
+
+
+def compare(spec, golden, current, exact=False):
+    """ Compare the recorded and current frames of a cast, returning None or the failure. """
+    ops = None
+    for n, (want, got) in enumerate(zip(golden, current)):
+        if want[0] != got[0]:
+            reason = 'op %d drew it, recorded after op %d' % (got[0], want[0])
+        elif exact and want[2] != got[2]:
+            reason = 'pixels differ, hash distance %d' % distance(want[3], got[3])
+        elif distance(want[3], got[3]) > TOLERANCE:
+            reason = 'looks different, hash distance %d' % distance(want[3], got[3])
+        else:
+            continue
+
+        if ops is None:
+            ops = list(cast_ops(spec))
+        return '%s: frame %d at %.2fs after %s, %s' % (
+            spec,
+            n,
+            got[1],
+            describe(got[0], ops[got[0]]),
+            reason,
+        )
+
+    if len(golden) != len(current):
+        return '%s: %d frames, %d recorded' % (spec, len(current), len(golden))
+    return None
+
+
+def versions():
+    """ The versions the widget renderer's output depends on. """
+    from PyQt6.Qsci import QSCINTILLA_VERSION_STR
+    from PyQt6.QtCore import PYQT_VERSION_STR, QT_VERSION_STR
+
+    return {'qt': QT_VERSION_STR, 'pyqt': PYQT_VERSION_STR, 'qscintilla': QSCINTILLA_VERSION_STR}
+
+
+def render_all(specs, settings, processes):
+    with ProcessPoolExecutor(processes) as pool:
+        return dict(zip(specs, pool.map(record, [(spec, settings) for spec in specs])))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="diffcast-golden", description='Check casts render as they did when recorded.'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    recorder = commands.add_parser('record', help='Render casts and store their frame hashes.')
+    recorder.add_argument('--processes', type=int, help='Worker processes, default one per CPU.')
+    recorder.add_argument('golden', help='The golden hashes file to write.')
+    recorder.add_argument('casts', nargs='+', help='Timeline files, globs or directories.')
+    recorder.add_argument('--display', choices=DISPLAY_SIZES, default='hd', help='Output size.')
+    recorder.add_argument(
+        '--every', type=int, default=1, help='Keep every Nth changed frame, default all.'
+    )
+    add_renderer_arguments(recorder)
+
+    checker = commands.add_parser('check', help='Render casts again and compare their hashes.')
+    checker.add_argument('--processes', type=int, help='Worker processes, default one per CPU.')
+    checker.add_argument('golden', help='The golden hashes file to check against.')
+    checker.add_argument('casts', nargs='*', help='Check only these of the recorded casts.')
+    checker.add_argument(
+        '--exact', action='store_true', help='Fail on any change, not just visible ones.'
+    )
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+
+    if args.command == 'record':
+        settings = {
+            'display': args.display,
+            'raster': args.raster,
+            'draft': args.draft,
+            'every': max(args.every, 1),
+        }
+        casts = render_all(args.casts, settings, args.processes)
+        with open(args.golden, 'w') as f:
+            # A cast a line, to diff well under version control.
+            f.write(
+                '{"version": %d, "versions": %s, "settings": %s, "casts": {\n'
+                % (GOLDEN_VERSION, json.dumps(versions()), json.dumps(settings))
+            )
+            f.write(',\n'.join('%s: %s' % (json.dumps(s), json.dumps(c)) for s, c in casts.items()))
+            f.write('\n}}\n')
+        print(
+            '%d casts, %d frames recorded in %.2fs'
+            % (len(casts), sum(map(len, casts.values())), time.perf_counter() - start)
+        )
+        return
+
+    with open(args.golden) as f:
+        golden = json.load(f)
+    if golden.get('version') != GOLDEN_VERSION:
+        parser.error('%s: unsupported golden file version' % args.golden)
+    unknown = [spec for spec in args.casts if spec not in golden['casts']]
+    if unknown:
+        parser.error('Not recorded: %s' % ', '.join(unknown))
+
+    specs = args.casts or list(golden['casts'])
+    casts = render_all(specs, golden['settings'], args.processes)
+    failures = [
+        f
+        for f in (compare(spec, golden['casts'][spec], casts[spec], args.exact) for spec in specs)
+        if f is not None
+    ]
+
+    if failures and golden['versions'] != versions():
+        print('Recorded with %s, now %s' % (golden['versions'], versions()))
+    for failure in failures:
+        print('FAIL ' + failure)
+    print(
+        '%d casts, %d frames, %d failed in %.2fs'
+        % (
+            len(specs),
+            sum(map(len, casts.values())),
+            len(failures),
+            time.perf_counter() - start,
+        )
+    )
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Qt-free Python syntax highlighting, using the QsciLexerPython style numbers.
+
+Like Scintilla the lexer works a line at a time, carrying open triple-quoted strings
+over to the following line as state. Results are cached on (state, line) so restyling
+a buffer after an edit only lexes the lines that changed.
+"""
+import re
+
+from styles import HIGHLIGHTED_IDENTIFIERS, KEYWORDS
+
+STYLE_DEFAULT = 0
+STYLE_COMMENT = 1
+STYLE_NUMBER = 2
+STYLE_DOUBLE_STRING = 3
+STYLE_SINGLE_STRING = 4
+STYLE_KEYWORD = 5
+STYLE_TRIPLE_SINGLE_STRING = 6
+STYLE_TRIPLE_DOUBLE_STRING = 7
+STYLE_CLASS_NAME = 8
+STYLE_FUNCTION_NAME = 9
+STYLE_OPERATOR = 10
+STYLE_IDENTIFIER = 11
+STYLE_COMMENT_BLOCK = 12
+STYLE_UNCLOSED_STRING = 13
+STYLE_HIGHLIGHTED_IDENTIFIER = 14
+STYLE_DECORATOR = 15
+STYLE_DOUBLE_FSTRING = 16
+STYLE_SINGLE_FSTRING = 17
+STYLE_TRIPLE_SINGLE_FSTRING = 18
+STYLE_TRIPLE_DOUBLE_FSTRING = 19
+
+# (quote, is f-string) to style.
+STRING_STYLES = {
+    ("'", False): STYLE_SINGLE_STRING,
+    ('"', False): STYLE_DOUBLE_STRING,
+    ("'''", False): STYLE_TRIPLE_SINGLE_STRING,
+    ('"""', False): STYLE_TRIPLE_DOUBLE_STRING,
+    ("'", True): STYLE_SINGLE_FSTRING,
+    ('"', True): STYLE_DOUBLE_FSTRING,
+    ("'''", True): STYLE_TRIPLE_SINGLE_FSTRING,
+    ('"""', True): STYLE_TRIPLE_DOUBLE_FSTRING,
+}
+
+KEYWORD_SET = frozenset(KEYWORDS.split())
+HIGHLIGHTED_SET = frozenset(HIGHLIGHTED_IDENTIFIERS.split())
+
+TOKEN_RE = re.compile(
+    r"""
+      (?P<ws>\s+)
+    | (?P<comment>\#.*)
+    | (?P<string>(?P<prefix>[rRbBuUfF]{0,2})(?P<quote>'''|\"\"\"|'|\"))
+    | (?P<number>(?:0[xXoObB][0-9a-fA-F_]+|(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d+)?)[jJ]?)
+    | (?P<name>[^\W\d]\w*)
+    | (?P<decorator>@[^\W\d][\w.]*)
+    | (?P<op>.)
+    """,
+    re.VERBOSE,
+)
+
+STRING_END_RE = {
+    "'": re.compile(r"(?:[^\\'\n]|\\.)*'"),
+    '"': re.compile(r'(?:[^\\"\n]|\\.)*"'),
+    "'''": re.compile(r"(?:[^\\]|\\.)*?'''", re.DOTALL),
+    '"""': re.compile(r'(?:[^\\]|\\.)*?"""', re.DOTALL),
+}
+
+
+def lex_line(line, state=None):
+    """
+    Style a single line, returning a tuple of (style, text) runs and the state for
+    the following line. State is None, or the (quote, style) of an open triple string.
+    """
+    runs = []
+
+    def add(style, text):
+        if runs and runs[-1][0] == style:
+            runs[-1] = (style, runs[-1][1] + text)
+        elif text:
+            runs.append((style, text))
+
+    line = line.rstrip('\n')
+    pos = 0
+
+    if state is not None:
+        quote, style = state
+        m = STRING_END_RE[quote].match(line)
+        if m is None:
+            add(style, line)
+            return tuple(runs), state
+        add(style, m.group())
+        pos = m.end()
+        state = None
+
+    previous = None  # last keyword, to spot def/class names.
+    while pos < len(line):
+        m = TOKEN_RE.match(line, pos)
+        kind = m.lastgroup
+        text = m.group()
+        pos = m.end()
+
+        if kind == 'ws':
+            add(STYLE_DEFAULT, text)
+            continue
+
+        if kind == 'comment':
+            add(STYLE_COMMENT_BLOCK if text.startswith('##') else STYLE_COMMENT, text)
+
+        elif kind in ('prefix', 'quote', 'string'):
+            quote = m.group('quote')
+            style = STRING_STYLES[quote, 'f' in m.group('prefix').lower()]
+            end = STRING_END_RE[quote].match(line, pos)
+            if end is not None:
+                add(style, text + end.group())
+                pos = end.end()
+            elif len(quote) == 3:
+                add(style, line[m.start() :])
+                state = (quote, style)
+                pos = len(line)
+            else:
+                add(STYLE_UNCLOSED_STRING, line[m.start() :])
+                pos = len(line)
+
+        elif kind == 'number':
+            add(STYLE_NUMBER, text)
+
+        elif kind == 'name':
+            if text in KEYWORD_SET:
+                add(STYLE_KEYWORD, text)
+            elif text in HIGHLIGHTED_SET:
+                add(STYLE_HIGHLIGHTED_IDENTIFIER, text)
+            elif previous == 'def':
+                add(STYLE_FUNCTION_NAME, text)
+            elif previous == 'class':
+                add(STYLE_CLASS_NAME, text)
+            else:
+                add(STYLE_IDENTIFIER, text)
+
+        elif kind == 'decorator':
+            add(STYLE_DECORATOR, text)
+
+        else:
+            add(STYLE_OPERATOR, text)
+
+        previous = text
+
+    return tuple(runs), state
+
+
+class Highlighter:
+    """ Style whole buffers, re-lexing only lines not seen before in the same state. """
+
+    max_cache = 100000
+
+    def __init__(self):
+        self._cache = {}
+        self.lookups = 0
+        self.misses = 0
+
+    def stats(self):
+        """ Cache (hits, misses) so far. """
+        return self.lookups - self.misses, self.misses
+
+    def highlight(self, lines, stop=None):
+        """ Return the runs for each line of lines, up to (not including) stop. """
+        cache = self._cache
+        if len(cache) > self.max_cache:
+            cache.clear()
+
+        styled = []
+        state = None
+        for line in lines[:stop]:
+            key = (state, line)
+            result = cache.get(key)
+            if result is None:
+                result = cache[key] = lex_line(line, state)
+                self.misses += 1
+            runs, state = result
+            styled.append(runs)
+
+        self.lookups += len(styled)
+        return styled
+
+
+class PlainHighlighter:
+    """ A Highlighter for drafts, leaving every line in the default style. """
+
+    def stats(self):
+        return 0, 0
+
+    def highlight(self, lines, stop=None):
+        """ Return the runs for each line of lines, up to (not including) stop. """
+        return [((STYLE_DEFAULT, line),) for line in lines[:stop]]
@@ -0,0 +1,163 @@
+"""
+Machine-readable metrics for batch and headless runs.
+
+Written as a Prometheus textfile-collector file (for node_exporter's
+--collector.textfile.directory) and/or a JSON summary. Both are written atomically,
+so a collector never reads a half-written file.
+"""
+import json
+import os
+import sys
+import time
+
+from planner import OP_COMPLETE, OP_STEP
+
+try:
+    import resource
+except ImportError:  # Windows.
+    resource = None
+
+
+def max_rss():
+    """ Peak resident set size of this process in bytes, or None if unavailable. """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _write_atomic(path, text):
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+    return '{%s}' % ','.join(pairs)
+
+
+class Metrics:
+    def __init__(self, job, cast=None):
+        self.job = job
+        self.cast = cast
+        self.started = time.time()
+        self._start = time.perf_counter()
+
+        self.ops = 0
+        self.frames = 0
+        self.timers = {}
+        self.caches = {}
+        self.transitions = []
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def add_timers(self, timers):
+        """ Add timings made elsewhere, e.g. in a worker process. """
+        for name, seconds in timers.items():
+            self.timers[name] = self.timers.get(name, 0) + seconds
+
+    def cache(self, name, hits, misses):
+        self.caches[name] = (hits, misses)
+
+    def track(self, ops):
+        """ Pass ops through, counting them and timing each transition as it's consumed. """
+        start = None
+        for op in ops:
+            if op.kind == OP_STEP:
+                start = time.perf_counter()
+            self.ops += 1
+            yield op
+            if op.kind == OP_COMPLETE and start is not None:
+                self.transitions.append((op.text, time.perf_counter() - start))
+
+    def summary(self):
+        elapsed = time.perf_counter() - self._start
+        return {
+            'job': self.job,
+            'cast': self.cast,
+            'started': self.started,
+            'elapsed_seconds': elapsed,
+            'ops': self.ops,
+            'ops_per_second': self.ops / elapsed if elapsed else 0,
+            'frames': self.frames,
+            'frames_per_second': self.frames / elapsed if elapsed else 0,
+            'timers': self.timers,
+            'cache_hit_rates': {
+                name: hits / (hits + misses) if hits + misses else 0
+                for name, (hits, misses) in self.caches.items()
+            },
+            'transitions': [{'fid': fid, 'seconds': s} for fid, s in self.transitions],
+            'max_rss_bytes': max_rss(),
+        }
+
+    def prometheus(self):
+        s = self.summary()
+        base = [('job', self.job)] + ([('cast', self.cast)] if self.cast else [])
+        lines = []
+
+        def metric(name, kind, description, value, labels=()):
+            if value is None:
+                return
+            full = 'diffcast_' + name
+            if not any(line.startswith('# HELP %s ' % full) for line in lines):
+                lines.append('# HELP %s %s' % (full, description))
+                lines.append('# TYPE %s %s' % (full, kind))
+            lines.append('%s%s %s' % (full, _labels(base + list(labels)), repr(float(value))))
+
+        metric('elapsed_seconds', 'gauge', 'Wall time of the run.', s['elapsed_seconds'])
+        metric('ops_total', 'counter', 'Ops processed.', s['ops'])
+        metric('ops_per_second', 'gauge', 'Ops processed per second.', s['ops_per_second'])
+        metric('frames_total', 'counter', 'Frames rendered.', s['frames'])
+        metric('frames_per_second', 'gauge', 'Frames rendered per second.', s['frames_per_second'])
+        for name, seconds in s['timers'].items():
+            metric(
+                'phase_seconds', 'gauge', 'Time spent in each phase.', seconds, [('phase', name)]
+            )
+        for name, rate in s['cache_hit_rates'].items():
+            metric('cache_hit_ratio', 'gauge', 'Cache hit rate.', rate, [('cache', name)])
+        for n, t in enumerate(s['transitions']):
+            metric(
+                'transition_seconds',
+                'gauge',
+                'Time taken by each transition.',
+                t['seconds'],
+                [('transition', n), ('fid', t['fid'])],
+            )
+        metric('max_rss_bytes', 'gauge', 'Resident set size high-water mark.', s['max_rss_bytes'])
+        metric('last_run_timestamp_seconds', 'gauge', 'When the run started.', s['started'])
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, prometheus_path=None, json_path=None):
+        if prometheus_path:
+            _write_atomic(prometheus_path, self.prometheus())
+        if json_path:
+            _write_atomic(json_path, json.dumps(self.summary(), indent=2) + '\n')
+
+
+class _Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        timers = self.metrics.timers
+        timers[self.name] = timers.get(self.name, 0) + time.perf_counter() - self.start
+
+
+def add_arguments(parser):
+    """ Add the metrics output options to an argparse parser. """
+    parser.add_argument(
+        '--metrics-prom', metavar='PATH', help='Write Prometheus textfile-collector metrics.'
+    )
+    parser.add_argument('--metrics-json', metavar='PATH', help='Write a JSON metrics summary.')
@@ -0,0 +1,390 @@
+"""
+Plan the human-like edits between a series of files as a flat stream of operations.
+
+The planner has no Qt dependency and never sleeps: each operation carries the pause
+that precedes it. `DiffRunner` plays the stream back into the viewer in real time,
+exporters consume it as fast as they like.
+"""
+import difflib
+from collections import namedtuple
+
+INITIAL_SPEED = 3
+TYPING_SPEED = 0.05
+INSERT_SPEED = 1.5
+DELETE_SPEED = 0.5
+
+DIFF_NO_CHANGE = ' '
+DIFF_INSERTION = '+'
+DIFF_DELETION = '-'
+DIFF_COMMENT = '?'
+DIFF_EDIT = 'e'
+
+# Operation kinds. For the markers (step, complete) text holds the file id.
+OP_STEP = 'step'  # A new file transition starts.
+OP_LOAD = 'load'  # Replace the whole buffer with text.
+OP_COMPLETE = 'complete'  # The buffer now holds the completed file.
+OP_INSERT_LINE = 'insert_line'  # Insert text as a new line before line.
+OP_DELETE_LINE = 'delete_line'  # Delete line, text is the removed line.
+OP_INSERT = 'insert'  # Insert text into line at col.
+OP_DELETE = 'delete'  # Delete text from line at col.
+OP_INDENT = 'indent'  # Prefix col lines, starting at line, with text.
+OP_DEDENT = 'dedent'  # Strip len(text) chars from col lines, starting at line.
+OP_OPEN = 'open'  # Switch to the project file text, its contents follow as a load.
+
+
+def first_whitespace(s):
+    return len(s) - len(s.lstrip())
+
+
+def chunkify(lst, n):
+    lst = list(lst)
+    return [lst[i : i + n] for i in range(0, len(lst), n)]
+
+
+def parse_delta(dc):
+    return dc[0], dc[2:]
+
+
+def split_lines(text):
+    """ Split text into lines the way readlines() does, keeping the newlines. """
+    lines = [line + '\n' for line in text.split('\n')]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+class Op(namedtuple('Op', ['kind', 'line', 'col', 'text', 'delay'])):
+    __slots__ = ()
+
+    @property
+    def caret(self):
+        """ The (line, col) of the editor caret once this op is applied. """
+        if self.kind == OP_LOAD:
+            lines = split_lines(self.text)
+            last_line = len(lines) - 1
+            if last_line > 0:
+                return last_line, len(lines[last_line]) - 1
+            return last_line, 0
+
+        if self.kind == OP_INSERT:
+            return self.line, self.col + len(self.text)
+
+        if self.kind == OP_INSERT_LINE:
+            return self.line, len(self.text) - 1
+
+        if self.kind == OP_INDENT:
+            return self.line, len(self.text)
+
+        if self.kind == OP_DELETE:
+            return self.line, self.col
+
+        return self.line, 0
+
+
+def apply(lines, op):
+    """ Apply op to the list of lines, in place. """
+    kind, line, col, text, _ = op
+
+    if kind == OP_INSERT:
+        s = lines[line]
+        lines[line] = s[:col] + text + s[col:]
+
+    elif kind == OP_DELETE:
+        s = lines[line]
+        lines[line] = s[:col] + s[col + len(text) :]
+
+    elif kind == OP_INSERT_LINE:
+        lines.insert(line, text)
+
+    elif kind == OP_DELETE_LINE:
+        del lines[line]
+
+    elif kind == OP_INDENT:
+        for ln in range(line, line + col):
+            lines[ln] = text + lines[ln]
+
+    elif kind == OP_DEDENT:
+        n = len(text)
+        for ln in range(line, line + col):
+            lines[ln] = lines[ln][n:]
+
+    elif kind == OP_LOAD:
+        lines[:] = split_lines(text)
+
+
+def load_file_or_empty(filename):
+    if filename is None:
+        return []
+
+    with open(filename, 'r') as f1:
+        return f1.readlines()
+
+
+class DiffPlanner:
+    """
+    Turn a list of (fid, path) files into the ops that edit each file into the next.
+
+    `current` always holds the buffer as of the last op yielded.
+    """
+
+    def __init__(self, files):
+        # Store the current active text.
+        self.current = []
+        self.files = files
+        self._delay = 0
+
+    def pause(self, seconds):
+        self._delay += seconds
+
+    def _op(self, kind, line=0, col=0, text=''):
+        op = Op(kind, line, col, text, self._delay)
+        self._delay = 0
+        return op
+
+    def insert_line(self, line, diffline):
+        # Handle whitespace, using 4char tabs, then the remainder of the line.
+        ws = len(diffline) - len(diffline.lstrip())
+        tabs = ws // 4
+        ends = [n * 4 for n in range(tabs)] + list(range(tabs * 4, len(diffline))) or [0]
+
+        typed = 0
+        for n, end in enumerate(ends):
+            self.pause(TYPING_SPEED)
+            if n == 0:
+                self.current.insert(line, diffline[:end] + '\n')
+                yield self._op(OP_INSERT_LINE, line, 0, self.current[line])
+            else:
+                self.current[line] = diffline[:end] + '\n'
+                yield self._op(OP_INSERT, line, typed, diffline[typed:end])
+            typed = end
+
+    def _indent_line(self, line, nlines, nindents):
+        chunks = chunkify(range(0, nindents), 4)
+        for chunk in chunks:
+            n = len(chunk)
+            for ln in range(nlines):
+                self.current[line + ln] = (' ' * n) + self.current[line + ln]
+            self.pause(TYPING_SPEED)
+            yield self._op(OP_INDENT, line, nlines, ' ' * n)
+
+    def _dedent_line(self, line, nlines, ndedents):
+        chunks = chunkify(range(0, ndedents), 4)
+        for chunk in chunks:
+            n = len(chunk)
+            for ln in range(nlines):
+                self.current[line + ln] = self.current[line + ln][n:]
+            self.pause(TYPING_SPEED)
+            yield self._op(OP_DEDENT, line, nlines, ' ' * n)
+
+    def indent_line(self, line, diffline):
+        # diffline has our goal
+        current_line = self.current[line]
+
+        #  check for indent difference, bring indent up to level first.
+        cstart = first_whitespace(current_line)
+        dstart = first_whitespace(diffline)
+
+        # Fix indent differences if there are any.
+        yield from self._indent_line(line, 1, dstart - cstart)
+        yield from self._dedent_line(line, 1, cstart - dstart)
+
+    def block_indent(self, line, n_lines, dent):
+        if dent < 0:
+            yield from self._dedent_line(line, n_lines, abs(dent))
+        else:
+            yield from self._indent_line(line, n_lines, dent)
+
+    def edit_line(self, line, diffline):
+
+        # diffline has our goal
+        current_line = self.current[line]
+
+        # find common start, common end, rewrite the middle.
+        for n, (a, b) in enumerate(zip(current_line, diffline)):
+            starti = n
+            if a != b:
+                break
+
+        for n, (a, b) in enumerate(zip(current_line[::-1], diffline[::-1])):
+            endi = n
+            if a != b:
+                break
+
+        to_type_len = len(diffline) - (starti + endi)
+        if to_type_len < 0:
+            return
+
+        # The middle is removed in one go, then retyped. An overlapping common start
+        # and end (or no common end) makes the first step an insertion instead.
+        tail = len(current_line) - endi
+        self.current[line] = current_line[:starti] + current_line[-endi:]
+        self.pause(TYPING_SPEED)
+        if endi == 0:
+            yield self._op(OP_INSERT, line, starti, current_line[:starti])
+        elif starti <= tail:
+            yield self._op(OP_DELETE, line, starti, current_line[starti:tail])
+        else:
+            yield self._op(OP_INSERT, line, starti, current_line[tail:starti])
+
+        for n in range(1, to_type_len + 1):
+            self.current[line] = (
+                current_line[:starti] + diffline[starti : starti + n] + current_line[-endi:]
+            )
+            self.pause(TYPING_SPEED)
+            yield self._op(OP_INSERT, line, starti + n - 1, diffline[starti + n - 1])
+
+    def process_deltas(self, delta):
+        # Strip comments.
+        delta = [d for d in delta if d[0] != DIFF_COMMENT]
+
+        # Process DIFF_DELETION, DIFF_INSERTION into DIFF_EDIT
+        tdelta = []
+        tdl = 0
+        while tdl < len(delta):
+            cc1, _ = parse_delta(delta[tdl])
+            if tdl < len(delta) - 1:
+                cc2, _ = parse_delta(delta[tdl + 1])
+            else:
+                cc2 = None
+            if (cc1, cc2) == (DIFF_DELETION, DIFF_INSERTION):
+                deltast = delta[tdl + 1]
+                deltast = DIFF_EDIT + deltast[1:]
+                tdelta.append(deltast)
+                tdl += 2
+                continue
+            tdelta.append(delta[tdl])
+            tdl += 1
+
+        return tdelta
+
+    def load_file_or_empty(self, filename):
+        return load_file_or_empty(filename)
+
+    def ops(self):
+        """ Generate the ops for the whole series of files. """
+        (fid, initial_file), files = self.files[0], self.files[1:]
+
+        self.current = self.load_file_or_empty(initial_file)
+
+        yield self._op(OP_STEP, text=fid)
+        yield self._op(OP_LOAD, text=''.join(self.current))
+        yield self._op(OP_COMPLETE, text=fid)
+
+        for fid, file in files:
+            self.pause(INITIAL_SPEED)
+            yield self._op(OP_STEP, text=fid)
+
+            target = self.load_file_or_empty(file)
+            yield from self.transition(target)
+
+            # Emit the completed file edit.
+            yield self._op(OP_COMPLETE, text=fid)
+
+    def insert_trailing_blank(self, delta, dl, cl):
+        """
+        Look ahead for trailing whitespace lines after a series of inserts. Add the
+        trailing space early, then convert that edit in the delta list to a no change.
+        """
+        tdl = dl
+        while tdl < len(delta) - 1:
+            tdl += 1
+            tdc = delta[tdl]
+            tfc, tdiffline = tdc[0], tdc[2:]
+            if tfc != DIFF_INSERTION:
+                break
+            if not tdiffline.strip():  # Empty line.
+                yield from self.insert_line(cl, tdiffline)
+                delta[tdl] = (DIFF_NO_CHANGE, None, '')
+                break
+
+    def indent_block(self, delta, dl, cl, diffline):
+        """
+        Look ahead to correctly indent/dedent a block of lines. Does not modify the
+        diffs, just the current state. Lines are then re-applied as normal. Returns the
+        delta line reached, so block indents are not reapplied before it.
+        """
+        # Calculate the in/dedent.
+        dent = first_whitespace(diffline) - first_whitespace(self.current[cl])
+        n_dents = 1
+        tcl = cl
+        tdl = dl
+        while tdl < len(delta) - 3:
+            tdl += 1
+            tcl += 1
+
+            # Get the chars to check.
+            tcurrline = self.current[tcl]
+            tchar1, tdiffline1 = parse_delta(delta[tdl])
+
+            if tchar1 != DIFF_EDIT:
+                break
+
+            tdent = first_whitespace(tdiffline1) - first_whitespace(tcurrline)
+            if tdent != dent:
+                break
+
+            n_dents += 1
+
+        if n_dents > 1:
+            yield from self.block_indent(cl, n_dents, dent)
+        return tdl
+
+    def transition(self, target):
+        """ Generate the ops editing the current buffer into target. """
+        diff = difflib.Differ()
+        delta = list(diff.compare(self.current, target))
+        delta = self.process_deltas(delta)
+
+        cl, dl = 0, 0  # current line, diff line
+        block_indented = 0  # track indents, so not reapplied
+        while dl < len(delta):
+
+            dc = delta[dl]
+
+            first_char, diffline = parse_delta(dc)
+
+            if first_char == DIFF_NO_CHANGE:
+                # continue
+                cl += 1
+                dl += 1
+                continue
+
+            # Temporary look-ahead for trailing whitespace lines after series of inserts.
+            if first_char == DIFF_INSERTION and diffline.strip():
+                yield from self.insert_trailing_blank(delta, dl, cl)
+
+            # Temporary look-ahead to correctly indent/dedent a block of lines.
+            if dl > block_indented and first_char == DIFF_EDIT:
+                block_indented = yield from self.indent_block(delta, dl, cl, diffline)
+
+            if first_char == DIFF_EDIT:
+                if diffline == self.current[cl]:
+                    # Skip if no change (can happen with the block indents).
+                    dl += 1
+                    cl += 1
+                    continue
+
+                # Correct the indentation of the line.
+                yield from self.indent_line(cl, diffline)
+                # Modify diffline to nextdiffline.
+                yield from self.edit_line(cl, diffline)
+                dl += 1
+                cl += 1
+                self.pause(INSERT_SPEED)
+                continue
+
+            if first_char == DIFF_DELETION:
+                removed = self.current.pop(cl)  # don't increment cl.
+                yield self._op(OP_DELETE_LINE, cl, 0, removed)
+                dl += 1
+                self.pause(DELETE_SPEED)
+                continue
+
+            if first_char == DIFF_INSERTION:
+                # add a line at cl in current
+                yield from self.insert_line(cl, diffline)
+                cl += 1
+                dl += 1
+                self.pause(INSERT_SPEED)
+                continue
@@ -0,0 +1,166 @@
+"""
+Preview a cast in the terminal with ANSI colours, without Qt or a display.
+
+Styles come from the Qt-free highlighter and the editor colour table, and only the
+terminal rows which changed are redrawn each frame, so it stays quick over SSH. The
+highlighter rather than tokenize styles the code, as it copes with the half-typed code
+mid-edit and colours it as the editor does.
+"""
+import argparse
+import shutil
+import sys
+import time
+
+from highlight import Highlighter
+from planner import INITIAL_SPEED, OP_COMPLETE, OP_OPEN, OP_STEP, apply
+from styles import (CARET_LINE_BACKGROUND_COLOR, DEFAULT_COLOR,
+                    MARGIN_BACKGROUND_COLOR, MARGIN_FOREGROUND_COLOR,
+                    PAPER_COLOR, STYLE_COLORS)
+from timeline import load_ops
+
+CSI = '\x1b['
+TAB_WIDTH = 8
+
+
+def rgb(color):
+    color = color.lstrip('#')
+    return tuple(int(color[i : i + 2], 16) for i in (0, 2, 4))
+
+
+def fg(color):
+    return CSI + '38;2;%d;%d;%dm' % rgb(color)
+
+
+def bg(color):
+    return CSI + '48;2;%d;%d;%dm' % rgb(color)
+
+
+class TerminalRenderer:
+    def __init__(self, out=sys.stdout, speed=1.0, color=True):
+        self.out = out
+        self.speed = speed
+        self.color = color
+
+        self.highlighter = Highlighter()
+        self.style_codes = {style: fg(c) for style, c in STYLE_COLORS.items()}
+        self.rows = []  # what is currently drawn on each terminal row.
+
+    def first_visible_line(self, lines, line, height):
+        # Follow CodeViewer.update_editor_caret, keeping the caret line centered.
+        first = min(line - (height // 2), len(lines) - height)
+        return max(first, 0)
+
+    def format_row(self, number, runs, width, is_caret):
+        paper = CARET_LINE_BACKGROUND_COLOR if is_caret else PAPER_COLOR
+        number = ('%5d ' % number) if number else ' ' * 6
+        text_width = width - len(number)
+
+        if not self.color:
+            text = ''.join(t for _, t in runs).expandtabs(TAB_WIDTH)
+            return number + text[:text_width].ljust(text_width)
+
+        parts = [bg(MARGIN_BACKGROUND_COLOR), fg(MARGIN_FOREGROUND_COLOR), number, bg(paper)]
+        col = 0
+        for style, text in runs:
+            if col >= text_width:
+                break
+            if '\t' in text:
+                text = (' ' * col + text).expandtabs(TAB_WIDTH)[col:]
+            text = text[: text_width - col]
+            parts.append(self.style_codes.get(style, fg(DEFAULT_COLOR)))
+            parts.append(text)
+            col += len(text)
+
+        parts.append(' ' * (text_width - col))
+        parts.append(CSI + '0m')
+        return ''.join(parts)
+
+    def render(self, lines, caret):
+        width, height = shutil.get_terminal_size()
+        line, col = caret
+        first = self.first_visible_line(lines, line, height)
+        styled = self.highlighter.highlight(lines, first + height)
+
+        if len(self.rows) != height:
+            self.rows = [None] * height
+
+        out = []
+        for row in range(height):
+            n = first + row
+            if n < len(styled):
+                text = self.format_row(n + 1, styled[n], width, n == line)
+            else:
+                text = self.format_row(None, (), width, False)
+
+            if text != self.rows[row]:
+                self.rows[row] = text
+                out.append(CSI + '%d;1H' % (row + 1) + text)
+
+        # Place the terminal cursor on the caret.
+        out.append(CSI + '%d;%dH' % (line - first + 1, min(col + 7, width)))
+        self.out.write(''.join(out))
+        self.out.flush()
+
+    def play(self, ops, step=0):
+        """ Play ops in the terminal, fast-forwarding silently to the start of step. """
+        lines = []
+        caret = (0, 0)
+        steps = -1
+
+        self.out.write(CSI + '?1049h' + CSI + '2J')  # Alternate screen.
+        try:
+            for op in ops:
+                if op.kind == OP_STEP:
+                    steps += 1
+                    if steps == step:
+                        # Show where we skipped to while the step's first pause runs.
+                        self.render(lines, caret)
+
+                if steps >= step:
+                    time.sleep(op.delay / self.speed)
+
+                if op.kind in (OP_STEP, OP_COMPLETE, OP_OPEN):
+                    continue
+
+                apply(lines, op)
+                caret = op.caret
+
+                if steps >= step:
+                    self.render(lines, caret)
+
+            # Hold the final state, as between files.
+            self.render(lines, caret)
+            time.sleep(INITIAL_SPEED / self.speed)
+
+        finally:
+            self.out.write(CSI + '0m' + CSI + '?1049l')
+            self.out.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="diffcast-preview", description='Preview a series of edits in the terminal.'
+    )
+    parser.add_argument(
+        'files',
+        metavar='N',
+        nargs='+',
+        help='The series of files to apply, or a single timeline file.',
+    )
+    parser.add_argument('--speed', type=float, default=1.0, help='Playback speed multiplier.')
+    parser.add_argument(
+        '--step', type=int, default=0, help='Skip ahead to the transition into file N (from 0).'
+    )
+    parser.add_argument('--no-color', action='store_true', help='Disable syntax colours.')
+
+    args = parser.parse_args()
+
+    renderer = TerminalRenderer(speed=args.speed, color=not args.no_color)
+    try:
+        renderer.play(load_ops(args.files), args.step)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Opt-in instrumentation of the hot paths, written out as a Chrome trace-event file.
+
+Enable by setting DIFFCAST_PROFILE to the trace file to write, or by passing
+--profile to app.py. Instrumented code checks `profiler.PROFILE` before doing any
+work, so when profiling is off nothing is timed or recorded.
+
+Records timing spans for each phase, the latency of queued signals from emit to
+slot, paint times and peak memory via tracemalloc. Open the trace in
+chrome://tracing or Perfetto; a summary table is printed when the program exits.
+"""
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+
+PROFILE = False
+
+_output = None
+_start = time.perf_counter()
+_events = []
+_threads = {}
+_emitted = defaultdict(deque)
+_last_paint = None
+
+
+def enable(path):
+    """ Start recording, writing the trace to path at exit. """
+    global PROFILE, _output
+    if PROFILE:
+        return
+
+    PROFILE = True
+    _output = path
+    tracemalloc.start()
+    atexit.register(finish)
+
+
+def _tid():
+    tid = threading.get_ident()
+    if tid not in _threads:
+        _threads[tid] = threading.current_thread().name
+    return tid
+
+
+def _us(t):
+    return round((t - _start) * 1e6, 3)
+
+
+def span(name, start, end=None, cat='diffcast', **args):
+    """ Record a span from start to end (default now), both from time.perf_counter(). """
+    if end is None:
+        end = time.perf_counter()
+    event = {
+        'name': name,
+        'cat': cat,
+        'ph': 'X',
+        'ts': _us(start),
+        'dur': round((end - start) * 1e6, 3),
+        'pid': os.getpid(),
+        'tid': _tid(),
+    }
+    if args:
+        event['args'] = args
+    _events.append(event)
+
+
+class timed:
+    """ Context manager recording a span for the block. Only use when PROFILE is set. """
+
+    def __init__(self, name, cat='diffcast'):
+        self.name = name
+        self.cat = cat
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        span(self.name, self.start, cat=self.cat)
+
+
+def counter(name, **values):
+    _events.append(
+        {
+            'name': name,
+            'ph': 'C',
+            'ts': _us(time.perf_counter()),
+            'pid': os.getpid(),
+            'tid': _tid(),
+            'args': values,
+        }
+    )
+
+
+def emitted(signal):
+    """ Note a queued signal being emitted, to be matched up by received(). """
+    _emitted[signal].append(time.perf_counter())
+
+
+def received(signal):
+    """ Record the emit to slot latency of a queued signal. Slots are called in order. """
+    pending = _emitted[signal]
+    if pending:
+        span('signal:' + signal, pending.popleft(), cat='signal')
+
+
+def frame():
+    """ Record the time since the previous painted frame. """
+    global _last_paint
+    now = time.perf_counter()
+    if _last_paint is not None:
+        counter('frame', interval_ms=round((now - _last_paint) * 1000, 3))
+    _last_paint = now
+
+
+def memory():
+    current, peak = tracemalloc.get_traced_memory()
+    counter('memory', current=current, peak=peak)
+
+
+def summary():
+    durations = defaultdict(list)
+    for event in _events:
+        if event['ph'] == 'X':
+            durations[event['name']].append(event['dur'] / 1000)
+
+    header = ('span', 'count', 'total ms', 'mean ms', 'p95 ms', 'max ms')
+    rows = ['%-24s %8s %10s %9s %9s %9s' % header]
+    for name, values in sorted(durations.items()):
+        values.sort()
+        rows.append(
+            '%-24s %8d %10.1f %9.3f %9.3f %9.3f'
+            % (
+                name,
+                len(values),
+                sum(values),
+                sum(values) / len(values),
+                values[int(len(values) * 0.95)],
+                values[-1],
+            )
+        )
+
+    frames = sorted(e['args']['interval_ms'] for e in _events if e['name'] == 'frame')
+    if frames:
+        rows.append(
+            'frame interval ms: mean %.1f, p95 %.1f, max %.1f'
+            % (sum(frames) / len(frames), frames[int(len(frames) * 0.95)], frames[-1])
+        )
+
+    if tracemalloc.is_tracing():
+        rows.append('peak traced memory: %.1f MiB' % (tracemalloc.get_traced_memory()[1] / 2**20))
+
+    return '\n'.join(rows)
+
+
+def write_trace(path):
+    events = [
+        {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+        for tid, name in _threads.items()
+    ]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events + _events, 'displayTimeUnit': 'ms'}, f)
+
+
+def finish():
+    memory()
+    write_trace(_output)
+    print(summary(), file=sys.stderr)
+    print(f"Trace written to {_output}", file=sys.stderr)
+
+
+if os.environ.get('DIFFCAST_PROFILE'):
+    enable(os.environ['DIFFCAST_PROFILE'])
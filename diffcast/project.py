@@ -0,0 +1,164 @@
+"""
+Project casts, where each step is a snapshot directory of a whole package.
+
+Within a step every changed file is edited in turn, each introduced by an open op
+naming it (relative to the snapshot) and a load of its previous contents. Per-file
+transitions are planned in parallel across processes, so a step with many changed
+files takes about as long to plan as its slowest file.
+"""
+import os
+
+from gitsource import GitPlanner, Revision
+from planner import (INITIAL_SPEED, INSERT_SPEED, OP_COMPLETE, OP_LOAD, OP_OPEN,
+                     OP_STEP, DiffPlanner, apply)
+
+# Not shown in project casts.
+IGNORED_DIRS = {'__pycache__', 'node_modules'}
+
+
+def snapshot(directory):
+    """ Map the relative path of every text file under directory to its lines. """
+    files = {}
+    if directory is None:
+        return files
+
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d not in IGNORED_DIRS)
+        for name in names:
+            if name.startswith('.'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+            except (UnicodeDecodeError, OSError):
+                continue  # Binary, unreadable or a dangling link, can't be typed.
+            files[os.path.relpath(path, directory).replace(os.sep, '/')] = lines
+    return files
+
+
+def plan_transition(current, target):
+    """ Plan one file's edit, returning the ops and the pause left after the last one. """
+    planner = DiffPlanner([])
+    planner.current = list(current)
+    ops = list(planner.transition(target))
+    return ops, planner._delay
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def is_project(files):
+    return any(path is not None for _, path in files) and all(
+        path is None or os.path.isdir(path) for _, path in files
+    )
+
+
+def planner_for(files):
+    """
+    A GitPlanner for git revisions, a ProjectPlanner for a series of directories,
+    otherwise a DiffPlanner. Raises SnapshotError for a mix of files and directories.
+    """
+    if any(isinstance(path, Revision) for _, path in files):
+        return GitPlanner(files)
+    if is_project(files):
+        return ProjectPlanner(files)
+    for _, path in files:
+        if path is not None and os.path.isdir(path):
+            raise SnapshotError(
+                "Can't mix files and snapshot directories in one cast: %s" % path
+            )
+    return DiffPlanner(files)
+
+
+class ProjectPlanner(DiffPlanner):
+    """
+    Plan a list of (fid, directory) snapshots. `current` holds the buffer of the file
+    being edited, and `directory` the snapshot being edited towards.
+    """
+
+    def __init__(self, files, workers=None):
+        super().__init__(files)
+        self.workers = workers
+        self.directory = None
+
+    def path(self, name):
+        """ The path of a file named in an open op, within the current snapshot. """
+        return os.path.join(self.directory, name)
+
+    def _open(self, name, lines):
+        yield self._op(OP_OPEN, text=name)
+        self.current = list(lines)
+        yield self._op(OP_LOAD, text=''.join(lines))
+
+    def changes(self, snapshots):
+        """ The (name, current, target) of each file changed between snapshots. """
+        for previous, files in zip(snapshots, snapshots[1:]):
+            yield [
+                (name, previous.get(name, []), files.get(name, []))
+                for name in sorted(previous.keys() | files.keys())
+                if previous.get(name) != files.get(name)
+            ]
+
+    def ops(self):
+        """ Generate the ops for the whole series of snapshots. """
+        snapshots = [snapshot(directory) for _, directory in self.files]
+        steps = list(self.changes(snapshots))
+
+        # Start planning every file of every step up front, to be collected in order.
+        pool = None
+        if self.workers != 1 and sum(len(changed) for changed in steps) > 1:
+            # Imported here as it's slow to import, and single files don't need it.
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Not forked, as the app plans from a thread, and forking threads can deadlock.
+            context = multiprocessing.get_context('forkserver')
+            pool = ProcessPoolExecutor(self.workers, mp_context=context)
+
+        plans = []
+        for changed in steps:
+            if pool is None:
+                plans.append([None] * len(changed))
+            else:
+                plans.append([pool.submit(plan_transition, c, t) for _, c, t in changed])
+
+        try:
+            fid, self.directory = self.files[0]
+            yield self._op(OP_STEP, text=fid)
+            for name, lines in sorted(snapshots[0].items()):
+                yield from self._open(name, lines)
+            yield self._op(OP_COMPLETE, text=fid)
+
+            for (fid, self.directory), changed, futures in zip(self.files[1:], steps, plans):
+                self.pause(INITIAL_SPEED)
+                yield self._op(OP_STEP, text=fid)
+
+                for n, ((name, current, target), future) in enumerate(zip(changed, futures)):
+                    if n:
+                        self.pause(INSERT_SPEED)
+                    yield from self._open(name, current)
+
+                    if future is None:
+                        ops, delay = plan_transition(current, target)
+                    else:
+                        ops, delay = future.result()
+
+                    # Ops from the worker carry their own pauses, only the first needs ours.
+                    for op in ops:
+                        if self._delay:
+                            op = op._replace(delay=op.delay + self._delay)
+                            self._delay = 0
+                        apply(self.current, op)
+                        yield op
+                    self.pause(delay)
+
+                yield self._op(OP_COMPLETE, text=fid)
+
+        finally:
+            if pool is not None:
+                for futures in plans:
+                    for future in futures:
+                        future.cancel()
+                pool.shutdown(wait=False)
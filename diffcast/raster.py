@@ -0,0 +1,394 @@
+"""
+Render frames with NumPy from a glyph atlas, without widgets or Qt's offscreen platform.
+
+The editor font is rasterized once per style, in every colour and background the
+Editor uses and at each subpixel position Qt draws glyphs at, and the atlas cached on
+disk. Only building the atlas needs Qt, after that rendering is pure NumPy: lines are
+styled by the Qt-free highlighter, composed from atlas tiles into bitmaps cached on
+their content, and blitted into the frame. Screen rows that show the same thing as in
+the last frame aren't touched at all.
+
+Frames match WidgetRenderer's pixel for pixel, apart from any lines the highlighter
+styles differently from QsciLexerPython, characters missing from the atlas (drawn as
+'?'), and the odd antialiased pixel where neighbouring glyphs overlap.
+"""
+import hashlib
+import importlib.metadata
+import json
+import math
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from frames import DRAFT_SCALE, first_visible_line, line_count
+from highlight import Highlighter, PlainHighlighter
+from styles import (CARET_FOREGROUND_COLOR, CARET_LINE_BACKGROUND_COLOR,
+                    DEFAULT_COLOR, FONT_FAMILY, FONT_SIZE,
+                    MARGIN_BACKGROUND_COLOR, MARGIN_FOREGROUND_COLOR,
+                    PAPER_COLOR, STYLE_COLORS, STYLE_PAPERS)
+
+ATLAS_VERSION = 1
+
+TAB_WIDTH = 8
+
+# Printable ASCII and Latin-1, anything else is drawn as MISSING.
+GLYPHS = ''.join(chr(c) for c in list(range(33, 127)) + list(range(161, 256)))
+MISSING = '?'
+
+# Qt positions glyphs to a quarter pixel.
+SUBPIXELS = 4
+# Room either side of a glyph's cell for antialiasing and overhangs.
+PAD = 3
+
+# As Editor sets up the Scintilla margins: the line numbers sized for "00000" plus 8,
+# then the default 16 pixel symbol margin. The text area has a pixel margin either side.
+SYMBOL_MARGIN_WIDTH = 16
+TEXT_MARGIN = 1
+# Scintilla leaves this gap to the right of line numbers.
+NUMBER_PADDING = 3
+
+# Editor sets style 1 (comments) in its own font.
+STYLE_FONTS = {1: 'Courier'}
+
+# Bytes of line bitmaps kept, around eight screens of rows at fhd, and of line numbers.
+LINE_CACHE_BYTES = 64 * 1024 * 1024
+NUMBER_CACHE_BYTES = 8 * 1024 * 1024
+
+
+def _argb(color):
+    return 0xFF000000 | int(color.lstrip('#'), 16)
+
+
+def cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'diffcast')
+
+
+def _styles():
+    """ Map each style to its (font family, colour) and the backgrounds it's drawn on. """
+    styles = {style: (STYLE_FONTS.get(style, FONT_FAMILY), c) for style, c in STYLE_COLORS.items()}
+    backgrounds = {style: STYLE_PAPERS.get(style, PAPER_COLOR) for style in styles}
+    return styles, backgrounds
+
+
+class Atlas:
+    """
+    Glyph tiles and font metrics. tiles[(family, colour, background)] is an array of
+    (glyph, subpixel, y, x) ARGB pixels, each glyph drawn PAD pixels in from the left.
+
+    The atlas is for the Editor's FONT_SIZE by default. Drafts use a smaller size, one
+    subpixel position and no antialiasing.
+    """
+
+    def __init__(self, metrics, tiles):
+        self.metrics = metrics
+        self.advance = metrics['advance']
+        self.line_height = metrics['line_height']
+        self.ascent = metrics['ascent']
+        self.number_width = metrics['number_width']
+        self.tiles = tiles
+        self.digest = None  # The key it's cached under, once loaded.
+        self.subpixels = next(iter(tiles.values())).shape[1]
+
+        # Where a tile differs from its background, so overlapping glyphs aren't erased.
+        self.masks = {key: array != _argb(key[2]) for key, array in tiles.items()}
+        self.index = {c: n for n, c in enumerate(GLYPHS)}
+
+    @classmethod
+    def key(cls, size=FONT_SIZE, subpixels=SUBPIXELS, antialias=True):
+        """ A hash of everything the atlas depends on, naming its cache file. """
+        try:
+            # Font rendering changes between Qt versions, found without importing Qt.
+            qt = importlib.metadata.version('PyQt6-Qt6')
+        except importlib.metadata.PackageNotFoundError:
+            qt = None
+
+        styles, backgrounds = _styles()
+        description = [
+            ATLAS_VERSION,
+            qt,
+            FONT_FAMILY,
+            size,
+            subpixels,
+            antialias,
+            GLYPHS,
+            sorted(styles.items()),
+            sorted(backgrounds.items()),
+            CARET_LINE_BACKGROUND_COLOR,
+            MARGIN_FOREGROUND_COLOR,
+            MARGIN_BACKGROUND_COLOR,
+        ]
+        return hashlib.sha1(json.dumps(description).encode()).hexdigest()[:16]
+
+    @classmethod
+    def load(cls, directory=None, size=FONT_SIZE, subpixels=SUBPIXELS, antialias=True):
+        """ The atlas from the cache, building it with Qt the first time. """
+        digest = cls.key(size, subpixels, antialias)
+        path = os.path.join(directory or cache_dir(), 'atlas-%s.npz' % digest)
+        try:
+            with np.load(path) as data:
+                metrics = json.loads(str(data['metrics']))
+                tiles = {tuple(json.loads(k)): data[k] for k in data.files if k != 'metrics'}
+            atlas = cls(metrics, tiles)
+            atlas.digest = digest
+            return atlas
+        except (OSError, ValueError, KeyError):
+            pass
+
+        atlas = cls.build(size, subpixels, antialias)
+        atlas.digest = digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '%s.%d.tmp.npz' % (path[: -len('.npz')], os.getpid())
+        arrays = {json.dumps(list(k)): v for k, v in atlas.tiles.items()}
+        np.savez_compressed(tmp, metrics=json.dumps(atlas.metrics), **arrays)
+        os.replace(tmp, path)
+        return atlas
+
+    @classmethod
+    def build(cls, size=FONT_SIZE, subpixels=SUBPIXELS, antialias=True):
+        """ Rasterize the atlas with Qt, as Scintilla draws the Editor. """
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt6.QtCore import QPointF
+        from PyQt6.QtGui import (QColor, QFont, QFontMetrics, QFontMetricsF,
+                                 QGuiApplication, QImage, QPainter)
+
+        # Fonts need an application, kept until we're done.
+        _app = QGuiApplication.instance() or QGuiApplication([])
+
+        def font(family):
+            f = QFont()
+            f.setFamily(family)
+            f.setFixedPitch(True)
+            f.setPointSizeF(size)
+            if not antialias:
+                f.setStyleStrategy(QFont.StyleStrategy.NoAntialias)
+            return f
+
+        default = font(FONT_FAMILY)
+        fm = QFontMetricsF(default)
+        # Scintilla rounds the ascent and descent separately.
+        ascent, descent = round(fm.ascent()), round(fm.descent())
+        metrics = {
+            'advance': fm.horizontalAdvance('0'),
+            'line_height': ascent + descent,
+            'ascent': ascent,
+            'number_width': QFontMetrics(default).horizontalAdvance('00000') + 8,
+        }
+        width = math.ceil(metrics['advance']) + 2 * PAD
+        height = metrics['line_height']
+
+        def draw(family, color, background):
+            image = QImage(width, height, QImage.Format.Format_RGB32)
+            tiles = np.empty((len(GLYPHS), subpixels, height, width), np.uint32)
+            painter_font = font(family)
+            for n, c in enumerate(GLYPHS):
+                for subpixel in range(subpixels):
+                    image.fill(QColor(background))
+                    painter = QPainter(image)
+                    painter.setFont(painter_font)
+                    painter.setPen(QColor(color))
+                    painter.drawText(QPointF(PAD + subpixel / subpixels, ascent), c)
+                    painter.end()
+                    data = image.constBits().asstring(image.sizeInBytes())
+                    pixels = np.frombuffer(data, np.uint32)
+                    tiles[n, subpixel] = pixels.reshape(height, -1)[:, :width]
+            return tiles
+
+        styles, backgrounds = _styles()
+        keys = {(family, color, backgrounds[style]) for style, (family, color) in styles.items()}
+        # The caret line, and line numbers in the margin.
+        keys |= {(family, color, CARET_LINE_BACKGROUND_COLOR) for family, color, _ in keys}
+        keys.add((FONT_FAMILY, MARGIN_FOREGROUND_COLOR, MARGIN_BACKGROUND_COLOR))
+
+        return cls(metrics, {key: draw(*key) for key in keys})
+
+    def place(self, x):
+        """ The (pixel, subpixel) Qt draws a glyph positioned at x at. """
+        # Qt works in 1/64 pixels, and rounds up a 64th before snapping to a quarter.
+        fixed = round(x * 64) + 1
+        return fixed // 64, (fixed % 64) * self.subpixels // 64
+
+    def draw(self, target, x, text, family, color, background):
+        """ Draw text into target, a (line_height, width) array, starting at x. """
+        key = (family, color, background)
+        tiles, masks = self.tiles[key], self.masks[key]
+        width = target.shape[1]
+        for n, c in enumerate(text):
+            if c == ' ':
+                continue
+            glyph = self.index.get(c)
+            if glyph is None:
+                glyph = self.index[MISSING]
+
+            pixel, subpixel = self.place(x + n * self.advance)
+            left = pixel - PAD
+            if left >= width:
+                break
+            tile, mask = tiles[glyph, subpixel], masks[glyph, subpixel]
+            start, end = max(left, 0), min(left + tile.shape[1], width)
+            np.copyto(
+                target[:, start:end],
+                tile[:, start - left : end - left],
+                where=mask[:, start - left : end - left],
+            )
+
+
+class BitmapCache:
+    """ Bitmaps by key, dropping the least recently used once they take over max_bytes. """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._bitmaps = OrderedDict()
+
+    def __len__(self):
+        return len(self._bitmaps)
+
+    def get(self, key):
+        bitmap = self._bitmaps.get(key)
+        if bitmap is not None:
+            self._bitmaps.move_to_end(key)
+        return bitmap
+
+    def put(self, key, bitmap):
+        self._bitmaps[key] = bitmap
+        self.bytes += bitmap.nbytes
+        while self.bytes > self.max_bytes and len(self._bitmaps) > 1:
+            _, dropped = self._bitmaps.popitem(last=False)
+            self.bytes -= dropped.nbytes
+
+
+class RasterRenderer:
+    """ Render buffers as the Editor shows them, with the same interface as WidgetRenderer. """
+
+    def __init__(self, width, height, atlas=None, highlighter=None):
+        self.atlas = atlas or Atlas.load()
+        self.width = width
+        self.height = height
+
+        self.line_height = self.atlas.line_height
+        self.rows = height // self.line_height
+        self.margin_width = self.atlas.number_width + SYMBOL_MARGIN_WIDTH
+        self.styles, self.backgrounds = _styles()
+
+        self.highlighter = highlighter or Highlighter()
+        self._lines = BitmapCache(LINE_CACHE_BYTES)  # (runs, is caret line) to text bitmap.
+        self._numbers = BitmapCache(NUMBER_CACHE_BYTES)  # line number to margin bitmap.
+        self.rendered = 0
+
+        # The frame is drawn into in place, remembering what's on each row.
+        self._frame = np.empty((height, width), np.uint32)
+        self._shown = [False] * (self.rows + 1)  # Nothing, not even blank rows, yet.
+
+    @classmethod
+    def draft(cls, width, height, scale=DRAFT_SCALE):
+        """
+        A quicker renderer for drafts of the display width x height, scaled down by
+        scale, in plain text without antialiasing. It shows the same lines at each
+        point, as the line height scales too.
+        """
+        atlas = Atlas.load(size=FONT_SIZE / scale, subpixels=1, antialias=False)
+        return cls(width // scale, height // scale, atlas, PlainHighlighter())
+
+    def _number(self, number):
+        bitmap = self._numbers.get(number)
+        if bitmap is None:
+            bitmap = np.full((self.line_height, self.margin_width), _argb(MARGIN_BACKGROUND_COLOR))
+            bitmap = bitmap.astype(np.uint32)
+            if number is not None:
+                text = str(number)
+                # Right aligned in the line number margin.
+                right = self.atlas.number_width - NUMBER_PADDING
+                self.atlas.draw(
+                    bitmap,
+                    right - len(text) * self.atlas.advance,
+                    text,
+                    FONT_FAMILY,
+                    MARGIN_FOREGROUND_COLOR,
+                    MARGIN_BACKGROUND_COLOR,
+                )
+            self._numbers.put(number, bitmap)
+        return bitmap
+
+    def _line(self, runs, is_caret):
+        key = (runs, is_caret)
+        bitmap = self._lines.get(key)
+        if bitmap is not None:
+            return bitmap
+
+        paper = CARET_LINE_BACKGROUND_COLOR if is_caret else PAPER_COLOR
+        shape = (self.line_height, self.width - self.margin_width)
+        bitmap = np.full(shape, _argb(paper), np.uint32)
+        col = 0
+        for style, text in runs:
+            text = text.rstrip('\r\n')
+            if '\t' in text:
+                text = (' ' * col + text).expandtabs(TAB_WIDTH)[col:]
+            family, color = self.styles.get(style, (FONT_FAMILY, DEFAULT_COLOR))
+            background = paper if is_caret else self.backgrounds.get(style, PAPER_COLOR)
+            x = TEXT_MARGIN + col * self.atlas.advance
+            self.atlas.draw(bitmap, x, text, family, color, background)
+            col += len(text)
+        # The text margins clip the text, and aren't part of the caret line.
+        bitmap[:, :TEXT_MARGIN] = bitmap[:, -TEXT_MARGIN:] = _argb(PAPER_COLOR)
+
+        self._lines.put(key, bitmap)
+        return bitmap
+
+    def caret_x(self, runs, col):
+        """ The caret's x offset in the text area, before col of the line. """
+        column = 0
+        for _, text in runs:
+            for c in text[:col]:
+                column = (column // TAB_WIDTH + 1) * TAB_WIDTH if c == '\t' else column + 1
+            col -= len(text)
+            if col <= 0:
+                break
+        # Scintilla draws the caret in the last pixel before the character, except
+        # at the start of the line.
+        if not column:
+            return TEXT_MARGIN
+        return math.ceil(TEXT_MARGIN + column * self.atlas.advance) - 1
+
+    def render(self, lines, line, col, out=None):
+        """ The frame showing lines with the caret at (line, col), drawn into out if given. """
+        self.rendered += 1
+        first = first_visible_line(lines, line, self.rows)
+        styled = self.highlighter.highlight(lines, first + self.rows + 1)
+        count = line_count(lines)
+        lh = self.line_height
+
+        frame = self._frame
+        for row in range(self.rows + 1):
+            n = first + row
+            if n < count:
+                runs = styled[n] if n < len(styled) else ()  # The empty last line.
+                caret = self.caret_x(runs, col) if n == line else None
+                content = (n + 1, runs, caret)
+            else:
+                content = None
+            if content == self._shown[row]:
+                continue  # Unchanged, nothing to do.
+            self._shown[row] = content
+
+            y = row * lh
+            height = min(lh, self.height - y)
+            target = frame[y : y + height]
+            if content is None:
+                target[:, : self.margin_width] = self._number(None)[:height]
+                target[:, self.margin_width :] = _argb(PAPER_COLOR)
+                continue
+
+            number, runs, caret = content
+            target[:, : self.margin_width] = self._number(number)[:height]
+            target[:, self.margin_width :] = self._line(runs, caret is not None)[:height]
+            if caret is not None:
+                x = self.margin_width + caret
+                if x < self.width:
+                    target[:, x] = _argb(CARET_FOREGROUND_COLOR)
+
+        if out is None:
+            return frame.copy()
+        np.copyto(out, frame)
+        return out
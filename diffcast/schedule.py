@@ -0,0 +1,218 @@
+"""
+Fit a cast to a target length, by retiming its ops within human-like bounds.
+
+Every op's delay, as the planner made it, is put in a class, typing a character,
+pausing after a line or pausing before a step, and each class has the shortest and
+longest delay that still looks natural. Scaling every delay by the same factor and
+clamping it to its class's bounds gives a length that only grows with the factor, so
+the factor that hits the target is found by bisection over arrays of the delays, with
+nothing played. Given a budget per step, each transition is fitted on its own instead.
+
+    python schedule.py --target 5:00 demos/demo*.py
+    python schedule.py --budgets 20,30,20 -o cast.dctl demos/demo*.py
+
+Writes the retimed ops as a timeline file, which every exporter accepts, or without
+an output just reports the planned and fitted lengths.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from planner import OP_STEP, TYPING_SPEED
+from timeline import load_ops, write_timeline
+
+DELAY_TYPING = 'typing'
+DELAY_PAUSE = 'pause'
+DELAY_STEP = 'step'
+
+# The (shortest, longest) natural delay before each class of op, in seconds.
+DEFAULT_BOUNDS = {
+    DELAY_TYPING: (0.02, 0.15),
+    DELAY_PAUSE: (0.2, 4.0),
+    DELAY_STEP: (0.5, 8.0),
+}
+
+# Bisection steps, far beyond a millisecond's precision over any length of cast.
+ITERATIONS = 60
+
+
+class ScheduleError(Exception):
+    pass
+
+
+def delay_class(op):
+    if op.kind == OP_STEP:
+        return DELAY_STEP
+    # Pauses after a line are added to the next op's typing delay.
+    return DELAY_TYPING if op.delay <= TYPING_SPEED * 1.5 else DELAY_PAUSE
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(round(seconds), 60)
+    return '%d:%02d' % (minutes, seconds)
+
+
+def parse_duration(text):
+    """ Seconds from '90', '1:30' or '1:00:00'. """
+    seconds = 0.0
+    for part in text.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+class Schedule:
+    """ The ops of a cast, with the delays they can be given. """
+
+    def __init__(self, ops, bounds=None):
+        self.ops = list(ops)
+        bounds = dict(DEFAULT_BOUNDS, **(bounds or {}))
+
+        self.planned = np.array([op.delay for op in self.ops], float)
+        limits = np.array([bounds[delay_class(op)] for op in self.ops], float).reshape(-1, 2)
+        # Ops planned to follow straight on still do.
+        instant = self.planned <= 0
+        self.low = np.where(instant, 0, limits[:, 0])
+        self.high = np.where(instant, 0, limits[:, 1])
+
+        # Each transition starts at a step, the first is just the opening file.
+        steps = [n for n, op in enumerate(self.ops) if op.kind == OP_STEP]
+        self.segments = list(zip(steps, steps[1:] + [len(self.ops)]))[1:]
+
+    def duration(self):
+        """ The planned length in seconds. """
+        return float(self.planned.sum())
+
+    def limits(self, start=0, end=None):
+        """ The (shortest, longest) the ops from start to end can take. """
+        return float(self.low[start:end].sum()), float(self.high[start:end].sum())
+
+    def _delays(self, scale, start, end):
+        return np.clip(self.planned[start:end] * scale, self.low[start:end], self.high[start:end])
+
+    def _fit(self, target, start, end):
+        """ The scale whose clamped delays from start to end come closest to target. """
+        shortest, longest = self.limits(start, end)
+        if target <= shortest:
+            return 0.0
+        if target >= longest:
+            return np.inf
+
+        low, high = 0.0, 1.0
+        while self._delays(high, start, end).sum() < target:
+            high *= 2
+        for _ in range(ITERATIONS):
+            middle = (low + high) / 2
+            if self._delays(middle, start, end).sum() < target:
+                low = middle
+            else:
+                high = middle
+        return high
+
+    def fit(self, target=None, budgets=None):
+        """
+        Retimed ops taking target seconds in all, or budgets[n] seconds for each
+        transition n, as near as the bounds allow. Returns (ops, scales).
+        """
+        delays = self.planned.copy()
+        if budgets is not None:
+            if len(budgets) != len(self.segments):
+                raise ScheduleError(
+                    '%d budgets given for %d transitions' % (len(budgets), len(self.segments))
+                )
+            segments = list(zip(self.segments, budgets))
+        else:
+            # Leave the opening as it is, and share the rest out.
+            start = self.segments[0][0] if self.segments else len(self.ops)
+            segments = [((start, len(self.ops)), target - self.planned[:start].sum())]
+
+        scales = []
+        for (start, end), budget in segments:
+            scale = self._fit(budget, start, end)
+            delays[start:end] = self._delays(scale, start, end)
+            scales.append(scale)
+
+        ops = [op._replace(delay=float(d)) for op, d in zip(self.ops, delays)]
+        return ops, scales
+
+
+def _bounds(text):
+    low, high = (float(s) for s in text.split(':'))
+    if not 0 <= low <= high:
+        raise argparse.ArgumentTypeError('Bounds must be MIN:MAX with 0 <= MIN <= MAX')
+    return low, high
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="diffcast-schedule", description='Retime a cast to fit a target length.'
+    )
+    parser.add_argument(
+        'files',
+        metavar='N',
+        nargs='+',
+        help='The series of files to apply, or a single timeline file.',
+    )
+    parser.add_argument('-o', '--output', help='Write the retimed ops to this timeline file.')
+    budget = parser.add_mutually_exclusive_group()
+    budget.add_argument(
+        '--target', type=parse_duration, help='Length of the whole cast, e.g. 90 or 1:30.'
+    )
+    budget.add_argument(
+        '--budgets',
+        type=lambda text: [parse_duration(s) for s in text.split(',')],
+        help='Comma separated length of each transition.',
+    )
+    for name, (low, high) in DEFAULT_BOUNDS.items():
+        parser.add_argument(
+            '--' + name,
+            type=_bounds,
+            metavar='MIN:MAX',
+            default=(low, high),
+            help='Seconds before each %s op, default %g:%g.' % (name, low, high),
+        )
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    bounds = {name: getattr(args, name) for name in DEFAULT_BOUNDS}
+    schedule = Schedule(load_ops(args.files), bounds)
+    planned = time.perf_counter()
+    shortest, longest = schedule.limits()
+    print(
+        'Planned %s for %d ops, %s to %s within bounds (%.0fms)'
+        % (
+            format_duration(schedule.duration()),
+            len(schedule.ops),
+            format_duration(shortest),
+            format_duration(longest),
+            (planned - start) * 1000,
+        )
+    )
+
+    if args.target is None and args.budgets is None:
+        ops = schedule.ops
+    else:
+        try:
+            ops, scales = schedule.fit(args.target, args.budgets)
+        except ScheduleError as e:
+            parser.error(str(e))
+        fitted = sum(op.delay for op in ops)
+        print(
+            'Fitted %s, delays %s (%.0fms)'
+            % (
+                format_duration(fitted),
+                ', '.join('max' if np.isinf(s) else 'x%.2f' % s for s in scales),
+                (time.perf_counter() - planned) * 1000,
+            )
+        )
+        requested = args.target if args.target is not None else sum(args.budgets)
+        if abs(fitted - requested) > 0.5:
+            print('Not enough room within the bounds to fit %s' % format_duration(requested))
+
+    if args.output:
+        write_timeline(args.output, ops)
+
+
+if __name__ == '__main__':
+    main()
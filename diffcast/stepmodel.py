@@ -0,0 +1,288 @@
+"""
+The cast's steps, as a list model for the step list and saved as a project file.
+
+Steps are kept as a plain list of small tuples, and shown through a QListView, so the
+list stays quick with thousands of them: the view only asks for the rows on screen,
+and thumbnails are only requested for those. Project files are JSON, recording each
+step's path relative to the project along with the hash and size of its content, and
+loading one reads nothing else, each file is only read when it's played or planned.
+The hash and size are checked then, the first time each step is played, so changes
+made to a file since the project was saved can be warned about.
+
+    {"version": 1, "steps": [
+    {"name": "demo1.py", "sha1": "053e0c83...", "size": 23, "path": "demos/demo1.py"},
+    ...
+    ]}
+"""
+import hashlib
+import json
+import os
+import uuid
+from collections import namedtuple
+
+from PyQt6.QtCore import QAbstractListModel, QMimeData, QModelIndex, Qt
+from PyQt6.QtGui import QIcon, QPixmap
+
+from gitsource import Revision
+from project import snapshot
+
+PROJECT_VERSION = 1
+
+# The roles the step list has always kept steps' paths and fids in.
+PathRole = Qt.ItemDataRole.UserRole
+FidRole = Qt.ItemDataRole.UserRole + 1
+
+MIME_TYPE = 'application/x-diffcast-steps'
+
+# A step's path is a file, a snapshot directory, a Revision or None for an empty file.
+# Its digest and size are None until they're needed for saving.
+StepInfo = namedtuple('StepInfo', ['fid', 'name', 'path', 'digest', 'size'])
+
+
+class ProjectError(Exception):
+    pass
+
+
+def new_step(name, path):
+    return StepInfo(uuid.uuid4().hex, name, path, None, None)
+
+
+def content_digest(path):
+    """ The (sha1, size in bytes) of a step's content. """
+    if path is None:
+        return hashlib.sha1().hexdigest(), 0
+    if isinstance(path, Revision):
+        # Commits don't change, the revision and path identify the content.
+        return hashlib.sha1(('%s:%s' % (path.rev, path.path)).encode()).hexdigest(), None
+    if os.path.isdir(path):
+        h = hashlib.sha1()
+        size = 0
+        for name, lines in sorted(snapshot(path).items()):
+            text = ''.join(lines).encode()
+            h.update(b'%s\0%d\0' % (name.encode(), len(text)))
+            h.update(text)
+            size += len(text)
+        return h.hexdigest(), size
+
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest(), os.path.getsize(path)
+
+
+def _relative(path, base):
+    return os.path.relpath(path, base).replace(os.sep, '/')
+
+
+def _absolute(path, base):
+    return os.path.normpath(os.path.join(base, path))
+
+
+def save_project(filename, steps):
+    """ Save steps to a project file, returning them with their digests filled in. """
+    base = os.path.dirname(os.path.abspath(filename))
+    saved = []
+    entries = []
+    for step in steps:
+        if step.digest is None:
+            digest, size = content_digest(step.path)
+            step = step._replace(digest=digest, size=size)
+        saved.append(step)
+
+        entry = {'name': step.name, 'sha1': step.digest, 'size': step.size}
+        if isinstance(step.path, Revision):
+            entry['git'] = {
+                'repo': _relative(step.path.repo, base),
+                'rev': step.path.rev,
+                'path': step.path.path,
+            }
+        else:
+            entry['path'] = None if step.path is None else _relative(step.path, base)
+        entries.append(entry)
+
+    tmp = '%s.%d.tmp' % (filename, os.getpid())
+    with open(tmp, 'w') as f:
+        # A step a line, to diff well under version control.
+        f.write('{"version": %d, "steps": [\n' % PROJECT_VERSION)
+        f.write(',\n'.join(json.dumps(entry) for entry in entries))
+        f.write('\n]}\n')
+    os.replace(tmp, filename)
+    return saved
+
+
+def load_project(filename):
+    """ The steps of a project file, without reading any of them. """
+    base = os.path.dirname(os.path.abspath(filename))
+    try:
+        with open(filename) as f:
+            project = json.load(f)
+        if project.get('version') != PROJECT_VERSION:
+            raise ProjectError('%s: unsupported project version' % filename)
+
+        steps = []
+        for entry in project['steps']:
+            git = entry.get('git')
+            if git is not None:
+                path = Revision(_absolute(git['repo'], base), git['rev'], git['path'])
+            elif entry['path'] is not None:
+                path = _absolute(entry['path'], base)
+            else:
+                path = None
+            step = StepInfo(uuid.uuid4().hex, entry['name'], path, entry['sha1'], entry['size'])
+            steps.append(step)
+    except (ValueError, KeyError, TypeError) as e:
+        raise ProjectError('%s: not a DiffCast project (%s)' % (filename, e)) from None
+    return steps
+
+
+class StepModel(QAbstractListModel):
+    """ The steps of a cast, with thumbnails requested from thumbnails as they're shown. """
+
+    def __init__(self, thumbnails=None, parent=None):
+        super().__init__(parent)
+        self.steps = []
+        self.thumbnails = thumbnails
+        self._icons = {}  # fid to thumbnail, or None while it's rendering.
+        self._placeholder = None  # A blank icon, keeping rows the same height meanwhile.
+        self._rows = None  # fid to row, rebuilt after changes.
+        self._checked = set()  # fids whose content has been checked against the project.
+        if thumbnails is not None:
+            thumbnails.signals.ready.connect(self.set_thumbnail)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.steps)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        step = self.steps[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return step.name
+        if role == Qt.ItemDataRole.DecorationRole:
+            if self.thumbnails is None:
+                return None
+            if step.fid not in self._icons:
+                self._icons[step.fid] = None
+                self.thumbnails.request(step.fid, step.path)
+            return self._icons[step.fid] or self.placeholder()
+        if role == PathRole:
+            return step.path
+        if role == FidRole:
+            return step.fid
+        return None
+
+    def placeholder(self):
+        if self._placeholder is None:
+            pixmap = QPixmap(*self.thumbnails.size)
+            pixmap.fill(Qt.GlobalColor.transparent)
+            self._placeholder = QIcon(pixmap)
+        return self._placeholder
+
+    def flags(self, index):
+        if not index.isValid():
+            # Drop between items, not onto them.
+            return Qt.ItemFlag.ItemIsDropEnabled
+        return (
+            Qt.ItemFlag.ItemIsSelectable
+            | Qt.ItemFlag.ItemIsEnabled
+            | Qt.ItemFlag.ItemIsDragEnabled
+        )
+
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+
+    def mimeTypes(self):
+        return [MIME_TYPE]
+
+    def mimeData(self, indexes):
+        data = QMimeData()
+        rows = sorted(index.row() for index in indexes)
+        data.setData(MIME_TYPE, json.dumps(rows).encode())
+        return data
+
+    def dropMimeData(self, data, action, row, column, parent):
+        if action != Qt.DropAction.MoveAction or not data.hasFormat(MIME_TYPE):
+            return False
+        if row == -1:
+            row = parent.row() if parent.isValid() else len(self.steps)
+        # Copies go in here, and the view then removes the originals.
+        moved = [self.steps[n] for n in json.loads(bytes(data.data(MIME_TYPE)))]
+        self.insert(row, moved)
+        return True
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        if count <= 0 or row < 0 or row + count > len(self.steps):
+            return False
+        self.beginRemoveRows(QModelIndex(), row, row + count - 1)
+        del self.steps[row : row + count]
+        self._rows = None
+        self.endRemoveRows()
+        return True
+
+    def insert(self, row, steps):
+        if not steps:
+            return
+        self.beginInsertRows(QModelIndex(), row, row + len(steps) - 1)
+        self.steps[row:row] = steps
+        self._rows = None
+        self.endInsertRows()
+
+    def append(self, steps):
+        self.insert(len(self.steps), steps)
+
+    def set_steps(self, steps):
+        self.beginResetModel()
+        self.steps = list(steps)
+        self._icons = {}
+        self._rows = None
+        self._checked = set()
+        self.endResetModel()
+
+    def row(self, fid):
+        """ The row of the step fid, or -1. """
+        if self._rows is None:
+            self._rows = {step.fid: n for n, step in enumerate(self.steps)}
+        return self._rows.get(fid, -1)
+
+    def files(self, rows):
+        """ The (fid, path) files for the planners of the steps at rows, None if gone. """
+        files = []
+        for n in rows:
+            step = self.steps[n]
+            path = step.path
+            if path is not None and not isinstance(path, Revision) and not os.path.exists(path):
+                path = None
+            files.append((step.fid, path))
+        return files
+
+    def check(self, rows):
+        """
+        The names of the steps at rows whose content has changed since the project was
+        saved, checking each step only the first time.
+        """
+        changed = []
+        for n in rows:
+            step = self.steps[n]
+            if step.digest is None or step.fid in self._checked:
+                continue
+            self._checked.add(step.fid)
+            try:
+                digest, size = content_digest(step.path)
+            except OSError:
+                # Gone, files() plays it as an empty file.
+                changed.append('%s (missing, played as empty)' % step.name)
+                continue
+            if (digest, size) != (step.digest, step.size):
+                changed.append(step.name)
+                # Saved as it is now next time.
+                self.steps[n] = step._replace(digest=None, size=None)
+        return changed
+
+    def set_thumbnail(self, fid, image):
+        row = self.row(fid)
+        if row == -1:
+            return
+        self._icons[fid] = QIcon(QPixmap.fromImage(image))
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
@@ -0,0 +1,82 @@
+"""
+Fonts, colours and sizes shared by the editor widget and the exporters.
+
+Style numbers follow QsciLexerPython:
+
+0 Default
+1 Comment
+2 Number
+3 Double-quoted string
+4 Single-quoted string
+5 Keyword
+6 Triple single-quoted string
+7 Triple double-quoted string
+8 Class name
+9 Function or method name
+10 Operator
+11 Identifier
+12 Comment block
+13 Unclosed string
+14 Highlighted identifier
+15 Decorator
+16 Double-quoted f-string
+17 Single-quoted f-string
+18 Triple single-quoted f-string
+19 Triple double-quoted f-string
+"""
+
+FONT_FAMILY = 'Consolas'
+FONT_SIZE = 18  # points
+
+PAPER_COLOR = '#1e1e1e'
+DEFAULT_COLOR = '#d4d4d4'
+
+MARGIN_BACKGROUND_COLOR = '#181818'
+MARGIN_FOREGROUND_COLOR = '#888888'
+CARET_LINE_BACKGROUND_COLOR = '#181818'
+CARET_FOREGROUND_COLOR = '#ffffff'
+
+# light blue c586c0
+# purple c586c0
+# custom dark blue #3D83BD
+
+STYLE_COLORS = {
+    0: '#d4d4d4',  # 0 Default
+    1: '#608b4e',  # 1 Comment
+    2: '#b5cea8',  # 2 Number
+    3: '#ce9178',  # 3 Double-quoted string
+    4: '#ce9178',  # 4 Single-quoted string
+    5: '#c586c0',  # 5 Keyword
+    6: '#ce9178',  # 6 Triple single-quoted string
+    7: '#ce9178',  # 7 Triple double-quoted string
+    8: '#4ec9b0',  # 8 Class name
+    9: '#dcdcaa',  # 9 Function or method name
+    10: '#d4d4d4',  # 10 Operator
+    11: '#9cdcfe',  # 11 Identifier
+    12: '#608b4e',  # 12 Comment block
+    13: '#ce9178',  # 13 Unclosed string
+    14: '#3D83BD',  # 14 Highlighted identifier
+    15: '#dcdcaa',  # 15 Decorator
+    16: '#ce9178',  # 16 Double-quoted f-string
+    17: '#ce9178',  # 17 Single-quoted f-string
+    18: '#ce9178',  # 18 Triple single-quoted f-string
+    19: '#ce9178',  # 19 Triple double-quoted f-string
+}
+
+# Background colors.
+STYLE_PAPERS = {
+    13: '#1e1e1e',  # 13 Unclosed string
+}
+
+KEYWORDS = (
+    "False None True and as assert break class continue def del elif else except finally for "
+    "from global if import in is lambda nonlocal not or pass raise return try while with yield"
+)
+HIGHLIGHTED_IDENTIFIERS = "self"
+
+# Fixed window sizes for the display modes, in pixels.
+DISPLAY_SIZES = {
+    'fhd': (1920, 1080),
+    'hd': (1280, 720),
+    'sd': (720, 576),
+}
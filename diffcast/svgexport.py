@@ -0,0 +1,237 @@
+"""
+Export a cast as a self-contained, looping animated SVG for embedding in READMEs.
+
+Every distinct styled line is written once into a shared table in <defs>. Each frame
+only adds elements for the screen rows that changed, so the file grows with the
+number of edits rather than with duration x resolution.
+"""
+import argparse
+import os
+from xml.sax.saxutils import escape
+
+import metrics
+from highlight import Highlighter
+from planner import INITIAL_SPEED, OP_COMPLETE, OP_OPEN, OP_STEP, apply
+from styles import (CARET_FOREGROUND_COLOR, CARET_LINE_BACKGROUND_COLOR,
+                    DEFAULT_COLOR, DISPLAY_SIZES, FONT_FAMILY, FONT_SIZE,
+                    MARGIN_BACKGROUND_COLOR, MARGIN_FOREGROUND_COLOR,
+                    PAPER_COLOR, STYLE_COLORS)
+from timeline import load_ops
+
+TAB_WIDTH = 8
+
+# Approximate metrics for a monospace font, relative to the pixel size.
+CHAR_WIDTH = 0.55
+LINE_HEIGHT = 1.2
+
+
+def _n(v):
+    """ Format a number compactly. """
+    return ('%.3f' % v).rstrip('0').rstrip('.')
+
+
+def _style_classes():
+    """ Map each style to a short CSS class, one per distinct non-default colour. """
+    classes, by_color = {}, {}
+    for style, color in STYLE_COLORS.items():
+        if color.lower() == DEFAULT_COLOR.lower():
+            continue
+        if color not in by_color:
+            by_color[color] = chr(ord('a') + len(by_color))
+        classes[style] = by_color[color]
+    return classes, by_color
+
+
+class SvgExporter:
+    def __init__(self, width, height, speed=1.0, hold=INITIAL_SPEED, font_size=FONT_SIZE):
+        self.width = width
+        self.height = height
+        self.speed = speed
+        self.hold = hold
+
+        self.font_px = font_size * 96 / 72
+        self.char_width = self.font_px * CHAR_WIDTH
+        self.line_height = round(self.font_px * LINE_HEIGHT)
+        self.rows = height // self.line_height
+        self.margin_width = round(self.char_width * 5) + 8
+        self.text_x = self.margin_width + 4
+
+        self.highlighter = Highlighter()
+        self.style_classes, self.colors = _style_classes()
+        self.frames = 0
+
+    def first_visible_line(self, lines, line):
+        # Follow CodeViewer.update_editor_caret, keeping the caret line centered.
+        first = min(line - (self.rows // 2), len(lines) - self.rows)
+        return max(first, 0)
+
+    def export(self, ops, f):
+        self.write(f, *self.render(ops))
+
+    def render(self, ops):
+        """ Play ops, returning the screen row frames, caret moves and duration. """
+        lines = []
+        rows = [None] * self.rows  # (line number, runs) on each screen row.
+        shown = [0] * self.rows  # when the row content appeared.
+        frames = []  # (row, content, start, end)
+        carets = []  # (time, row, col)
+
+        t = 0
+        for op in ops:
+            t += op.delay / self.speed
+            if op.kind in (OP_STEP, OP_COMPLETE, OP_OPEN):
+                continue
+
+            apply(lines, op)
+            line, col = op.caret
+            first = self.first_visible_line(lines, line)
+            styled = self.highlighter.highlight(lines, first + self.rows)
+
+            for row in range(self.rows):
+                n = first + row
+                content = (n + 1, styled[n]) if n < len(styled) else None
+                if content != rows[row]:
+                    if rows[row] is not None and t > shown[row]:
+                        frames.append((row, rows[row], shown[row], t))
+                    rows[row] = content
+                    shown[row] = t
+
+            self.frames += 1
+            caret = (line - first, col)
+            if not carets or carets[-1][1:] != caret:
+                if carets and carets[-1][0] == t:
+                    carets.pop()
+                carets.append((t,) + caret)
+
+        duration = t + self.hold
+        for row, content in enumerate(rows):
+            if content is not None:
+                frames.append((row, content, shown[row], duration))
+
+        return frames, carets, duration
+
+    def _line_text(self, runs):
+        parts = []
+        col = 0
+        for style, text in runs:
+            if '\t' in text:
+                text = _expand(text, col)
+            col += len(text)
+            text = escape(text)
+            cls = self.style_classes.get(style)
+            parts.append('<tspan class="%s">%s</tspan>' % (cls, text) if cls else text)
+        return ''.join(parts)
+
+    def write(self, f, frames, carets, duration):
+        lh = self.line_height
+        baseline = round(lh * 0.8)
+        dur = _n(duration)
+
+        f.write(
+            '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+            'width="%d" height="%d" viewBox="0 0 %d %d" font-family="%s, monospace" '
+            'font-size="%s" xml:space="preserve">\n'
+            % (self.width, self.height, self.width, self.height, FONT_FAMILY, _n(self.font_px))
+        )
+
+        # The style table, shared by every frame.
+        f.write(
+            '<style>text{fill:%s}.n{fill:%s;text-anchor:end}'
+            % (DEFAULT_COLOR, MARGIN_FOREGROUND_COLOR)
+        )
+        for color, cls in self.colors.items():
+            f.write('.%s{fill:%s}' % (cls, color))
+        f.write('</style>\n')
+
+        # The line table, each distinct styled line is written once.
+        line_ids = {}
+        f.write('<defs>\n')
+        for _, (_, runs), _, _ in frames:
+            if runs not in line_ids:
+                line_ids[runs] = 'l%d' % len(line_ids)
+                f.write(
+                    '<text id="%s" x="%d">%s</text>\n'
+                    % (line_ids[runs], self.text_x, self._line_text(runs))
+                )
+        f.write('</defs>\n')
+
+        # Loop clock, everything else is timed relative to it.
+        f.write(
+            '<rect width="0" height="0">'
+            '<animate id="c" attributeName="x" values="0" begin="0s;c.end" dur="%ss"/>'
+            '</rect>\n' % dur
+        )
+
+        f.write('<rect width="100%%" height="100%%" fill="%s"/>\n' % PAPER_COLOR)
+        f.write(
+            '<rect width="%d" height="100%%" fill="%s"/>\n'
+            % (self.margin_width, MARGIN_BACKGROUND_COLOR)
+        )
+
+        if carets:
+            # Discrete animations need the first key time at 0, the caret starts there.
+            key_times = ';'.join(['0'] + ['%.6f' % (t / duration) for t, _, _ in carets[1:]])
+            ys = ';'.join(str(row * lh) for _, row, _ in carets)
+            xs = ';'.join(_n(self.text_x + col * self.char_width) for _, _, col in carets)
+            animate = (
+                '<animate attributeName="%s" begin="c.begin" dur="' + dur + 's" '
+                'calcMode="discrete" keyTimes="' + key_times + '" values="%s"/>'
+            )
+            f.write(
+                '<rect x="%d" width="100%%" height="%d" fill="%s">%s</rect>\n'
+                % (self.margin_width, lh, CARET_LINE_BACKGROUND_COLOR, animate % ('y', ys))
+            )
+            f.write(
+                '<rect width="2" height="%d" fill="%s">%s%s</rect>\n'
+                % (lh, CARET_FOREGROUND_COLOR, animate % ('y', ys), animate % ('x', xs))
+            )
+
+        for row, (number, runs), start, end in frames:
+            y = row * lh + baseline
+            f.write(
+                '<g visibility="hidden">'
+                '<set attributeName="visibility" to="visible" begin="c.begin+%ss" dur="%ss"/>'
+                '<text class="n" x="%d" y="%d">%d</text><use xlink:href="#%s" y="%d"/></g>\n'
+                % (_n(start), _n(end - start), self.margin_width - 8, y, number, line_ids[runs], y)
+            )
+
+        f.write('</svg>\n')
+
+
+def _expand(text, col):
+    """ Expand tabs in text which starts at column col. """
+    return (' ' * col + text).expandtabs(TAB_WIDTH)[col:]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="diffcast-svg", description='Export a series of files as an animated SVG.'
+    )
+    parser.add_argument('output_file', help='Output SVG file.')
+    parser.add_argument(
+        'files',
+        metavar='N',
+        nargs='+',
+        help='The series of files to apply, or a single timeline file.',
+    )
+    parser.add_argument('--display', choices=DISPLAY_SIZES, default='hd', help='Output size.')
+    parser.add_argument('--speed', type=float, default=1.0, help='Playback speed multiplier.')
+    metrics.add_arguments(parser)
+
+    args = parser.parse_args()
+
+    stats = metrics.Metrics('svg', os.path.basename(args.output_file))
+    exporter = SvgExporter(*DISPLAY_SIZES[args.display], speed=args.speed)
+    with open(args.output_file, 'w') as f:
+        with stats.timer('render'):
+            rendered = exporter.render(stats.track(load_ops(args.files)))
+        with stats.timer('encode'):
+            exporter.write(f, *rendered)
+
+    stats.frames = exporter.frames
+    stats.cache('highlight', *exporter.highlighter.stats())
+    stats.write(args.metrics_prom, args.metrics_json)
+
+
+if __name__ == '__main__':
+    main()
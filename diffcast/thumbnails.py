@@ -0,0 +1,118 @@
+"""
+Thumbnails of each step in the list, as the editor shows it once the step is selected.
+
+Steps are planned and rendered in a background thread with the Qt-free raster renderer,
+using the small draft atlas, and each thumbnail is emitted as it's ready so the list
+fills in progressively. Thumbnails are cached on disk under a hash of the step's ops,
+so unchanged steps are only ever rendered once.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from PyQt6.QtCore import (QObject, QRunnable, Qt, QThreadPool, pyqtSignal,
+                          pyqtSlot)
+from PyQt6.QtGui import QImage
+
+from frames import DRAFT_SCALE, frames
+from project import planner_for
+from raster import Atlas, RasterRenderer, cache_dir
+from styles import DISPLAY_SIZES, FONT_SIZE
+
+THUMBNAIL_VERSION = 1
+
+# Rendered at the hd display size (halved by the draft atlas), then scaled to fit.
+THUMBNAIL_DISPLAY = 'hd'
+THUMBNAIL_SIZE = (96, 54)
+
+
+class ThumbnailSignals(QObject):
+    # emit the fid and thumbnail image of each step
+    ready = pyqtSignal(str, QImage)
+
+
+class Thumbnails:
+    """ Render step thumbnails on a background thread, cached in directory. """
+
+    def __init__(self, directory=None, size=THUMBNAIL_SIZE):
+        self.directory = directory or os.path.join(cache_dir(), 'thumbnails')
+        self.size = size
+        self.signals = ThumbnailSignals()
+
+        # One thread, to leave the GUI thread most of the interpreter.
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self._lock = threading.Lock()
+        self._renderer = None
+
+    def request(self, fid, step):
+        """ Render a thumbnail of step, a planner path, emitting ready with fid when done. """
+        self.pool.start(_Job(self, fid, step))
+
+    def clear(self):
+        """ Drop requests not yet started. """
+        self.pool.clear()
+
+    def renderer(self):
+        if self._renderer is None:
+            width, height = DISPLAY_SIZES[THUMBNAIL_DISPLAY]
+            atlas = Atlas.load(size=FONT_SIZE / DRAFT_SCALE, subpixels=1, antialias=False)
+            self._renderer = RasterRenderer(width // DRAFT_SCALE, height // DRAFT_SCALE, atlas)
+        return self._renderer
+
+    def thumbnail(self, step):
+        """ The thumbnail of step, from the cache or rendered. """
+        with self._lock:
+            renderer = self.renderer()
+            ops = list(planner_for([('', step)]).ops())
+            key = json.dumps(
+                [
+                    THUMBNAIL_VERSION,
+                    renderer.atlas.digest,
+                    self.size,
+                    [(op.kind, op.line, op.col, op.text) for op in ops],
+                ]
+            )
+            path = os.path.join(
+                self.directory, hashlib.sha1(key.encode()).hexdigest()[:16] + '.png'
+            )
+
+            image = QImage(path)
+            if not image.isNull():
+                return image
+
+            frame = None
+            for _, f in frames(ops, renderer):
+                if f is not None:
+                    frame = f
+
+        # The last frame is how the editor is left.
+        height, width = frame.shape
+        image = QImage(frame.tobytes(), width, height, QImage.Format.Format_RGB32).scaled(
+            *self.size,
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation,
+        )
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = '%s.%d.tmp.png' % (path[: -len('.png')], os.getpid())
+        if image.save(tmp):
+            os.replace(tmp, path)
+        return image
+
+
+class _Job(QRunnable):
+    def __init__(self, thumbnails, fid, step):
+        super().__init__()
+        self.thumbnails = thumbnails
+        self.fid = fid
+        self.step = step
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            image = self.thumbnails.thumbnail(self.step)
+        except Exception:
+            return  # Unreadable steps, e.g. binary files, just don't get one.
+        self.thumbnails.signals.ready.emit(self.fid, image)
@@ -0,0 +1,290 @@
+"""
+Compact binary on-disk timelines of planned ops, read through mmap.
+
+Layout (little endian):
+
+    header      magic, version, op count, string count, section offsets, duration
+    ops         fixed-width records: kind, line, col, string id, time (from start)
+    strings     n + 1 offsets into the UTF-8 blob which follows them
+    keyframes   op indexes, then string ids of the buffer snapshot after that op
+
+Strings are de-duplicated, so typing the same character twice costs one record.
+Opening a timeline only maps the file: ops are decoded as they are read, and seeking
+replays from the nearest keyframe rather than the start.
+"""
+import argparse
+import array
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_right
+from io import BytesIO
+
+import metrics
+from planner import (OP_COMPLETE, OP_DEDENT, OP_DELETE, OP_DELETE_LINE,
+                     OP_INDENT, OP_INSERT, OP_INSERT_LINE, OP_LOAD, OP_OPEN,
+                     OP_STEP, Op, apply, split_lines)
+from project import planner_for
+
+MAGIC = b'DCTL'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHxxQQQQQd')
+RECORD = struct.Struct('<BxxxIIId')
+OFFSET = struct.Struct('<Q')
+
+KEYFRAME_INTERVAL = 1024
+
+OP_KINDS = [
+    OP_STEP,
+    OP_LOAD,
+    OP_COMPLETE,
+    OP_INSERT_LINE,
+    OP_DELETE_LINE,
+    OP_INSERT,
+    OP_DELETE,
+    OP_INDENT,
+    OP_DEDENT,
+    OP_OPEN,
+]
+OP_CODES = {kind: code for code, kind in enumerate(OP_KINDS)}
+
+
+class TimelineError(Exception):
+    pass
+
+
+def _offsets(view):
+    """ A table of the little endian offsets in view, read in place on little endian hosts. """
+    if sys.byteorder == 'little':
+        return view.cast('Q')
+    table = array.array('Q')
+    table.frombytes(view)
+    table.byteswap()
+    return table
+
+
+def write_timeline(path, ops, keyframe_interval=KEYFRAME_INTERVAL):
+    """
+    Write ops to path, streaming the records straight to disk. A keyframe is stored
+    at every completed file and after every keyframe_interval ops.
+    """
+    strings = {}
+    blob = BytesIO()
+    offsets = [0]
+
+    def string_id(text):
+        sid = strings.get(text)
+        if sid is None:
+            sid = strings[text] = len(offsets) - 1
+            blob.write(text.encode('utf-8'))
+            offsets.append(blob.tell())
+        return sid
+
+    lines = []
+    keyframes = []
+    since_keyframe = 0
+    t = 0
+    n_ops = 0
+
+    with open(path, 'wb') as f:
+        f.write(b'\0' * HEADER.size)
+
+        for op in ops:
+            t += op.delay
+            apply(lines, op)
+            f.write(RECORD.pack(OP_CODES[op.kind], op.line, op.col, string_id(op.text), t))
+
+            since_keyframe += 1
+            if op.kind == OP_COMPLETE or since_keyframe >= keyframe_interval:
+                keyframes.append((n_ops, string_id(''.join(lines))))
+                since_keyframe = 0
+            n_ops += 1
+
+        strings_offset = f.tell()
+        for offset in offsets:
+            f.write(OFFSET.pack(offset))
+        f.write(blob.getbuffer())
+
+        keyframes_offset = f.tell()
+        for index, _ in keyframes:
+            f.write(OFFSET.pack(index))
+        for _, sid in keyframes:
+            f.write(OFFSET.pack(sid))
+
+        f.seek(0)
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                n_ops,
+                len(offsets) - 1,
+                strings_offset,
+                len(keyframes),
+                keyframes_offset,
+                t,
+            )
+        )
+
+
+def is_timeline(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class Timeline:
+    """ Random access to a timeline file. Iterating yields the planner's Op tuples. """
+
+    def __init__(self, path):
+        # The header is checked before mapping, so nothing is left open on errors.
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size or not header.startswith(MAGIC):
+                raise TimelineError(f"'{path}' is not a DiffCast timeline")
+            (
+                _,
+                version,
+                self._n_ops,
+                n_strings,
+                strings_offset,
+                n_keyframes,
+                keyframes_offset,
+                self.duration,
+            ) = HEADER.unpack(header)
+            if version != VERSION:
+                raise TimelineError(f"Unsupported timeline version {version}")
+
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = self._view = memoryview(self._mm)
+        end = strings_offset + (n_strings + 1) * OFFSET.size
+        self._string_offsets = _offsets(view[strings_offset:end])
+        self._blob_offset = end
+
+        middle = keyframes_offset + n_keyframes * OFFSET.size
+        self._keyframe_ops = _offsets(view[keyframes_offset:middle])
+        self._keyframe_strings = _offsets(view[middle : middle + n_keyframes * OFFSET.size])
+
+    def close(self):
+        for table in (self._string_offsets, self._keyframe_ops, self._keyframe_strings):
+            if isinstance(table, memoryview):
+                table.release()
+        self._view.release()
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._n_ops
+
+    def text(self, sid):
+        start = self._blob_offset + self._string_offsets[sid]
+        end = self._blob_offset + self._string_offsets[sid + 1]
+        return self._mm[start:end].decode('utf-8')
+
+    def time(self, index):
+        """ Seconds from the start at which op index is shown. """
+        return RECORD.unpack_from(self._mm, HEADER.size + index * RECORD.size)[4]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._n_ops
+        if not 0 <= index < self._n_ops:
+            raise IndexError(index)
+
+        code, line, col, sid, t = RECORD.unpack_from(self._mm, HEADER.size + index * RECORD.size)
+        previous = self.time(index - 1) if index else 0
+        return Op(OP_KINDS[code], line, col, self.text(sid), t - previous)
+
+    def __iter__(self):
+        previous = 0
+        for offset in range(HEADER.size, HEADER.size + self._n_ops * RECORD.size, RECORD.size):
+            code, line, col, sid, t = RECORD.unpack_from(self._mm, offset)
+            yield Op(OP_KINDS[code], line, col, self.text(sid), t - previous)
+            previous = t
+
+    def index_at(self, seconds):
+        """ The last op shown at or before seconds into the timeline, or -1. """
+        lo, hi = 0, self._n_ops
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.time(mid) <= seconds:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def lines_at(self, index):
+        """ The buffer once op index has been applied, replayed from the nearest keyframe. """
+        k = bisect_right(self._keyframe_ops, index) - 1
+        if k < 0:
+            lines, start = [], 0
+        else:
+            lines = split_lines(self.text(self._keyframe_strings[k]))
+            start = self._keyframe_ops[k] + 1
+
+        for n in range(start, index + 1):
+            apply(lines, self[n])
+        return lines
+
+    def ops(self, start=0):
+        """ Generate the ops from index start on, beginning with a load of the buffer there. """
+        if start == 0:
+            yield from self
+            return
+
+        yield Op(OP_LOAD, 0, 0, ''.join(self.lines_at(start - 1)), 0)
+        for n in range(start, self._n_ops):
+            yield self[n]
+
+
+def _timeline_ops(path):
+    with Timeline(path) as timeline:
+        yield from timeline.ops()
+
+
+def load_ops(paths):
+    """ Ops for a single timeline file, or planned from a series of files or directories. """
+    if len(paths) == 1 and is_timeline(paths[0]):
+        return _timeline_ops(paths[0])
+    return planner_for([(path, path) for path in paths]).ops()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="diffcast-timeline", description='Plan a series of files into a timeline file.'
+    )
+    parser.add_argument('output_file', help='Output timeline file.')
+    parser.add_argument(
+        'files',
+        metavar='N',
+        nargs='+',
+        help='The series of files, or project directories, to apply. The first is the start.',
+    )
+    parser.add_argument(
+        '--keyframe-interval',
+        type=int,
+        default=KEYFRAME_INTERVAL,
+        help='Maximum number of ops between buffer snapshots.',
+    )
+    metrics.add_arguments(parser)
+
+    args = parser.parse_args()
+
+    stats = metrics.Metrics('timeline', os.path.basename(args.output_file))
+    planner = planner_for([(path, path) for path in args.files])
+    with stats.timer('encode'):
+        write_timeline(args.output_file, stats.track(planner.ops()), args.keyframe_interval)
+    stats.write(args.metrics_prom, args.metrics_json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Check that casts end on their targets, for running over tutorial repositories in CI.
+
+Every transition is planned and replayed with no pauses or GUI, across a process
+pool, and the replayed buffer compared byte-for-byte with the target. Each cast is a
+glob of its step files or a directory of them, in sorted order; steps may also be
+project snapshot directories, when each changed file is checked.
+
+    python verify.py 'demos/demo*.py' 'demos/windows_*.py' tutorials/*/
+
+Exits with status 1 if any transition fails, reporting the first op to go wrong.
+"""
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from planner import DiffPlanner, apply, load_file_or_empty
+from project import snapshot
+
+
+def cast_steps(spec):
+    """ The sorted steps of a cast, given as a glob or a directory. """
+    if os.path.isdir(spec) and not glob.has_magic(spec):
+        return sorted(os.path.join(spec, name) for name in os.listdir(spec))
+    return sorted(glob.glob(spec))
+
+
+def read_exact(path):
+    # No newline translation, so line ending differences are caught.
+    with open(path, 'r', newline='') as f:
+        return f.read()
+
+
+def transitions(spec):
+    """ Generate (label, current lines, target text) for each transition in a cast. """
+    steps = cast_steps(spec)
+    for source, target in zip(steps, steps[1:]):
+        label = '%s -> %s' % (source, target)
+        if os.path.isdir(source) and os.path.isdir(target):
+            before, after = snapshot(source), snapshot(target)
+            for name in sorted(before.keys() | after.keys()):
+                if before.get(name) != after.get(name):
+                    exact = read_exact(os.path.join(target, name)) if name in after else ''
+                    yield '%s: %s' % (label, name), before.get(name, []), exact
+        else:
+            yield label, load_file_or_empty(source), read_exact(target)
+
+
+def load_lines(text):
+    """ Lines as the planner reads them from a file, with universal newlines. """
+    return io.StringIO(text, newline=None).readlines()
+
+
+def describe(n, op):
+    return 'op %d (%s line %d col %d %r)' % (n, op.kind, op.line, op.col, op.text[:40])
+
+
+def verify(label, current, target):
+    """ Replay one transition, returning None if it ends on target, else the failure. """
+    planner = DiffPlanner([])
+    planner.current = list(current)
+    replayed = list(current)
+    touched = {}  # line to the last op editing it
+
+    try:
+        for n, op in enumerate(planner.transition(load_lines(target))):
+            apply(replayed, op)
+            touched[op.line] = (n, op)
+            if replayed != planner.current:
+                return '%s: %s left the buffer out of step with the planner' % (
+                    label,
+                    describe(n, op),
+                )
+    except Exception:
+        return '%s: planning failed\n%s' % (label, traceback.format_exc().rstrip())
+
+    text = ''.join(replayed)
+    if text == target:
+        return None
+
+    # Find the first line to differ, and the last op to edit it.
+    expected = io.StringIO(target, newline='').readlines()
+    line = next(
+        (n for n, (got, want) in enumerate(zip(replayed, expected)) if got != want),
+        min(len(replayed), len(expected)),
+    )
+
+    message = '%s: line %d is %r, expected %r' % (
+        label,
+        line + 1,
+        replayed[line] if line < len(replayed) else '<end>',
+        expected[line] if line < len(expected) else '<end>',
+    )
+    if line in touched:
+        message += ', last edited by %s' % describe(*touched[line])
+    return message
+
+
+def _verify(job):
+    return verify(*job)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="diffcast-verify", description='Check every cast transition ends on its target.'
+    )
+    parser.add_argument('casts', nargs='+', help='Globs or directories of cast steps.')
+    parser.add_argument('--processes', type=int, help='Worker processes, default one per CPU.')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    jobs = [job for spec in args.casts for job in transitions(spec)]
+    if not jobs:
+        parser.error('No transitions found')
+
+    with ProcessPoolExecutor(args.processes) as pool:
+        failures = [f for f in pool.map(_verify, jobs, chunksize=8) if f is not None]
+
+    for failure in failures:
+        print('FAIL ' + failure)
+    print(
+        '%d transitions, %d failed in %.2fs'
+        % (len(jobs), len(failures), time.perf_counter() - start)
+    )
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
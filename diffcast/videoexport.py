@@ -0,0 +1,244 @@
+"""
+Export a cast as a variable frame rate video, with ffmpeg.
+
+A frame is only rendered and encoded when the view changes, and each is timestamped to
+be held until the next, so the pauses between edits cost nothing however long they are.
+The frames are written as PNGs with an ffconcat list giving each one's duration, which
+ffmpeg then encodes keeping those timestamps.
+
+    python videoexport.py cast.mp4 demos/demo1.py demos/demo2.py
+
+Give an output ending .ffconcat to keep the frames and list, to encode later.
+"""
+import argparse
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import zlib
+
+import numpy as np
+
+import framering
+import metrics
+from animexport import PNG_SIGNATURE, png_chunk
+from fanout import fan_out, outputs
+from frames import (DRAFT_MIN_DELAY, add_renderer_arguments, create_renderer,
+                    frames, held)
+from planner import INITIAL_SPEED
+from styles import DISPLAY_SIZES
+from timeline import load_ops
+
+# Quick to compress, editor frames are mostly flat colour anyway.
+PNG_COMPRESSION = 1
+
+
+def png(frame):
+    """ Encode a frame as an RGB PNG. """
+    height, width = frame.shape
+    # 0xffRRGGBB pixels are BGRA in (little endian) memory.
+    rgb = frame.view(np.uint8).reshape(height, width, 4)[..., 2::-1]
+    # Each row starts with its filter type, none.
+    rows = np.zeros((height, width * 3 + 1), np.uint8)
+    rows[:, 1:] = rgb.reshape(height, width * 3)
+    return b''.join(
+        [
+            PNG_SIGNATURE,
+            png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+            png_chunk(b'IDAT', zlib.compress(rows.tobytes(), PNG_COMPRESSION)),
+            png_chunk(b'IEND', b''),
+        ]
+    )
+
+
+class FrameSequence:
+    """ Write frames as PNGs into directory, and an ffconcat list timing them to path. """
+
+    def __init__(self, path, directory):
+        self.path = path
+        self.directory = directory
+        self.entries = []  # (file relative to the list, duration)
+
+    def frame(self, frame, duration):
+        path = os.path.join(self.directory, '%06d.png' % len(self.entries))
+        with open(path, 'wb') as f:
+            f.write(png(frame))
+        self.entries.append((os.path.relpath(path, os.path.dirname(self.path)), duration))
+
+    def close(self):
+        with open(self.path, 'w') as f:
+            f.write('ffconcat version 1.0\n')
+            for path, duration in self.entries:
+                f.write("file '%s'\nduration %.6f\n" % (path.replace("'", "'\\''"), duration))
+            # The concat demuxer ignores the last duration unless the file is repeated.
+            if self.entries:
+                f.write("file '%s'\n" % self.entries[-1][0].replace("'", "'\\''"))
+
+
+def encode(concat, output, ffmpeg='ffmpeg', draft=False):
+    """ Encode an ffconcat list to output, keeping its timestamps, quickly for a draft. """
+    preset = ['-preset', 'ultrafast'] if draft else []
+    subprocess.run(
+        [
+            ffmpeg,
+            '-y',
+            '-loglevel',
+            'error',
+            '-f',
+            'concat',
+            '-safe',
+            '0',
+            '-i',
+            concat,
+            '-fps_mode',
+            'vfr',
+            '-pix_fmt',
+            'yuv420p',
+            *preset,
+            output,
+        ],
+        check=True,
+    )
+
+
+class VideoExporter:
+    def __init__(self, renderer, speed=1.0, hold=INITIAL_SPEED, stats=None, min_delay=0):
+        self.renderer = renderer
+        self.speed = speed
+        self.hold = hold
+        self.min_delay = min_delay
+        self.stats = stats or metrics.Metrics('video')
+
+        self.written = 0
+        self.duration = 0
+
+    def timed(self, ops, buffer=None, discard=None):
+        """ The (start, duration, frame) to write for ops, timing the rendering. """
+        timed = held(
+            frames(ops, self.renderer, self.speed, buffer), self.hold, self.min_delay, discard
+        )
+        while True:
+            with self.stats.timer('render'):
+                item = next(timed, None)
+            if item is None:
+                break
+            yield item
+
+    def export(self, ops, writer):
+        self.encode(self.timed(ops), writer)
+
+    def export_shared(self, ops, writer):
+        """
+        As export, but writing from an encoder process fed frames through shared memory,
+        so rendering and encoding overlap.
+        """
+        shape = self.renderer.height, self.renderer.width
+        with framering.EncoderProcess(shape, _encode_shared, (writer,)) as ring:
+            for start, duration, frame in self.timed(ops, ring.buffer, ring.discard):
+                ring.put(frame, (start, duration))
+            self.written, self.duration, timers = ring.finish()
+        self.stats.add_timers(timers)
+
+    def encode(self, timed, writer):
+        """ Write timed (start, duration, frame) with writer. """
+        for _, duration, frame in timed:
+            with self.stats.timer('encode'):
+                writer.frame(frame, duration)
+            self.written += 1
+            self.duration += duration
+        writer.close()
+
+
+def _encode_shared(ring, writer):
+    exporter = VideoExporter(None)
+    timed = ((start, duration, frame) for (start, duration), frame in ring.frames())
+    exporter.encode(timed, writer)
+    ring.done((exporter.written, exporter.duration, exporter.stats.timers))
+
+
+def export(ops, output, display, args):
+    """ Export ops to output at display, returning the run's Metrics and a summary line. """
+    stats = metrics.Metrics('video', os.path.basename(output))
+    renderer = create_renderer(*DISPLAY_SIZES[display], args.raster, args.draft)
+    min_delay = DRAFT_MIN_DELAY if args.draft else 0
+    exporter = VideoExporter(renderer, args.speed, stats=stats, min_delay=min_delay)
+
+    keep_frames = output.endswith('.ffconcat')
+    with tempfile.TemporaryDirectory(prefix='diffcast-') as tmp:
+        if keep_frames:
+            concat = output
+            directory = os.path.splitext(concat)[0] + '_frames'
+            os.makedirs(directory, exist_ok=True)
+        else:
+            concat, directory = os.path.join(tmp, 'frames.ffconcat'), tmp
+
+        if args.encoder_process:
+            exporter.export_shared(ops, FrameSequence(concat, directory))
+        else:
+            exporter.export(ops, FrameSequence(concat, directory))
+
+        if not keep_frames:
+            with stats.timer('ffmpeg'):
+                encode(concat, output, args.ffmpeg, args.draft)
+
+    stats.frames = renderer.rendered
+    return stats, (
+        f"Wrote {exporter.written} frames over {exporter.duration:.1f}s to {output}, "
+        f"{exporter.duration * 60 / (exporter.written or 1):.0f}x fewer than at 60fps"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="diffcast-video", description='Export a series of files as a video.'
+    )
+    parser.add_argument('output_file', help='Output video, e.g. .mp4, or .ffconcat for frames.')
+    parser.add_argument(
+        'files',
+        metavar='N',
+        nargs='+',
+        help='The series of files to apply, or a single timeline file.',
+    )
+    parser.add_argument(
+        '--display',
+        choices=DISPLAY_SIZES,
+        nargs='+',
+        default=['fhd'],
+        help='Output sizes, several are exported in one pass to output_<size>.',
+    )
+    parser.add_argument('--speed', type=float, default=1.0, help='Playback speed multiplier.')
+    parser.add_argument('--ffmpeg', default='ffmpeg', help='The ffmpeg executable to encode with.')
+    add_renderer_arguments(parser)
+    framering.add_arguments(parser)
+    metrics.add_arguments(parser)
+
+    args = parser.parse_args()
+
+    if not args.output_file.endswith('.ffconcat'):
+        ffmpeg = shutil.which(args.ffmpeg)
+        if ffmpeg is None:
+            parser.error(f"Can't find {args.ffmpeg}, give a .ffconcat output to encode later")
+        args.ffmpeg = ffmpeg
+
+    stats = metrics.Metrics('video', os.path.basename(args.output_file))
+    ops = stats.track(load_ops(args.files))
+    jobs = [
+        (export, (path, display, args))
+        for display, path in outputs(args.output_file, args.display)
+    ]
+    if len(jobs) == 1:
+        target, job_args = jobs[0]
+        results = [target(ops, *job_args)]
+    else:
+        results = fan_out(ops, jobs)
+
+    for run, summary in results:
+        stats.frames += run.frames
+        stats.add_timers(run.timers)
+        print(summary)
+    stats.write(args.metrics_prom, args.metrics_json)
+
+
+if __name__ == '__main__':
+    main()
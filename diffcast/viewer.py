@@ -1,10 +1,17 @@
 import os
 
 from PyQt6.Qsci import QsciLexerPython, QsciScintilla
-from PyQt6.QtCore import QDir, QPoint, QSettings, QSize, Qt
+from PyQt6.QtCore import QDir, QEvent, QPoint, QSettings, QSize, Qt
 from PyQt6.QtGui import QColor, QFileSystemModel, QFont, QFontMetrics
 from PyQt6.QtWidgets import QHBoxLayout, QListView, QWidget
 
+import profiler
+from styles import (CARET_FOREGROUND_COLOR, CARET_LINE_BACKGROUND_COLOR,
+                    DEFAULT_COLOR, DISPLAY_SIZES, FONT_FAMILY, FONT_SIZE,
+                    HIGHLIGHTED_IDENTIFIERS, KEYWORDS, MARGIN_BACKGROUND_COLOR,
+                    MARGIN_FOREGROUND_COLOR, PAPER_COLOR, STYLE_COLORS,
+                    STYLE_PAPERS)
+
 DISPLAY_MODES = {
     'custom': 'Custom Display',
     'fhd': 'Full HD (1920 x 1080)',
@@ -13,7 +20,9 @@ DISPLAY_MODES = {
     'frameless': 'Frameless',
 }
 
-settings = QSettings("Martin Fitzpatrick", "DiffCast")
+
+def settings():
+    return QSettings("Martin Fitzpatrick", "DiffCast")
 
 
 class Editor(QsciScintilla):
@@ -25,9 +34,9 @@ class Editor(QsciScintilla):
 
         # Set the default font
         font = QFont()
-        font.setFamily('Consolas')
+        font.setFamily(FONT_FAMILY)
         font.setFixedPitch(True)
-        font.setPointSize(18)
+        font.setPointSize(FONT_SIZE)
 
         self.setFont(font)
         self.setMarginsFont(font)
@@ -37,71 +46,27 @@ class Editor(QsciScintilla):
         self.setMarginsFont(font)
         self.setMarginWidth(0, fontmetrics.horizontalAdvance("00000") + 8)
         self.setMarginLineNumbers(0, True)
-        self.setMarginsBackgroundColor(QColor("#181818"))
-        self.setMarginsForegroundColor(QColor('#888888'))
+        self.setMarginsBackgroundColor(QColor(MARGIN_BACKGROUND_COLOR))
+        self.setMarginsForegroundColor(QColor(MARGIN_FOREGROUND_COLOR))
 
         # Highlight current line.
         self.setCaretLineVisible(True)
-        self.setCaretLineBackgroundColor(QColor("#181818"))
-        self.setCaretForegroundColor(QColor("#ffffff"))
+        self.setCaretLineBackgroundColor(QColor(CARET_LINE_BACKGROUND_COLOR))
+        self.setCaretForegroundColor(QColor(CARET_FOREGROUND_COLOR))
 
-        # Use Python lexer.
+        # Use Python lexer, styles are numbered as described in styles.py
         lexer = QsciLexerPython()
         lexer.setDefaultFont(font)
-        lexer.setDefaultPaper(QColor('#1e1e1e'))
-        lexer.setDefaultColor(QColor('#d4d4d4'))
+        lexer.setDefaultPaper(QColor(PAPER_COLOR))
+        lexer.setDefaultColor(QColor(DEFAULT_COLOR))
         lexer.setHighlightSubidentifiers(False)
 
-        """
-        0 Default
-        1 Comment
-        2 Number
-        3 Double-quoted string
-        4 Single-quoted string
-        5 Keyword
-        6 Triple single-quoted string
-        7 Triple double-quoted string
-        8 Class name
-        9 Function or method name
-        10 Operator
-        11 Identifier
-        12 Comment block
-        13 Unclosed string
-        14 Highlighted identifier
-        15 Decorator
-        16 Double-quoted f-string
-        17 Single-quoted f-string
-        18 Triple single-quoted f-string
-        19 Triple double-quoted f-string
-        """
-
-        # light blue c586c0
-        # purple c586c0
-        # custom dark blue #3D83BD
-
-        lexer.setColor(QColor('#d4d4d4'), 0)  # 0 Default
-        lexer.setColor(QColor('#608b4e'), 1)  # 1 Comment
-        lexer.setColor(QColor('#b5cea8'), 2)  # 2 Number
-        lexer.setColor(QColor('#ce9178'), 3)  # 3 Double-quoted string
-        lexer.setColor(QColor('#ce9178'), 4)  # 4 Single-quoted string
-        lexer.setColor(QColor('#c586c0'), 5)  # 5 Keyword
-        lexer.setColor(QColor('#ce9178'), 6)  # 6 Triple single-quoted string
-        lexer.setColor(QColor('#ce9178'), 7)  # 7 Triple double-quoted string
-        lexer.setColor(QColor('#4ec9b0'), 8)  # 8 Class name
-        lexer.setColor(QColor('#dcdcaa'), 9)  # 9 Function or method name
-        lexer.setColor(QColor('#d4d4d4'), 10)  # 10 Operator
-        lexer.setColor(QColor('#9cdcfe'), 11)  # 11 Identifier
-        lexer.setColor(QColor('#608b4e'), 12)  # 12 Comment block
-        lexer.setColor(QColor('#ce9178'), 13)  # 13 Unclosed string
-        lexer.setColor(QColor('#3D83BD'), 14)  # 1 Highlighted identifier
-        lexer.setColor(QColor('#dcdcaa'), 15)  # 15 Decorator
-        lexer.setColor(QColor('#ce9178'), 16)  # 16 Double-quoted f-string
-        lexer.setColor(QColor('#ce9178'), 17)  # 17 Single-quoted f-string
-        lexer.setColor(QColor('#ce9178'), 18)  # 18 Triple single-quoted f-string
-        lexer.setColor(QColor('#ce9178'), 19)  # 19 Triple double-quoted f-string
+        for style, color in STYLE_COLORS.items():
+            lexer.setColor(QColor(color), style)
 
         # Background colors.
-        lexer.setPaper(QColor('#1e1e1e'), 13)  # 13 Unclosed string
+        for style, color in STYLE_PAPERS.items():
+            lexer.setPaper(QColor(color), style)
 
         lexer.setFont(font)
 
@@ -112,12 +77,8 @@ class Editor(QsciScintilla):
         self.SendScintilla(QsciScintilla.SCI_SETHSCROLLBAR, 0)
 
         # Tweak lexer.
-        self.SendScintilla(
-            QsciScintilla.SCI_SETKEYWORDS,
-            0,
-            b"False None True and as assert break class continue def del elif else except finally for from global if import in is lambda nonlocal not or pass raise return try while with yield",
-        )
-        self.SendScintilla(QsciScintilla.SCI_SETKEYWORDS, 1, b"self")
+        self.SendScintilla(QsciScintilla.SCI_SETKEYWORDS, 0, KEYWORDS.encode())
+        self.SendScintilla(QsciScintilla.SCI_SETKEYWORDS, 1, HIGHLIGHTED_IDENTIFIERS.encode())
 
     def keyPressEvent(self, e):
         e.accept()
@@ -125,6 +86,14 @@ class Editor(QsciScintilla):
     def keyReleaseEvent(self, e):
         e.accept()
 
+    def viewportEvent(self, e):
+        if profiler.PROFILE and e.type() == QEvent.Type.Paint:
+            # Scintilla styles lazily, so this covers restyling as well as drawing.
+            profiler.frame()
+            with profiler.timed('paint'):
+                return super().viewportEvent(e)
+        return super().viewportEvent(e)
+
 
 class NoMouseListView(QListView):
     def mousePressEvent(self, e):
@@ -141,15 +110,14 @@ class CodeViewer(QWidget):
     def __init__(self):
         super().__init__()
 
-        self.fs = QFileSystemModel()
+        # The file model scans its folder, so is only created once the list is shown.
+        self.fs = None
+        self.active_file = None
         self.files = NoMouseListView()
         font = self.files.font()
         font.setPointSize(14)
         self.files.setFont(font)
         self.files.setMaximumWidth(250)
-        self.files.setModel(self.fs)
-        self.fs.setRootPath(QDir.currentPath())
-        self.files.setRootIndex(self.fs.index(QDir.currentPath()))
 
         # Hide file browser by default.
         self.files.setVisible(False)
@@ -170,19 +138,38 @@ class CodeViewer(QWidget):
         self.update_lines_on_screen()
         super().resizeEvent(e)
 
+    def show_files(self, visible):
+        if visible and self.fs is None:
+            self.fs = QFileSystemModel()
+            self.files.setModel(self.fs)
+            self.fs.setRootPath(QDir.currentPath())
+            self.files.setRootIndex(self.fs.index(QDir.currentPath()))
+            self.select_active_file()
+
+        self.files.setVisible(visible)
+
     def set_active_file(self, fn):
         """ Active file will be overwritten by differ at end of each file complete. """
-        filename = os.path.basename(fn)
-        folder = os.path.dirname(fn)
+        self.active_file = fn
+        self.setWindowTitle(os.path.basename(fn))
+        self.select_active_file()
+
+    def select_active_file(self):
+        if self.fs is None:
+            return
 
         # Enter folder.
-        idx = self.fs.index(folder)
+        idx = self.fs.index(os.path.dirname(self.active_file))
         self.files.setRootIndex(idx)
 
-        idx = self.fs.index(fn)
+        idx = self.fs.index(self.active_file)
         self.files.setCurrentIndex(idx)
 
-        self.setWindowTitle(filename)
+    def differ_open(self, fn):
+        """ Follow the file being edited in a project cast. """
+        if self.fs is not None:
+            self.fs.setRootPath(os.path.dirname(fn))
+        self.set_active_file(fn)
 
     def update_lines_on_screen(self):
         self.lines_on_screen = self.editor.SendScintilla(QsciScintilla.SCI_LINESONSCREEN)
@@ -198,11 +185,18 @@ class CodeViewer(QWidget):
         # self.editor.SendScintilla(QsciScintilla.SCI_GOTOLINE, line)
 
     def differ_edit(self, line, col, source):
+        if profiler.PROFILE:
+            profiler.received('updated')
+            with profiler.timed('differ_edit'):
+                self.editor.setText(''.join(source))
+                self.update_editor_caret(line, col)
+            return
+
         self.editor.setText(''.join(source))
         self.update_editor_caret(line, col)
 
     def closeEvent(self, e):
-        settings.setValue("Geometry/CodeViewer", self.saveGeometry())
+        settings().setValue("Geometry/CodeViewer", self.saveGeometry())
         super().closeEvent(e)
 
     def set_display_mode(self, display):
@@ -226,20 +220,20 @@ class CodeViewer(QWidget):
         )
         self.setMinimumSize(QSize(0, 0))
         self.setMaximumSize(QSize(16777215, 16777215))
-        geometry = settings.value("Geometry/CodeViewer")
+        geometry = settings().value("Geometry/CodeViewer")
         if geometry:
             self.restoreGeometry(geometry)
 
     def _display_fhd(self):
-        self.setFixedSize(1920, 1080)
+        self.setFixedSize(*DISPLAY_SIZES['fhd'])
         self._display_frameless()
 
     def _display_hd(self):
-        self.setFixedSize(1280, 720)
+        self.setFixedSize(*DISPLAY_SIZES['hd'])
         self._display_frameless()
 
     def _display_sd(self):
-        self.setFixedSize(720, 576)
+        self.setFixedSize(*DISPLAY_SIZES['sd'])
         self._display_frameless()
 
     def _display_frameless(self):
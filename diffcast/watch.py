@@ -0,0 +1,209 @@
+"""
+Watch a directory and extend a live cast with a new step every time a file is saved.
+
+Each save is snapshotted, so the steps can be replayed later, and only the transition
+from that file's previous version is planned. Uses inotify on Linux and falls back to
+polling modification times elsewhere.
+
+    python watch.py tutorial/ --realtime | ...
+"""
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import tempfile
+import threading
+from collections import namedtuple
+
+from events import events, write_ndjson
+from planner import OP_COMPLETE, OP_LOAD, OP_OPEN, OP_STEP, DiffPlanner, load_file_or_empty
+
+POLL_INTERVAL = 0.5
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_EVENT = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+# A save: the snapshot of the file's previous version (None if new) and the new one.
+Step = namedtuple('Step', ['fid', 'name', 'previous', 'snapshot'])
+
+
+def ignored(name):
+    """ Hidden, backup and editor swap files. """
+    return name.startswith('.') or name.endswith(('~', '.swp', '.swx', '.tmp'))
+
+
+def _inotify(directory):
+    """ An inotify fd watching directory for saves, or None if unavailable. """
+    if not sys.platform.startswith('linux'):
+        return None
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _inotify_changes(fd, stop):
+    try:
+        while not stop.is_set():
+            # Wake up regularly to check for stop.
+            if not select.select([fd], [], [], POLL_INTERVAL)[0]:
+                continue
+            data = os.read(fd, 64 * 1024)
+            pos = 0
+            while pos < len(data):
+                _, _, _, length = IN_EVENT.unpack_from(data, pos)
+                pos += IN_EVENT.size
+                name = data[pos : pos + length].rstrip(b'\0')
+                pos += length
+                yield os.fsdecode(name)
+    finally:
+        os.close(fd)
+
+
+def _mtimes(directory):
+    return {
+        entry.name: (entry.stat().st_mtime_ns, entry.stat().st_size)
+        for entry in os.scandir(directory)
+        if entry.is_file()
+    }
+
+
+def _poll_changes(directory, stop, interval):
+    reported = previous = _mtimes(directory)
+    while not stop.wait(interval):
+        current = _mtimes(directory)
+        for name, stat in sorted(current.items()):
+            # Wait for a file to settle for an interval, so we don't catch it half-written.
+            if stat == previous.get(name) and stat != reported.get(name):
+                reported[name] = stat
+                yield name
+        previous = current
+
+
+def changes(directory, stop, poll=False, interval=POLL_INTERVAL):
+    """ Generate the names of files saved in directory, until stop is set. """
+    fd = None if poll else _inotify(directory)
+    if fd is None:
+        source = _poll_changes(directory, stop, interval)
+    else:
+        source = _inotify_changes(fd, stop)
+
+    for name in source:
+        if not ignored(name):
+            yield name
+
+
+class LiveCast:
+    """
+    The steps saved so far. Files are snapshotted into snapshots as they are first
+    seen and on every save that changes them.
+    """
+
+    def __init__(self, directory, snapshots):
+        self.directory = directory
+        self.snapshots = snapshots
+        self.steps = []
+        self.saved = 0  # snapshots written
+        self.latest = {}  # name to snapshot path
+        self.contents = {}  # name to lines
+
+        self.planner = DiffPlanner([])
+        self.opened = None
+
+        # Existing files are the starting point for their first save.
+        for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+            if entry.is_file() and not ignored(entry.name):
+                try:
+                    self.contents[entry.name] = load_file_or_empty(entry.path)
+                except (OSError, UnicodeDecodeError):
+                    continue  # Deleted since, or binary.
+
+    def _snapshot(self, name, lines):
+        path = os.path.join(self.snapshots, '%04d-%s' % (self.saved, name))
+        with open(path, 'w') as f:
+            f.writelines(lines)
+        self.saved += 1
+        return path
+
+    def add(self, name):
+        """ Record a save of name as a step, or return None if the contents didn't change. """
+        try:
+            lines = load_file_or_empty(os.path.join(self.directory, name))
+        except (OSError, UnicodeDecodeError):
+            return None  # Deleted again, or binary.
+
+        if lines == self.contents.get(name):
+            return None
+
+        previous = self.latest.get(name)
+        if previous is None and name in self.contents:
+            previous = self._snapshot(name, self.contents[name])
+
+        snapshot = self._snapshot(name, lines)
+        step = Step(os.path.basename(snapshot), name, previous, snapshot)
+        self.steps.append(step)
+        self.latest[name] = step.snapshot
+        self.contents[name] = lines
+        return step
+
+    def ops(self, step):
+        """ The ops for the transition into step, planned from the file's previous version. """
+        planner = self.planner
+        planner._delay = 0  # Don't hold over the pause from the last save.
+        yield planner._op(OP_STEP, text=step.fid)
+
+        if self.opened != step.name:
+            # Switching files, show the version we're editing from.
+            self.opened = step.name
+            yield planner._op(OP_OPEN, text=step.name)
+            planner.current = load_file_or_empty(step.previous)
+            yield planner._op(OP_LOAD, text=''.join(planner.current))
+
+        yield from planner.transition(load_file_or_empty(step.snapshot))
+        yield planner._op(OP_COMPLETE, text=step.fid)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="diffcast-watch",
+        description='Watch a directory, streaming a new step as NDJSON each time a file is saved.',
+    )
+    parser.add_argument('directory', help='Directory to watch.')
+    parser.add_argument('--snapshots', help='Directory to keep the saved versions in.')
+    parser.add_argument(
+        '--realtime',
+        action='store_true',
+        help='Pace the events in real time, rather than writing them immediately.',
+    )
+    parser.add_argument('--poll', action='store_true', help="Poll, even if inotify is available.")
+    parser.add_argument(
+        '--interval', type=float, default=POLL_INTERVAL, help='Seconds between polls.'
+    )
+
+    args = parser.parse_args()
+
+    snapshots = args.snapshots or tempfile.mkdtemp(prefix='diffcast-')
+    os.makedirs(snapshots, exist_ok=True)
+    cast = LiveCast(args.directory, snapshots)
+    print(f"Watching {args.directory}, snapshots in {snapshots}", file=sys.stderr)
+
+    stop = threading.Event()
+    try:
+        for name in changes(args.directory, stop, args.poll, args.interval):
+            step = cast.add(name)
+            if step is not None:
+                write_ndjson(sys.stdout, events(cast.ops(step), args.realtime), flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Write output files from a background thread, so callers never block on disk.
+
+Each write replaces the file atomically (temp file then rename), so anything running
+the output file sees either the old or the new version, never a partial one. Writes
+to a path that is already waiting are coalesced: only the newest contents are written.
+"""
+import os
+import stat
+import sys
+import tempfile
+import threading
+
+
+def _default_mode():
+    # Only readable by setting it, so done once at import rather than per write.
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+DEFAULT_MODE = _default_mode()
+
+
+class AtomicWriter(threading.Thread):
+    """
+    Background writer. With fsync, each batch of files is flushed to disk before being
+    renamed into place, and their directories synced once per batch.
+    """
+
+    def __init__(self, fsync=False, on_error=None):
+        """ on_error(path, exception) is called from the writer thread. """
+        super().__init__(name='AtomicWriter', daemon=True)
+        self.fsync = fsync
+        self.on_error = on_error
+
+        self._pending = {}  # path to newest text, in first-queued order
+        self._busy = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self.written = 0
+        self.coalesced = 0
+
+    def write(self, path, text):
+        """ Queue text to be written to path, replacing any write still waiting. """
+        with self._condition:
+            if self._closed:
+                raise ValueError('Writer is closed')
+            if path in self._pending:
+                self.coalesced += 1
+            self._pending[path] = text
+            self._condition.notify_all()
+
+    def flush(self):
+        """ Block until everything queued so far has been written. """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending and not self._busy)
+
+    def close(self):
+        """ Write anything outstanding and stop the thread. """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return  # closed
+                batch, self._pending = self._pending, {}
+                self._busy = True
+
+            try:
+                self._write_batch(batch)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _write_batch(self, batch):
+        replaced = []
+        for path, text in batch.items():
+            try:
+                tmp = self._write_temp(path, text)
+            except OSError as e:
+                self._error(path, e)
+                continue
+            replaced.append((tmp, path))
+
+        directories = set()
+        for tmp, path in replaced:
+            try:
+                os.replace(tmp, path)
+            except OSError as e:
+                os.unlink(tmp)
+                self._error(path, e)
+                continue
+            directories.add(os.path.dirname(os.path.abspath(path)))
+            self.written += 1
+
+        if self.fsync and hasattr(os, 'O_DIRECTORY'):
+            # Make the renames themselves durable, once per directory for the batch.
+            for directory in directories:
+                fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+    def _write_temp(self, path, text):
+        directory, name = os.path.split(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(prefix='.%s.' % name, suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            # Keep the permissions of the file being replaced, mkstemp makes it private.
+            try:
+                mode = stat.S_IMODE(os.stat(path).st_mode)
+            except FileNotFoundError:
+                mode = DEFAULT_MODE
+            os.chmod(tmp, mode)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return tmp
+
+    def _error(self, path, error):
+        if self.on_error is None:
+            print(f"Couldn't write {path}: {error}", file=sys.stderr)
+        else:
+            self.on_error(path, error)